@@ -0,0 +1,264 @@
+"""Backtest offline: phát lại klines lịch sử qua đúng pipeline quyết định của bot.
+
+calculate_indicators -> format_for_gemini -> analyze -> parse_signal -> validate_sl_tp
+-> resolve_trade_params -> size_position -> finalize_sl_tp, rồi mô phỏng khớp lệnh, SL/TP,
+thanh lý theo leverage và phí.
+
+Indicator được tính một lần trên toàn bộ chuỗi (các công thức đều nhân quả nên giá trị tại
+nến i chỉ phụ thuộc nến <= i); vòng lặp sự kiện chỉ chạy qua các nến không có vị thế và nhảy
+thẳng tới nến thoát lệnh bằng tìm kiếm vector hóa.
+
+Giống live: volume trung bình trên cửa sổ KLINE_LIMIT nến, htf_trend (HTF_INTERVALS) gộp từ cùng
+chuỗi nến với nến khung lớn cuối đang chạy, lệnh bị lọc theo min_qty/min_notional/step của
+symbol (`rules`, mặc định DEFAULT_RULES như khi chưa tải được exchangeInfo).
+
+Khác live: live chỉ tính indicator trên KLINE_LIMIT nến gần nhất (khung lớn: KLINE_LIMIT nến
+gộp), còn backtest tính trên toàn bộ lịch sử, nên phần warm-up của EMA (seed bằng nến đầu cửa
+sổ) khác nhau; tín hiệu backtest chỉ xấp xỉ tín hiệu live, lệch nhiều nhất khi KLINE_LIMIT nhỏ
+so với chu kỳ EMA.
+
+    python backtester.py klines.csv --balance 1000
+    python backtester.py store:BTC-USDT:1m     # đọc từ kho kline trên đĩa (kline_store.py)
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+from indicator_processor import calculate_indicators, calculate_atr, calculate_dynamic_levels, confidence_scores
+from indicator_processor import format_for_gemini
+from signal_evaluator import parse_signal, validate_sl_tp
+from trade_executor import resolve_trade_params, size_position, finalize_sl_tp
+from symbol_rules import DEFAULT_RULES
+from klines import INTERVAL_MS
+from config import KLINE_LIMIT, HTF_INTERVALS
+import rule_engine
+from logger import flush_logs
+
+KLINE_COLUMNS = ["time", "open", "high", "low", "close", "volume"]
+
+def load_klines(path):
+    """Đọc file kline CSV/Parquet (cột time, open, high, low, close, volume) hoặc store:SYMBOL[:INTERVAL]."""
+    if path.startswith("store:"):
+        symbol, _, interval = path[len("store:"):].partition(":")
+        return load_store_klines(symbol, interval or "1m")
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path, columns=KLINE_COLUMNS)
+    else:
+        df = pd.read_csv(path, usecols=KLINE_COLUMNS)
+    return df.sort_values("time").reset_index(drop=True)
+
+def load_store_klines(symbol, interval="1m", root=None):
+    """Toàn bộ lịch sử của (symbol, interval) trong kho kline trên đĩa."""
+    from config import KLINE_STORE_DIR
+    from kline_store import KlineSeries
+    klines = KlineSeries(os.path.join(root or KLINE_STORE_DIR, symbol, interval)).read()
+    return pd.DataFrame({column: np.asarray(getattr(klines, column)) for column in KLINE_COLUMNS})
+
+def htf_trends(df, intervals=HTF_INTERVALS):
+    """htf_trend tại mọi nến như run_cycle: trend_snapshot trên nến gộp, nến khung lớn cuối đang chạy.
+
+    EMA của nến đang chạy = một bước EMA từ EMA các nến khung lớn đã đóng với close hiện tại, nên
+    không cần resample lại ở mỗi nến. Bỏ các khung không lớn hơn khung của df (như TIMEFRAME ở live).
+    """
+    times = df["time"].to_numpy(np.int64)
+    close = df["close"].to_numpy(np.float64)
+    base = int(np.median(np.diff(times))) if len(times) > 1 else INTERVAL_MS["1m"]
+    columns = []
+    for interval in intervals:
+        step = INTERVAL_MS[interval]
+        if step <= base:
+            continue
+        buckets = times // step
+        ends = np.flatnonzero(np.diff(buckets, append=buckets[-1] + 1))
+        position = np.searchsorted(buckets[ends], buckets)
+        closed = pd.Series(close[ends])
+        emas = []
+        for span in (20, 50):
+            alpha = 2 / (span + 1)
+            previous = closed.ewm(span=span, adjust=False).mean().shift().to_numpy()[position]
+            emas.append(np.where(np.isnan(previous), close, (1 - alpha) * previous + alpha * close))
+        ema20, ema50 = emas
+        trend = np.where((close > ema20) & (ema20 > ema50), "tăng",
+                         np.where((close < ema20) & (ema20 < ema50), "giảm", "sideway"))
+        columns.append((interval, trend))
+    return [tuple((interval, trend[i]) for interval, trend in columns) for i in range(len(df))]
+
+def prepare_features(df, window=KLINE_LIMIT):
+    """Tính toàn bộ cột indicator + các giá trị market_snapshot cho mọi nến (vector hóa).
+
+    Indicator chạy trên toàn bộ lịch sử chứ không theo cửa sổ KLINE_LIMIT như live (xem docstring module).
+    """
+    df = calculate_indicators(df)
+    df["atr"] = calculate_atr(df)
+    close = df["close"]
+    up = (close > df["ema20"]) & (df["ema20"] > df["ema50"])
+    down = (close < df["ema20"]) & (df["ema20"] < df["ema50"])
+    df["trend"] = np.where(up, "tăng", np.where(down, "giảm", "sideway"))
+
+    # Cùng hàm chấm điểm với live, volume trung bình trên cửa sổ `window` nến
+    df["confidence"] = confidence_scores(
+        close, df["rsi"], df["ema20"], df["ema50"], df["macd"], df["macd_signal"],
+        df["volume"].rolling(3, min_periods=1).mean(), df["volume"].rolling(window, min_periods=1).mean())
+
+    df["volatility"] = df["atr"] / close * 100
+    df["price_change_5m"] = close.pct_change(5) * 100
+    df["volume_trend"] = np.where(df["volume"] > df["volume"].rolling(5, min_periods=1).mean(), "tăng", "giảm")
+    df["sl_distance"], df["tp_distance"] = calculate_dynamic_levels(close, df["atr"])
+    df["htf_trend"] = htf_trends(df)
+    return df
+
+SNAPSHOT_COLUMNS = ["close", "rsi", "ema20", "ema50", "macd", "macd_signal", "atr", "volatility",
+                    "price_change_5m", "volume_trend", "sl_distance", "tp_distance", "confidence", "trend",
+                    "htf_trend"]
+
+def rule_based_decider(snapshot, window):
+    """Stand-in tất định cho bước LLM."""
+    return rule_engine.decide(snapshot)
+
+def make_gemini_decider(balance=1000, trade_amount=80, leverage=100, symbol="BTC-USDT"):
+    """Decider gọi Gemini thật trên cửa sổ nến giống lúc chạy live (chậm, tốn phí)."""
+    from gemini_analyzer import analyze
+
+    def decider(snapshot, window):
+        return analyze(format_for_gemini(window(), balance, trade_amount, leverage, symbol, snapshot), "")
+    return decider
+
+def _first_exit(start, lows, highs, stop, take, is_long):
+    """Tìm nến đầu tiên chạm stop/take từ `start`, quét theo khối tăng dần để tránh O(n^2)."""
+    n = len(lows)
+    size = 256
+    while start < n:
+        end = min(n, start + size)
+        if is_long:
+            stop_hit = lows[start:end] <= stop
+            take_hit = highs[start:end] >= take
+        else:
+            stop_hit = highs[start:end] >= stop
+            take_hit = lows[start:end] <= take
+        hit = stop_hit | take_hit
+        if hit.any():
+            j = int(hit.argmax())
+            # Cả hai cùng chạm trong một nến: giả định xấu nhất là SL khớp trước
+            return start + j, bool(stop_hit[j])
+        start = end
+        size *= 2
+    return None, False
+
+def run_backtest(df, decider=rule_based_decider, initial_balance=1000.0, window=KLINE_LIMIT,
+                 fee_rate=0.0005, rules=None, min_margin=100, quiet=True):
+    """Chạy backtest trên DataFrame kline; trả về dict kết quả (trades, balance, thống kê).
+
+    rules: luật giao dịch của symbol (symbol_rules.get_symbol_rules), mặc định DEFAULT_RULES.
+    """
+    rules = rules or DEFAULT_RULES
+    started = time.perf_counter()
+    df = prepare_features(df, window)
+    n = len(df)
+    columns = {name: df[name].tolist() for name in SNAPSHOT_COLUMNS}
+    lows = df["low"].to_numpy()
+    highs = df["high"].to_numpy()
+    closes = df["close"].to_numpy()
+
+    balance = initial_balance
+    trades = []
+    equity = [balance]
+    i = max(window, 6) - 1
+    # log_event của pipeline in rất nhiều dòng; gom lại khi chạy hàng trăm nghìn nến
+    sink = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    with sink:
+        while i < n - 1:
+            if balance < min_margin:
+                break
+            snapshot = {name: values[i] for name, values in columns.items()}
+            text = decider(snapshot, lambda: df.iloc[i - window + 1:i + 1])
+            signal, amount, leverage, sl, tp, reason = parse_signal(text or "")
+            if signal not in ("buy", "sell"):
+                i += 1
+                continue
+
+            price = closes[i]
+            _, _, sl, tp = validate_sl_tp(signal, price, sl, tp)
+            leverage, trade_amount = resolve_trade_params(leverage, amount)
+            quantity, margin = size_position(trade_amount, price, leverage, sl, balance, rules)
+            # Cùng điều kiện bỏ lệnh với place_order
+            if quantity <= 0 or quantity < rules["min_qty"] or quantity * price < rules["min_notional"]:
+                i += 1
+                continue
+            sl, tp = finalize_sl_tp(signal, price, sl, tp)
+
+            is_long = signal == "buy"
+            liquidation = price * (1 - 1 / leverage) if is_long else price * (1 + 1 / leverage)
+            stop = (max(sl, liquidation) if is_long else min(sl, liquidation)) if sl else liquidation
+            take = tp if tp else (np.inf if is_long else -np.inf)
+
+            exit_index, stopped = _first_exit(i + 1, lows, highs, stop, take, is_long)
+            if exit_index is None:
+                exit_index, exit_price, outcome = n - 1, closes[-1], "end"
+            elif stopped:
+                exit_price = stop
+                outcome = "liquidation" if stop == liquidation else "sl"
+            else:
+                exit_price, outcome = take, "tp"
+
+            direction = 1 if is_long else -1
+            pnl = direction * (exit_price - price) * quantity
+            pnl -= fee_rate * quantity * (price + exit_price)
+            if outcome == "liquidation":
+                pnl = -margin
+            balance += pnl
+            equity.append(balance)
+            trades.append({
+                "entry_time": int(df["time"].iat[i]), "exit_time": int(df["time"].iat[exit_index]),
+                "side": signal, "entry": price, "exit": exit_price, "quantity": quantity,
+                "leverage": leverage, "margin": margin, "pnl": pnl, "outcome": outcome, "reason": reason,
+            })
+            i = exit_index + 1
+        # Logger ghi bất đồng bộ: xả hàng đợi khi stdout còn đang bị gom
+        flush_logs()
+
+    equity = np.array(equity)
+    drawdown = (np.maximum.accumulate(equity) - equity).max() if len(equity) else 0.0
+    wins = sum(1 for trade in trades if trade["pnl"] > 0)
+    elapsed = time.perf_counter() - started
+    return {
+        "candles": n,
+        "trades": trades,
+        "initial_balance": initial_balance,
+        "final_balance": balance,
+        "pnl": balance - initial_balance,
+        "win_rate": wins / len(trades) if trades else 0.0,
+        "max_drawdown": float(drawdown),
+        "elapsed": elapsed,
+        "candles_per_second": n / elapsed if elapsed else 0.0,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest pipeline quyết định trên file kline")
+    parser.add_argument("path", help="File CSV/Parquet: time,open,high,low,close,volume, hoặc store:SYMBOL[:INTERVAL]")
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--fee", type=float, default=0.0005, help="Phí mỗi chiều (taker)")
+    parser.add_argument("--gemini", action="store_true", help="Gọi Gemini thật thay cho rule engine")
+    parser.add_argument("--symbol", help="Luật min_qty/min_notional/step lấy từ exchangeInfo của symbol này "
+                                         "(mặc định symbol trong store:SYMBOL; không có thì DEFAULT_RULES)")
+    args = parser.parse_args(argv)
+
+    df = load_klines(args.path)
+    symbol = args.symbol or (args.path[len("store:"):].partition(":")[0] if args.path.startswith("store:") else None)
+    rules = None
+    if symbol:
+        from symbol_rules import get_symbol_rules
+        rules = get_symbol_rules(symbol)
+    decider = make_gemini_decider(args.balance, symbol=symbol or "BTC-USDT") if args.gemini else rule_based_decider
+    result = run_backtest(df, decider, args.balance, fee_rate=args.fee, rules=rules)
+    outcomes = pd.Series([trade["outcome"] for trade in result["trades"]]).value_counts().to_dict()
+    print(f"Candles: {result['candles']} | {result['elapsed']:.2f}s ({result['candles_per_second']:.0f} nến/s)")
+    print(f"Trades: {len(result['trades'])} {outcomes} | Win rate: {result['win_rate'] * 100:.1f}%")
+    print(f"Balance: ${result['initial_balance']:.2f} -> ${result['final_balance']:.2f} "
+          f"(PnL {result['pnl']:+.2f}, max drawdown ${result['max_drawdown']:.2f})")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
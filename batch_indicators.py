@@ -0,0 +1,144 @@
+"""Tính indicator cho nhiều symbol trong một lượt NumPy.
+
+Input là mảng (symbols x candles x OHLCV); mọi phép tính chạy trên cả trục symbol cùng lúc
+nên quét 200 symbol không tốn hơn bao nhiêu so với một symbol. Công thức giống hệt
+calculate_indicators/calculate_atr/market_snapshot để kết quả khớp với đường pandas.
+"""
+import numpy as np
+from indicator_processor import calculate_dynamic_levels, confidence_scores
+from klines import KlineColumns, FIELDS
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+def stack_klines(klines_by_symbol, limit=None):
+    """Gom klines (KlineColumns hoặc list dict như REST/stream) của nhiều symbol thành mảng (S, N, 5).
+
+    Các symbol được cắt về cùng số nến gần nhất (ngắn nhất trong nhóm, hoặc `limit`).
+    """
+    symbols = list(klines_by_symbol)
+    length = min(len(klines_by_symbol[symbol]) for symbol in symbols)
+    if limit:
+        length = min(length, limit)
+    ohlcv = np.empty((len(symbols), length, 5))
+    for i, symbol in enumerate(symbols):
+        klines = klines_by_symbol[symbol]
+        if isinstance(klines, KlineColumns):
+            ohlcv[i] = klines.tail(length).to_ohlcv()
+        else:
+            candles = klines[-length:] if length else []
+            ohlcv[i] = [[float(candle[field]) for field in FIELDS] for candle in candles]
+    return symbols, ohlcv
+
+def _ema(values, span, block=32):
+    """EMA adjust=False dọc trục thời gian, vector hóa trên trục symbol.
+
+    Trong mỗi khối `block` nến dùng dạng đóng y[t+j] = d^j * (y[t] + a * sum d^-i * x[t+i])
+    bằng cumsum, nên số vòng lặp Python là N/block thay vì N (d^-block vẫn nhỏ, không mất chính xác).
+    """
+    alpha = 2.0 / (span + 1)
+    decay = 1 - alpha
+    out = np.empty_like(values)
+    out[:, 0] = values[:, 0]
+    for start in range(1, values.shape[1], block):
+        end = min(values.shape[1], start + block)
+        powers = decay ** np.arange(1, end - start + 1)
+        acc = np.cumsum(values[:, start:end] * (alpha / powers), axis=1)
+        out[:, start:end] = powers * (out[:, start - 1:start] + acc)
+    return out
+
+def _rolling_mean(values, window, min_periods=1):
+    """Rolling mean dọc trục thời gian bằng cumsum (NaN khi chưa đủ min_periods)."""
+    csum = np.cumsum(values, axis=1)
+    out = csum.copy()
+    out[:, window:] = csum[:, window:] - csum[:, :-window]
+    counts = np.minimum(np.arange(1, values.shape[1] + 1), window)
+    out = out / counts
+    out[:, counts < min_periods] = np.nan
+    return out
+
+def compute_batch(ohlcv, rsi_period=14, atr_period=14):
+    """Chuỗi indicator (S, N) cho mọi symbol: rsi, ema20, ema50, macd, macd_signal, macd_histogram, atr."""
+    close = ohlcv[:, :, CLOSE]
+    high = ohlcv[:, :, HIGH]
+    low = ohlcv[:, :, LOW]
+
+    delta = np.diff(close, axis=1, prepend=np.nan)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = _rolling_mean(gain, rsi_period) / _rolling_mean(loss, rsi_period)
+        rsi = 100 - 100 / (1 + rs)
+
+    ema12 = _ema(close, 12)
+    ema26 = _ema(close, 26)
+    macd = ema12 - ema26
+    macd_signal = _ema(macd, 9)
+
+    prev_close = np.concatenate([np.full((close.shape[0], 1), np.nan), close[:, :-1]], axis=1)
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    atr = _rolling_mean(true_range, atr_period, min_periods=atr_period)
+
+    return {
+        "rsi": rsi,
+        "ema20": _ema(close, 20),
+        "ema50": _ema(close, 50),
+        "macd": macd,
+        "macd_signal": macd_signal,
+        "macd_histogram": macd - macd_signal,
+        "atr": atr,
+    }
+
+def batch_snapshot(ohlcv):
+    """Giá trị market_snapshot ở nến cuối cho mọi symbol, mỗi key là mảng (S,)."""
+    series = compute_batch(ohlcv)
+    close = ohlcv[:, -1, CLOSE]
+    volume = ohlcv[:, :, VOLUME]
+    last = {name: values[:, -1] for name, values in series.items()}
+    rsi, ema20, ema50 = last["rsi"], last["ema20"], last["ema50"]
+
+    up = (close > ema20) & (ema20 > ema50)
+    down = (close < ema20) & (ema20 < ema50)
+    # Volume trung bình trên cả cửa sổ như calculate_market_confidence
+    confidence = confidence_scores(close, rsi, ema20, ema50, last["macd"], last["macd_signal"],
+                                   volume[:, -3:].mean(axis=1), volume.mean(axis=1))
+
+    reference = ohlcv[:, -6, CLOSE]
+    sl_distance, tp_distance = calculate_dynamic_levels(close, last["atr"])
+    last.update({
+        "close": close,
+        "volatility": last["atr"] / close * 100,
+        "price_change_5m": (close - reference) / reference * 100,
+        "volume_trend": np.where(volume[:, -1] > volume[:, -5:].mean(axis=1), "tăng", "giảm"),
+        "sl_distance": sl_distance,
+        "tp_distance": tp_distance,
+        "confidence": confidence,
+        "trend": np.where(up, "tăng", np.where(down, "giảm", "sideway")),
+    })
+    return last
+
+def kline_snapshot(klines):
+    """market_snapshot của một symbol thẳng từ KlineColumns, không dựng DataFrame."""
+    batch = batch_snapshot(klines.to_ohlcv()[np.newaxis])
+    return {name: values[0].item() for name, values in batch.items()}
+
+def trend_snapshot(klines):
+    """Đặc trưng xu hướng ở khung lớn (cho prompt): close, rsi, ema20, ema50, macd_histogram,
+    trend và % thay đổi so với nến trước; chạy được cả khi chưa đủ nến cho ATR."""
+    ohlcv = klines.to_ohlcv()[np.newaxis]
+    series = compute_batch(ohlcv)
+    close = ohlcv[0, :, CLOSE]
+    last = {name: series[name][0, -1].item() for name in ("rsi", "ema20", "ema50", "macd_histogram")}
+    up = close[-1] > last["ema20"] > last["ema50"]
+    down = close[-1] < last["ema20"] < last["ema50"]
+    last.update({
+        "close": close[-1].item(),
+        "change": ((close[-1] - close[-2]) / close[-2] * 100).item() if len(close) > 1 else 0.0,
+        "trend": "tăng" if up else "giảm" if down else "sideway",
+        "candles": len(close),
+    })
+    return last
+
+def snapshots_by_symbol(symbols, ohlcv):
+    """Tách batch_snapshot thành dict snapshot cho từng symbol (cùng dạng market_snapshot)."""
+    batch = batch_snapshot(ohlcv)
+    return {symbol: {name: values[i].item() for name, values in batch.items()} for i, symbol in enumerate(symbols)}
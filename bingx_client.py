@@ -0,0 +1,124 @@
+import time
+import hmac
+import threading
+from hashlib import sha256
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import BINGX_REQUEST_SECONDS, BINGX_HTTP_ERRORS
+from rate_limiter import AdaptiveRateLimiter
+from config import (
+    BINGX_API_KEY, BINGX_API_SECRET, BINGX_API_URL,
+    BINGX_TIMEOUT, BINGX_MAX_RETRIES, BINGX_POOL_SIZE, BINGX_RATE_LIMIT, BINGX_RATE_BURST,
+    BINGX_RATE_LIMIT_MARKET, BINGX_RATE_BURST_MARKET, BINGX_RATE_LIMIT_TRADE, BINGX_RATE_BURST_TRADE,
+    BINGX_BACKOFF_BASE, BINGX_BACKOFF_MAX,
+)
+
+IDEMPOTENT_METHODS = frozenset(["GET", "DELETE"])
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def get_sign(api_secret, payload):
+    return hmac.new(api_secret.encode("utf-8"), payload.encode("utf-8"), digestmod=sha256).hexdigest()
+
+def parse_param(params_map):
+    sorted_keys = sorted(params_map)
+    params_str = "&".join(["%s=%s" % (x, params_map[x]) for x in sorted_keys])
+    if params_str != "":
+        return params_str + "&timestamp=" + str(int(time.time() * 1000))
+    else:
+        return "timestamp=" + str(int(time.time() * 1000))
+
+class BingXClient:
+    """REST client dùng chung: giữ kết nối keep-alive thay vì bắt tay TCP+TLS cho mỗi request."""
+
+    def __init__(self, base_url=BINGX_API_URL, api_key=BINGX_API_KEY, api_secret=BINGX_API_SECRET,
+                 timeout=BINGX_TIMEOUT, max_retries=BINGX_MAX_RETRIES, pool_size=BINGX_POOL_SIZE,
+                 rate_limiter=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        self.session.headers.update({"X-BX-APIKEY": api_key or ""})
+        # urllib3 chỉ retry lỗi kết nối/đọc của GET/DELETE; 429/5xx do request() tự retry sau khi
+        # rate limiter ghi nhận để cả nhóm endpoint cùng lùi lại. Không bao giờ tự gửi lại lệnh POST.
+        self.max_retries = max_retries
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=0,
+            backoff_factor=0.3,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, params=None, signed=True, timeout=None):
+        """Gửi request tới BingX. Request có ký sẽ thêm timestamp + signature giống hệt trước đây."""
+        attempt = 0
+        while True:
+            response = self._send(method, path, params, signed, timeout)
+            if (response.status_code not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS
+                    or attempt >= self.max_retries):
+                return response
+            attempt += 1
+            if not self.rate_limiter:
+                time.sleep(0.3 * 2 ** attempt)
+
+    def _send(self, method, path, params, signed, timeout):
+        # acquire() chờ hết thời gian bị chặn (Retry-After/backoff) của nhóm trước khi gửi
+        group = self.rate_limiter.acquire(path) if self.rate_limiter else None
+        url = f"{self.base_url}{path}"
+        if signed:
+            params_str = parse_param(params or {})
+            signature = get_sign(self.api_secret, params_str)
+            url = f"{url}?{params_str}&signature={signature}"
+            params = None
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, params=params, timeout=timeout or self.timeout)
+        except Exception:
+            BINGX_HTTP_ERRORS.inc(endpoint=path, status="exception")
+            if group:
+                self.rate_limiter.record(group)
+            raise
+        finally:
+            BINGX_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=path, method=method)
+        if response.status_code >= 400:
+            BINGX_HTTP_ERRORS.inc(endpoint=path, status=response.status_code)
+        if group:
+            self.rate_limiter.record(group, response.status_code, response.headers.get("Retry-After"))
+        return response
+
+    def get(self, path, params=None, signed=True, timeout=None):
+        return self.request("GET", path, params, signed, timeout)
+
+    def post(self, path, params=None, signed=True, timeout=None):
+        return self.request("POST", path, params, signed, timeout)
+
+    def close(self):
+        self.session.close()
+
+def create_rate_limiter():
+    return AdaptiveRateLimiter({
+        "market": (BINGX_RATE_LIMIT_MARKET, BINGX_RATE_BURST_MARKET),
+        "account": (BINGX_RATE_LIMIT, BINGX_RATE_BURST),
+        "trade": (BINGX_RATE_LIMIT_TRADE, BINGX_RATE_BURST_TRADE),
+    }, BINGX_BACKOFF_BASE, BINGX_BACKOFF_MAX)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Trả về BingXClient dùng chung cho cả process (khởi tạo lười, thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BingXClient(rate_limiter=create_rate_limiter())
+    return _client
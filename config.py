@@ -7,8 +7,105 @@ BINGX_API_KEY = os.getenv("BINGX_API_KEY")
 BINGX_API_SECRET = os.getenv("BINGX_API_SECRET")
 BINGX_API_URL = os.getenv("BINGX_API_URL")
 SYMBOL = os.getenv("SYMBOL")
-TIMEFRAME = os.getenv("TIMEFRAME")
+# Watchlist nhiều symbol, phân tách bằng dấu phẩy (mặc định chỉ SYMBOL)
+SYMBOLS = [s.strip() for s in os.getenv("SYMBOLS", SYMBOL or "").split(",") if s.strip()]
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+# Chu kỳ lỗi: chờ SCHEDULER_ERROR_DELAY * 2^n giây (tối đa SCHEDULER_MAX_ERROR_DELAY) thay vì cố định 30s
+SCHEDULER_ERROR_DELAY = float(os.getenv("SCHEDULER_ERROR_DELAY", "5"))
+SCHEDULER_MAX_ERROR_DELAY = float(os.getenv("SCHEDULER_MAX_ERROR_DELAY", "300"))
+# Lịch quyết định: candle (chạy đúng lúc nến TIMEFRAME đóng + trigger từ stream) hoặc interval (60s như cũ)
+SCHEDULE_MODE = os.getenv("SCHEDULE_MODE", "candle").lower()
+CANDLE_CLOSE_GRACE = float(os.getenv("CANDLE_CLOSE_GRACE", "0.5"))
+# Trigger (cần MARKET_DATA_MODE=stream): giá lệch > k x ATR, volume nến 1m > m x trung bình; 0 để tắt
+TRIGGER_ATR_MULT = float(os.getenv("TRIGGER_ATR_MULT", "1.0"))
+TRIGGER_VOLUME_MULT = float(os.getenv("TRIGGER_VOLUME_MULT", "3.0"))
+TRIGGER_COOLDOWN = float(os.getenv("TRIGGER_COOLDOWN", "10"))
+ORDER_POLL_INTERVAL = float(os.getenv("ORDER_POLL_INTERVAL", "30"))
+LOW_MARGIN_DELAY = float(os.getenv("LOW_MARGIN_DELAY", "300"))
+TIMEFRAME = os.getenv("TIMEFRAME", "1m")
+# Số nến của mỗi khung cho indicator (EMA50 cần >= 50 nến)
+KLINE_LIMIT = int(os.getenv("KLINE_LIMIT", "100"))
+# Khung lớn hơn để lấy xu hướng cho prompt, đều gộp từ cùng một lần lấy MTF_BASE_LIMIT nến 1m
+HTF_INTERVALS = [s.strip() for s in os.getenv("HTF_INTERVALS", "5m,15m,1h").split(",") if s.strip()]
+MTF_BASE_LIMIT = int(os.getenv("MTF_BASE_LIMIT", "1440"))
 TRADE_AMOUNT = float(os.getenv("TRADE_AMOUNT"))
 LEVERAGE = int(os.getenv("LEVERAGE"))
+# Cách ra quyết định: gemini (LLM), rules (rule_engine trong process) hoặc confirm (rules, Gemini chỉ xác nhận)
+STRATEGY_MODE = os.getenv("STRATEGY_MODE", "gemini").lower()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_API_URL = os.getenv("GEMINI_API_URL")
\ No newline at end of file
+GEMINI_API_URL = os.getenv("GEMINI_API_URL")
+# Các URL model để hedge (mặc định chỉ GEMINI_API_URL); request hedge gửi tới URL thứ hai
+GEMINI_API_URLS = [u.strip() for u in os.getenv("GEMINI_API_URLS", GEMINI_API_URL or "").split(",") if u.strip()] or [GEMINI_API_URL]
+# Hạn chót cho một quyết định (giây); quá hạn thì dùng rule_engine. Hedge sau p95 latency của URL
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "8"))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "true").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_QUANTILE = float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.95"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "1.5"))
+GEMINI_WORKERS = int(os.getenv("GEMINI_WORKERS", "8"))
+# Yêu cầu Gemini trả JSON theo schema (false: format text cũ)
+GEMINI_JSON_OUTPUT = os.getenv("GEMINI_JSON_OUTPUT", "true").lower() in ("1", "true", "yes")
+# Gộp các symbol cùng hỏi Gemini trong một chu kỳ thành một request (luôn trả JSON dạng mảng);
+# chờ tối đa GEMINI_BATCH_WINDOW giây để gom, GEMINI_BATCH_MAX=0 nghĩa là cả watchlist
+GEMINI_BATCH = os.getenv("GEMINI_BATCH", "false").lower() in ("1", "true", "yes")
+GEMINI_BATCH_WINDOW = float(os.getenv("GEMINI_BATCH_WINDOW", "0.5"))
+GEMINI_BATCH_MAX = int(os.getenv("GEMINI_BATCH_MAX", "0"))
+# Cache phản hồi Gemini theo trạng thái thị trường lượng tử hóa (TTL=0 để tắt)
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "180"))
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "256"))
+GEMINI_CACHE_RSI_BUCKET = float(os.getenv("GEMINI_CACHE_RSI_BUCKET", "5"))
+GEMINI_CACHE_ATR_BUCKET = float(os.getenv("GEMINI_CACHE_ATR_BUCKET", "0.02"))
+GEMINI_CACHE_CONFIDENCE_BUCKET = float(os.getenv("GEMINI_CACHE_CONFIDENCE_BUCKET", "10"))
+
+# BingX REST client (kết nối keep-alive dùng chung)
+BINGX_TIMEOUT = float(os.getenv("BINGX_TIMEOUT", "10"))
+BINGX_MAX_RETRIES = int(os.getenv("BINGX_MAX_RETRIES", "2"))
+BINGX_POOL_SIZE = int(os.getenv("BINGX_POOL_SIZE", "10"))
+# Ngân sách request dùng chung cho mọi symbol (request/giây và burst), tách theo nhóm endpoint:
+# BINGX_RATE_LIMIT cho account (số dư, vị thế, listenKey), *_MARKET cho quote, *_TRADE cho lệnh
+BINGX_RATE_LIMIT = float(os.getenv("BINGX_RATE_LIMIT", "10"))
+BINGX_RATE_BURST = int(os.getenv("BINGX_RATE_BURST", "20"))
+BINGX_RATE_LIMIT_MARKET = float(os.getenv("BINGX_RATE_LIMIT_MARKET", "20"))
+BINGX_RATE_BURST_MARKET = int(os.getenv("BINGX_RATE_BURST_MARKET", "40"))
+BINGX_RATE_LIMIT_TRADE = float(os.getenv("BINGX_RATE_LIMIT_TRADE", "5"))
+BINGX_RATE_BURST_TRADE = int(os.getenv("BINGX_RATE_BURST_TRADE", "10"))
+# Backoff khi gặp 429/5xx (Retry-After được ưu tiên nếu sàn gửi)
+BINGX_BACKOFF_BASE = float(os.getenv("BINGX_BACKOFF_BASE", "1"))
+BINGX_BACKOFF_MAX = float(os.getenv("BINGX_BACKOFF_MAX", "60"))
+
+# Market data: "rest" (polling) hoặc "stream" (WebSocket, fallback về REST khi mất kết nối)
+MARKET_DATA_MODE = os.getenv("MARKET_DATA_MODE", "rest")
+BINGX_WS_URL = os.getenv("BINGX_WS_URL", "wss://open-api-swap.bingx.com/swap-market")
+# Số nến tối thiểu trong ring buffer; tự nâng lên đủ cửa sổ 1m của TIMEFRAME + HTF_INTERVALS
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "200"))
+STREAM_STALE_SECONDS = float(os.getenv("STREAM_STALE_SECONDS", "15"))
+
+# Theo dõi lệnh/vị thế: "poll" (REST mỗi 30-60s) hoặc "stream" (user data stream, phản ứng tức thì)
+ORDER_TRACKING_MODE = os.getenv("ORDER_TRACKING_MODE", "poll")
+ORDER_STREAM_SAFETY_POLL = float(os.getenv("ORDER_STREAM_SAFETY_POLL", "300"))
+
+# Cache luật giao dịch (exchangeInfo) theo symbol, làm mới mỗi SYMBOL_RULES_TTL giây
+SYMBOL_RULES_TTL = float(os.getenv("SYMBOL_RULES_TTL", "3600"))
+
+# Số thread gọi song song các request đầu chu kỳ; giá quá PRICE_MAX_AGE giây thì lấy lại trước khi đặt lệnh
+PRETRADE_WORKERS = int(os.getenv("PRETRADE_WORKERS", "8"))
+PRICE_MAX_AGE = float(os.getenv("PRICE_MAX_AGE", "5"))
+
+# Snapshot số dư cũ hơn BALANCE_MAX_AGE giây thì lấy lại trước khi tính size lệnh
+BALANCE_MAX_AGE = float(os.getenv("BALANCE_MAX_AGE", "30"))
+
+# Logger bất đồng bộ: JSON lines vào LOG_FILE (xoay vòng theo kích thước), console giữ định dạng cũ
+LOG_FILE = os.getenv("LOG_FILE", "trade_log.txt")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "3"))
+# Queue vượt 80% LOG_QUEUE_SIZE thì bỏ log DEBUG; INFO trở lên luôn được ghi (không chặn, không bỏ)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "true").lower() in ("1", "true", "yes")
+
+# Kho kline trên đĩa (memmap, đồng bộ tăng dần); để trống KLINE_STORE_DIR để tắt
+KLINE_STORE_DIR = os.getenv("KLINE_STORE_DIR", "kline_store")
+KLINE_STORE_BACKFILL = int(os.getenv("KLINE_STORE_BACKFILL", "1440"))
+
+# Journal trạng thái (SQLite WAL) thay cho current_order.txt; để trống JOURNAL_PATH để dùng file cũ
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "state_journal.db")
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.2"))
@@ -0,0 +1,9 @@
+"""pytest chạy mọi test_*.py trong một process: config chỉ đọc env một lần, ở lần import đầu tiên.
+
+Dựng môi trường chung (sàn giả, thư mục tạm cho journal/kho kline/log) trước khi pytest import
+module test nào; use_mock_exchange() trong từng file sẽ dùng lại đúng sàn này. Giá trị riêng của
+từng test (URL Gemini giả...) đặt bằng mock_exchange.patched() trong chính test đó.
+"""
+from mock_exchange import use_mock_exchange
+
+use_mock_exchange()
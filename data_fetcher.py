@@ -1,73 +1,130 @@
-import time
-import requests
-import hmac
-from hashlib import sha256
-from config import BINGX_API_KEY, BINGX_API_SECRET, BINGX_API_URL, SYMBOL
-
-def get_sign(api_secret, payload):
-    return hmac.new(api_secret.encode("utf-8"), payload.encode("utf-8"), digestmod=sha256).hexdigest()
-
-def parse_param(params_map):
-    sorted_keys = sorted(params_map)
-    params_str = "&".join(["%s=%s" % (x, params_map[x]) for x in sorted_keys])
-    if params_str != "":
-        return params_str + "&timestamp=" + str(int(time.time() * 1000))
-    else:
-        return "timestamp=" + str(int(time.time() * 1000))
+from config import SYMBOL, KLINE_STORE_DIR, KLINE_STORE_BACKFILL
+from config import TIMEFRAME, KLINE_LIMIT, HTF_INTERVALS, MTF_BASE_LIMIT, BINGX_WS_URL, STREAM_BUFFER_SIZE
+from bingx_client import get_client
+from klines import KlineColumns, INTERVAL_MS, resample
 
-def get_market_data():
-    path = '/openApi/swap/v3/quote/klines'
-    method = "GET"
-    params_map = {
-        "symbol": SYMBOL,  # Đảm bảo SYMBOL là 'BTC-USDT'
-        "interval": "1m",
-        "limit": "20"
-    }
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {
-        'X-BX-APIKEY': BINGX_API_KEY,
-    }
-    response = requests.request(method, url, headers=headers)
-    if response.status_code == 200:
-        return response.json().get("data", [])
-    else:
-        from logger import log_event
-        log_event(f"Lỗi lấy dữ liệu thị trường: {response.status_code} - {response.text}")
-        return []
+# BingX trả tối đa 1440 nến mỗi request
+REST_MAX_LIMIT = 1440
+_streams = {}
+_indicators = {}
+_store = None
+
+def start_market_stream(symbol=SYMBOL, url=BINGX_WS_URL):
+    """Bật chế độ streaming: kline/giá được phục vụ từ bộ nhớ, REST chỉ dùng khi stream lỗi.
+
+    Ring buffer giữ và được nạp đủ base_window() nến 1m, nên get_timeframes (TIMEFRAME + HTF)
+    đọc thẳng từ stream mỗi chu kỳ thay vì đồng bộ kho/REST. TIMEFRAME là 1m thì indicator
+    được cập nhật tăng dần theo từng push (get_live_snapshot).
+    """
+    from market_stream import MarketStream
+    if symbol not in _streams:
+        window = base_window()
+        stream = MarketStream(
+            symbol, url=url, seed=lambda: fetch_base_klines(symbol, window).to_candles(),
+            maxlen=max(STREAM_BUFFER_SIZE, window),
+        )
+        if TIMEFRAME == stream.interval:
+            from indicator_processor import StreamIndicators
+            _indicators[symbol] = StreamIndicators(stream, INTERVAL_MS[TIMEFRAME], volume_window=KLINE_LIMIT)
+            stream.add_listener(_indicators[symbol].on_candle)
+        _streams[symbol] = stream.start()
+    return _streams[symbol]
+
+def get_live_stream(symbol=SYMBOL):
+    """Trả về stream của symbol nếu đang khỏe, ngược lại None (caller fallback REST)."""
+    stream = _streams.get(symbol)
+    if stream and stream.is_healthy():
+        return stream
+    return None
+
+def get_live_snapshot(symbol=SYMBOL):
+    """market_snapshot TIMEFRAME từ IndicatorState của stream; None nếu stream không khỏe,
+    chưa đủ KLINE_LIMIT nến hoặc TIMEFRAME không phải khung của stream (caller tính từ klines)."""
+    indicators = _indicators.get(symbol)
+    if indicators and get_live_stream(symbol):
+        return indicators.snapshot(KLINE_LIMIT)
+    return None
 
-def get_market_data_15m():
+def get_kline_store():
+    """KlineStore dùng chung (None nếu KLINE_STORE_DIR để trống)."""
+    global _store
+    if _store is None and KLINE_STORE_DIR:
+        from kline_store import KlineStore
+        _store = KlineStore(KLINE_STORE_DIR, fetch_klines, KLINE_STORE_BACKFILL)
+    return _store
+
+def get_market_data(symbol=SYMBOL):
+    """KLINE_LIMIT nến TIMEFRAME gần nhất dạng KlineColumns (gộp từ nến 1m nếu TIMEFRAME lớn hơn)."""
+    return get_timeframes(symbol, (TIMEFRAME,))[TIMEFRAME]
+
+def base_window(intervals=None, limit=KLINE_LIMIT):
+    """Số nến 1m cần để resample ra `limit` nến cho mọi khung trong intervals.
+
+    Đủ cho khung lớn nhất cộng một khung dự phòng (resample cắt bucket đầu thiếu nến), nhưng
+    không quá MTF_BASE_LIMIT; chỉ có 1m thì không cần dự phòng.
+    """
+    intervals = intervals or (TIMEFRAME, *HTF_INTERVALS)
+    minutes = max(INTERVAL_MS[interval] for interval in intervals) // INTERVAL_MS["1m"]
+    if minutes == 1:
+        return limit
+    return max(limit, min(MTF_BASE_LIMIT, minutes * (limit + 1)))
+
+def get_timeframes(symbol=SYMBOL, intervals=None, limit=KLINE_LIMIT):
+    """Nến của nhiều khung (mặc định TIMEFRAME + HTF_INTERVALS) từ MỘT lần lấy nến 1m.
+
+    Khung lớn được resample trong process thay vì mỗi khung một request (xem base_window).
+    """
+    intervals = intervals or (TIMEFRAME, *HTF_INTERVALS)
+    base = get_base_klines(symbol, base_window(intervals, limit))
+    return {interval: resample(base, interval).tail(limit) for interval in intervals}
+
+def get_base_klines(symbol=SYMBOL, limit=KLINE_LIMIT):
+    """limit nến 1m gần nhất (stream nếu khỏe và đủ nến, rồi kho trên đĩa, rồi REST)."""
+    stream = get_live_stream(symbol)
+    if stream:
+        candles = stream.get_candles(limit)
+        if len(candles) >= limit:
+            return KlineColumns.from_candles(candles)
+    return fetch_base_klines(symbol, limit)
+
+def fetch_base_klines(symbol=SYMBOL, limit=KLINE_LIMIT):
+    """limit nến 1m từ kho trên đĩa (đồng bộ tăng dần) hoặc REST; dùng cả để nạp buffer stream."""
+    store = get_kline_store()
+    if store:
+        # Chỉ tải các nến mới hơn nến cuối trên đĩa thay vì cả cửa sổ
+        data = store.sync_and_read(symbol, "1m", limit)
+        if len(data) >= min(limit, KLINE_STORE_BACKFILL):
+            return data
+    return fetch_klines(symbol, "1m", min(limit, REST_MAX_LIMIT))
+
+def fetch_market_data_rest(symbol=SYMBOL):
+    return fetch_klines(symbol, "1m", KLINE_LIMIT)
+
+def fetch_klines(symbol, interval, limit, start_time=None):
+    """Tải klines qua REST, giải mã thẳng từ bytes thành KlineColumns."""
     path = '/openApi/swap/v3/quote/klines'
-    method = "GET"
     params_map = {
-        "symbol": SYMBOL,
-        "interval": "15m",
-        "limit": "10"
-    }
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {
-        'X-BX-APIKEY': BINGX_API_KEY,
+        "symbol": symbol,  # Đảm bảo symbol dạng 'BTC-USDT'
+        "interval": interval,
+        "limit": str(limit)
     }
-    response = requests.request(method, url, headers=headers)
+    if start_time is not None:
+        params_map["startTime"] = str(start_time)
+    response = get_client().get(path, params_map)
     if response.status_code == 200:
-        return response.json().get("data", [])
+        # Giải mã thẳng từ bytes thành cột, không qua list dict + DataFrame
+        return KlineColumns.from_response(response.content)
     else:
         from logger import log_event
-        log_event(f"Lỗi lấy dữ liệu 15m: {response.status_code} - {response.text}")
-        return []
+        log_event(f"Lỗi lấy dữ liệu {interval}: {response.status_code} - {response.text}")
+        return KlineColumns()
+
+def get_market_data_15m(symbol=SYMBOL):
+    """10 nến 15m, gộp từ nến 1m (không tốn request riêng)."""
+    return get_timeframes(symbol, ("15m",), 10)["15m"]
 
 def get_balance():
-    url = f"{BINGX_API_URL}/openApi/swap/v2/user/balance"
-    # Tạo params và ký giống test_balance
-    params_map = {}
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    full_url = f"{url}?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
-    response = requests.get(full_url, headers=headers)
+    response = get_client().get("/openApi/swap/v2/user/balance", {})
     if response.status_code == 200:
         data = response.json().get("data", {})
         balance_info = data.get("balance", {})
@@ -75,32 +132,21 @@ def get_balance():
         return float(balance_info.get("availableMargin", 0))
     return 0
 
-def get_last_close_price():
-    """Lấy giá đóng cửa gần nhất của BTC-USDT (dạng float)."""
-    data = get_market_data()
-    if not data:
-        return None
-    # Dữ liệu trả về là list các nến, mỗi nến là dict hoặc list
-    # Thường: [timestamp, open, high, low, close, ...]
-    last_candle = data[-1] if len(data) > 0 else None
-    if not last_candle:
-        return None
-    # Nếu là dict
-    if isinstance(last_candle, dict):
-        return float(last_candle.get("close", 0))
-    # Nếu là list, close thường ở vị trí thứ 4
-    if isinstance(last_candle, list) and len(last_candle) >= 5:
-        return float(last_candle[4])
-    return None
+def get_last_close_price(symbol=SYMBOL):
+    """Lấy giá đóng cửa gần nhất của symbol (dạng float)."""
+    # KlineColumns đã chuẩn hóa cả nến dạng dict lẫn list
+    return get_market_data(symbol).last_close()
 
-def get_current_price():
+def get_current_price(symbol=SYMBOL):
     """Lấy giá real-time từ BingX ticker"""
-    url = f"{BINGX_API_URL}/openApi/swap/v2/quote/price"
-    params = {"symbol": SYMBOL}
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
+    stream = get_live_stream(symbol)
+    if stream and stream.get_price():
+        return stream.get_price()
+
+    params = {"symbol": symbol}
     
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = get_client().get("/openApi/swap/v2/quote/price", params, signed=False)
         if response.status_code == 200:
             data = response.json().get("data", {})
             price = data.get("price")
@@ -111,4 +157,4 @@ def get_current_price():
         log_event(f"Lỗi lấy giá real-time: {e}")
     
     # Fallback về get_last_close_price nếu lỗi
-    return get_last_close_price()
\ No newline at end of file
+    return get_last_close_price(symbol)
\ No newline at end of file
@@ -1,30 +1,349 @@
+import json
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
 import requests
-from config import GEMINI_API_KEY, GEMINI_API_URL
+from metrics import STAGE_SECONDS, GEMINI_CACHE, GEMINI_EMPTY_RESPONSES, GEMINI_REQUEST_SECONDS, GEMINI_DECISIONS, GEMINI_TOKENS, timed
+from metrics import GEMINI_BATCH_SIZE
+from config import (
+    GEMINI_API_KEY, GEMINI_API_URL, GEMINI_CACHE_TTL, GEMINI_CACHE_SIZE,
+    GEMINI_CACHE_RSI_BUCKET, GEMINI_CACHE_ATR_BUCKET, GEMINI_CACHE_CONFIDENCE_BUCKET,
+    GEMINI_API_URLS, GEMINI_DEADLINE, GEMINI_HEDGE, GEMINI_HEDGE_QUANTILE, GEMINI_HEDGE_MIN_DELAY, GEMINI_WORKERS,
+    GEMINI_JSON_OUTPUT, GEMINI_BATCH, GEMINI_BATCH_WINDOW, GEMINI_BATCH_MAX, SYMBOLS,
+)
+from signal_evaluator import SIGNAL_SCHEMA, BATCH_SCHEMA, split_batch
+from prompt_builder import system_part, estimate_tokens, batch_block
 
-def analyze(data_text, question):
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "contents": [{
-            "parts": [{"text": f"{data_text}\n\n{question}"}]
-        }]
-    }
-    url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-    
+class LatencyWindow:
+    """Latency gần nhất của một URL model, dùng để chọn thời điểm gửi request hedge."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+_session = requests.Session()
+_pool = ThreadPoolExecutor(max_workers=GEMINI_WORKERS, thread_name_prefix="gemini")
+_latency = {}
+
+def _latency_window(url):
+    window = _latency.get(url)
+    if window is None:
+        window = _latency.setdefault(url, LatencyWindow())
+    return window
+
+def _post(url, payload, timeout):
+    """Một request generateContent; trả text hoặc "" nếu lỗi. Latency ghi theo URL model
+    (histogram nhận mọi request, cửa sổ p95 cho hedge chỉ nhận phản hồi 200)."""
+    from logger import log_event
+    started = time.perf_counter()
+    ok = False
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = _session.post(f"{url}?key={GEMINI_API_KEY}", json=payload, timeout=timeout)
         if response.status_code == 200:
+            ok = True
             result = response.json()
+            _record_usage(url, result.get("usageMetadata"))
             if "candidates" in result and len(result["candidates"]) > 0:
                 return result["candidates"][0]["content"]["parts"][0]["text"]
             else:
-                from logger import log_event
                 log_event(f"Gemini API không trả về candidates: {result}")
+                GEMINI_EMPTY_RESPONSES.inc(reason="no_candidates")
                 return ""
         else:
-            from logger import log_event
             log_event(f"Gemini API lỗi: {response.status_code} - {response.text}")
+            GEMINI_EMPTY_RESPONSES.inc(reason="http_error")
             return ""
     except Exception as e:
-        from logger import log_event
         log_event(f"Lỗi khi gọi Gemini API: {e}")
-        return ""
\ No newline at end of file
+        GEMINI_EMPTY_RESPONSES.inc(reason="exception")
+        return ""
+    finally:
+        elapsed = time.perf_counter() - started
+        if ok:
+            # Lỗi nhanh (500, connection refused) không được kéo p95 xuống làm hedge bắn sớm
+            _latency_window(url).add(elapsed)
+        GEMINI_REQUEST_SECONDS.observe(elapsed, url=url)
+
+def _record_usage(url, usage):
+    """Token thực tế theo usageMetadata của Gemini (cached = phần prefix tĩnh được cache ngầm)."""
+    if not usage:
+        return
+    prompt = usage.get("promptTokenCount", 0)
+    cached = usage.get("cachedContentTokenCount", 0)
+    output = usage.get("candidatesTokenCount", 0)
+    GEMINI_TOKENS.inc(prompt - cached, kind="prompt")
+    GEMINI_TOKENS.inc(cached, kind="cached")
+    GEMINI_TOKENS.inc(output, kind="output")
+    from logger import log_event
+    log_event(f"Gemini token: prompt {prompt} (cached {cached}), output {output}", level="DEBUG", url=url)
+
+def hedge_delay(url):
+    """Chờ bao lâu trước khi gửi request thứ hai: p95 latency của URL (tối thiểu GEMINI_HEDGE_MIN_DELAY)."""
+    delay = _latency_window(url).quantile(GEMINI_HEDGE_QUANTILE)
+    return max(GEMINI_HEDGE_MIN_DELAY, delay) if delay is not None else GEMINI_HEDGE_MIN_DELAY
+
+def request_decision(data_text, question, deadline=GEMINI_DEADLINE, hedge=None, urls=None, system=None, schema=None):
+    """Gọi Gemini trên thread pool với hạn chót cứng; trả (text, source).
+
+    source: "primary"/"hedge" (request nào về trước), "error" (mọi request lỗi) hoặc "deadline"
+    (quá `deadline` giây chưa có trả lời; request còn treo bị bỏ, timeout HTTP là phần deadline còn lại).
+    Nếu request đầu chưa về sau p95 latency của URL đó (hoặc lỗi sớm) thì gửi thêm một request
+    tới URL kế tiếp trong GEMINI_API_URLS (hoặc chính URL đó). system/schema mặc định là luật và
+    SIGNAL_SCHEMA của một symbol (batch truyền luật batch + BATCH_SCHEMA).
+    """
+    urls = urls or GEMINI_API_URLS
+    hedge = GEMINI_HEDGE if hedge is None else hedge
+    system = system or system_part(GEMINI_JSON_OUTPUT)
+    if schema is None and GEMINI_JSON_OUTPUT:
+        schema = SIGNAL_SCHEMA
+    text = f"{data_text}\n\n{question}" if question else data_text
+    payload = {
+        # Luật chiến lược tĩnh: cùng một prefix mọi request, chỉ khối thị trường thay đổi
+        "systemInstruction": system,
+        "contents": [{
+            "parts": [{"text": text}]
+        }]
+    }
+    from logger import log_event
+    log_event(f"Gemini prompt ~{estimate_tokens(system['parts'][0]['text'])} token tĩnh + "
+              f"~{estimate_tokens(text)} token thị trường", level="DEBUG")
+    if schema:
+        # Ép Gemini trả JSON đúng schema, parse_signal chỉ cần một lần json.loads
+        payload["generationConfig"] = {"responseMimeType": "application/json", "responseSchema": schema}
+    started = time.monotonic()
+
+    def timeout():
+        # Timeout HTTP = phần còn lại của deadline, request hedge không sống quá hạn chót
+        return max(0.001, deadline - (time.monotonic() - started)) if deadline else 30
+
+    pending = {_pool.submit(_post, urls[0], payload, timeout()): "primary"}
+    hedge_at = started + hedge_delay(urls[0]) if hedge else None
+    while pending:
+        now = time.monotonic()
+        until = started + deadline if deadline else None
+        if hedge_at is not None and (until is None or hedge_at < until):
+            until = hedge_at
+        done, _ = wait(pending, timeout=None if until is None else max(0.0, until - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            source = pending.pop(future)
+            text = future.result()
+            if text:
+                return text, source
+        if hedge_at is not None and (not pending or time.monotonic() >= hedge_at):
+            # Request đầu chậm hơn p95 (hoặc đã lỗi): gửi request hedge, lấy cái nào về trước
+            hedge_at = None
+            pending[_pool.submit(_post, urls[1 % len(urls)], payload, timeout())] = "hedge"
+            continue
+        if deadline and time.monotonic() - started >= deadline:
+            return "", "deadline"
+    return "", "error"
+
+@timed(STAGE_SECONDS, stage="gemini")
+def analyze(data_text, question, deadline=GEMINI_DEADLINE):
+    text, source = request_decision(data_text, question, deadline)
+    GEMINI_DECISIONS.inc(source=source)
+    if source == "deadline":
+        from logger import log_event
+        log_event(f"Gemini quá hạn {deadline}s, bỏ qua phản hồi", level="WARNING")
+    return text
+
+class BatchAnalyzer:
+    """Gom các symbol cùng hỏi Gemini trong một chu kỳ thành một request: luật gửi một lần,
+    khối thị trường của mọi symbol nối sau, Gemini trả mảng JSON chia lại cho từng symbol.
+
+    Symbol đầu tiên của một đợt làm leader: chờ tối đa `window` giây (hoặc tới khi đủ `max_size`
+    symbol) rồi gửi; các symbol khác chỉ chờ Future của mình. Lịch theo nến đóng làm mọi symbol
+    thức cùng lúc nên đợt thường đầy ngay, window chỉ là giới hạn trên.
+    """
+
+    def __init__(self, window=GEMINI_BATCH_WINDOW, max_size=GEMINI_BATCH_MAX or max(1, len(SYMBOLS))):
+        self.window = window
+        self.max_size = max_size
+        self._pending = {}
+        self._cond = threading.Condition()
+
+    def request(self, symbol, data_text, deadline=GEMINI_DEADLINE):
+        """(text, source) như request_decision; text là JSON quyết định riêng của symbol."""
+        started = time.monotonic()
+        with self._cond:
+            leader = not self._pending
+            if symbol in self._pending:
+                # Symbol hỏi lại khi đợt chưa gửi: dùng khối thị trường mới, chung Future
+                future = self._pending[symbol][1]
+            else:
+                future = Future()
+            self._pending[symbol] = (data_text, future)
+            if len(self._pending) >= self.max_size:
+                self._cond.notify_all()
+            if leader:
+                self._cond.wait_for(lambda: len(self._pending) >= self.max_size, timeout=self.window)
+                batch, self._pending = self._pending, {}
+        if leader:
+            remaining = deadline - (time.monotonic() - started) if deadline else None
+            self._send(batch, max(0.001, remaining) if remaining is not None else None)
+        try:
+            return future.result(timeout=max(0.0, deadline - (time.monotonic() - started)) if deadline else None)
+        except FutureTimeout:
+            return "", "deadline"
+
+    def _send(self, batch, deadline):
+        """Leader gửi đợt; lỗi bất kỳ vẫn trả ("", "error") cho mọi Future chưa có kết quả, nếu không
+        follower treo tới deadline (hoặc mãi mãi khi GEMINI_DEADLINE=0)."""
+        try:
+            self._dispatch(batch, deadline)
+        except Exception as e:
+            from logger import log_event
+            log_event(f"Lỗi gửi Gemini batch {len(batch)} symbol: {e}", level="ERROR")
+            GEMINI_EMPTY_RESPONSES.inc(reason="exception")
+        finally:
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_result(("", "error"))
+
+    def _dispatch(self, batch, deadline):
+        GEMINI_BATCH_SIZE.observe(len(batch))
+        if len(batch) == 1:
+            # Chỉ một symbol: prompt/schema thường, không cần mảng
+            (data_text, future), = batch.values()
+            future.set_result(request_decision(data_text, "", deadline))
+            return
+        blocks = {symbol: data_text for symbol, (data_text, _) in batch.items()}
+        text, source = request_decision(batch_block(blocks), "", deadline,
+                                        system=system_part(True, batch=True), schema=BATCH_SCHEMA)
+        decisions = split_batch(text) if text else {}
+        from logger import log_event
+        log_event(f"Gemini batch {len(batch)} symbol ({source}): {len(decisions)} quyết định", level="DEBUG")
+        for symbol, (_, future) in batch.items():
+            item = decisions.get(symbol.upper())
+            if item is not None:
+                future.set_result((json.dumps(item, ensure_ascii=False), source))
+            elif text:
+                GEMINI_EMPTY_RESPONSES.inc(reason="batch_missing")
+                future.set_result(("", "error"))
+            else:
+                future.set_result(("", source))
+
+_batcher = BatchAnalyzer()
+
+class AnalysisCache:
+    """Cache LRU + TTL cho phản hồi Gemini, có bộ đếm hit/miss/eviction để chỉnh độ rộng bucket."""
+
+    def __init__(self, max_size=GEMINI_CACHE_SIZE, ttl=GEMINI_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+analysis_cache = AnalysisCache()
+
+def _bucket(value, width):
+    if value is None or math.isnan(value):
+        return None
+    return int(value // width)
+
+def quantize_market_state(snapshot, symbol):
+    """Key cache: trạng thái thị trường đã lượng tử hóa (RSI, trend, ATR% giá, confidence, trend khung lớn)."""
+    return (
+        symbol,
+        _bucket(snapshot["rsi"], GEMINI_CACHE_RSI_BUCKET),
+        snapshot["trend"],
+        _bucket(snapshot["volatility"], GEMINI_CACHE_ATR_BUCKET),
+        _bucket(snapshot["confidence"], GEMINI_CACHE_CONFIDENCE_BUCKET),
+        snapshot.get("htf_trend", ()),
+    )
+
+def analyze_cached(data_text, question, snapshot, symbol, deadline=GEMINI_DEADLINE, fallback=True):
+    """Như analyze(), nhưng dùng lại quyết định trước đó nếu thị trường gần như không đổi;
+    Gemini quá GEMINI_DEADLINE hoặc lỗi thì dùng quyết định của rule_engine (fallback=False: trả "").
+
+    SL/TP trong phản hồi cache là giá tuyệt đối; validate_sl_tp/place_order vẫn chỉnh lại
+    theo giá real-time, nên TTL nên giữ ngắn (vài phút).
+    """
+    key = quantize_market_state(snapshot, symbol)
+    if GEMINI_CACHE_TTL > 0:
+        cached = analysis_cache.get(key)
+        if cached is not None:
+            GEMINI_CACHE.inc(result="hit")
+            from logger import log_event
+            log_event(f"Gemini cache hit {key}")
+            return cached
+        GEMINI_CACHE.inc(result="miss")
+    result, from_gemini = _analyze_or_fallback(data_text, question, snapshot, deadline, fallback, symbol)
+    if result and from_gemini and GEMINI_CACHE_TTL > 0:
+        analysis_cache.put(key, result)
+    return result
+
+@timed(STAGE_SECONDS, stage="gemini")
+def _analyze_or_fallback(data_text, question, snapshot, deadline=GEMINI_DEADLINE, fallback=True, symbol=None):
+    """Như analyze(), nhưng quá hạn chót hoặc mọi URL đều lỗi thì quyết định bằng rule_engine trên cùng
+    snapshot (quyết định fallback không được cache: lần sau vẫn hỏi Gemini). Trả (text, có phải từ Gemini).
+    GEMINI_BATCH: request được gộp với các symbol khác đang hỏi cùng lúc (BatchAnalyzer)."""
+    if GEMINI_BATCH and symbol:
+        text, source = _batcher.request(symbol, f"{data_text}\n\n{question}" if question else data_text, deadline)
+    else:
+        text, source = request_decision(data_text, question, deadline)
+    if source in ("deadline", "error"):
+        from logger import log_event
+        problem = f"quá hạn {deadline}s" if source == "deadline" else "lỗi ở mọi URL"
+        if fallback:
+            import rule_engine
+            GEMINI_DECISIONS.inc(source="fallback")
+            log_event(f"Gemini {problem}, dùng quyết định theo luật", level="WARNING")
+            return rule_engine.decide(snapshot), False
+        log_event(f"Gemini {problem}, bỏ qua phản hồi", level="WARNING")
+    GEMINI_DECISIONS.inc(source=source)
+    return text, True
+
+def cache_stats():
+    return analysis_cache.stats()
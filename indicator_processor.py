@@ -1,12 +1,22 @@
+import math
+import threading
+from collections import deque
+import numpy as np
 import pandas as pd
+from klines import KlineColumns, FIELDS
+from prompt_builder import market_block
 
 def calculate_indicators(data):
-    df = pd.DataFrame(data)
-    df["close"] = df["close"].astype(float)
-    df["open"] = df["open"].astype(float)
-    df["high"] = df["high"].astype(float)
-    df["low"] = df["low"].astype(float)
-    df["volume"] = df["volume"].astype(float)
+    if isinstance(data, KlineColumns):
+        # Cột đã là float64, không cần astype từng cột
+        df = pd.DataFrame(data.to_ohlcv(), columns=list(FIELDS))
+    else:
+        df = pd.DataFrame(data)
+        df["close"] = df["close"].astype(float)
+        df["open"] = df["open"].astype(float)
+        df["high"] = df["high"].astype(float)
+        df["low"] = df["low"].astype(float)
+        df["volume"] = df["volume"].astype(float)
     
     # RSI (sửa lại công thức chính xác)
     delta = df["close"].diff()
@@ -30,6 +40,14 @@ def calculate_indicators(data):
     
     return df
 
+def calculate_atr(df, period=14):
+    """ATR (trung bình true range) dạng Series"""
+    high_low = df["high"] - df["low"]
+    high_close = abs(df["high"] - df["close"].shift())
+    low_close = abs(df["low"] - df["close"].shift())
+    true_range = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
+    return true_range.rolling(window=period).mean()
+
 def calculate_dynamic_levels(current_price, atr, volatility_factor=1.5):
     """Tính toán TP/SL động dựa trên ATR và volatility"""
     # SL: 1.5-2x ATR
@@ -41,42 +59,44 @@ def calculate_dynamic_levels(current_price, atr, volatility_factor=1.5):
 
 def calculate_market_confidence(df):
     """Tính độ tin cậy của tín hiệu thị trường (0-100)"""
-    current_price = df["close"].iloc[-1]
-    rsi = df["rsi"].iloc[-1]
-    ema20 = df["ema20"].iloc[-1]
-    ema50 = df["ema50"].iloc[-1]
-    macd = df["macd"].iloc[-1]
-    macd_signal = df["macd_signal"].iloc[-1]
-    
-    confidence = 50  # Base confidence
-    
-    # RSI confirmation
-    if 30 < rsi < 70:
-        confidence += 10  # Neutral RSI is good
-    elif rsi > 80 or rsi < 20:
-        confidence -= 15  # Extreme RSI is risky
-    
-    # Trend confirmation
-    if current_price > ema20 > ema50:
-        confidence += 15  # Strong uptrend
-    elif current_price < ema20 < ema50:
-        confidence += 15  # Strong downtrend
-    else:
-        confidence -= 10  # Sideways/unclear trend
-    
+    return score_confidence(
+        df["close"].iloc[-1],
+        df["rsi"].iloc[-1],
+        df["ema20"].iloc[-1],
+        df["ema50"].iloc[-1],
+        df["macd"].iloc[-1],
+        df["macd_signal"].iloc[-1],
+        df["volume"].iloc[-3:].mean(),
+        df["volume"].mean(),
+    )
+
+def confidence_scores(current_price, rsi, ema20, ema50, macd, macd_signal, recent_volume, avg_volume):
+    """Chấm điểm confidence vector hóa: nhận scalar hoặc mảng cùng shape (nhiều symbol, cả chuỗi backtest)"""
+    current_price, rsi, ema20, ema50 = map(np.asarray, (current_price, rsi, ema20, ema50))
+    confidence = np.full(np.broadcast(current_price, rsi).shape, 50)  # Base confidence
+
+    # RSI confirmation: trung tính là tốt, quá mua/quá bán là rủi ro
+    confidence += np.where((rsi > 30) & (rsi < 70), 10, np.where((rsi > 80) | (rsi < 20), -15, 0))
+
+    # Trend confirmation: uptrend/downtrend rõ ràng, ngược lại là sideway
+    up = (current_price > ema20) & (ema20 > ema50)
+    down = (current_price < ema20) & (ema20 < ema50)
+    confidence += np.where(up | down, 15, -10)
+
     # MACD confirmation
-    if abs(macd - macd_signal) > 50:
-        confidence += 10  # Strong MACD signal
-    
+    confidence += np.where(np.abs(np.asarray(macd) - macd_signal) > 50, 10, 0)
+
     # Volume confirmation
-    recent_volume = df["volume"].iloc[-3:].mean()
-    avg_volume = df["volume"].mean()
-    if recent_volume > avg_volume * 1.2:
-        confidence += 5  # High volume confirms signal
-    
-    return max(0, min(100, confidence))
+    confidence += np.where(np.asarray(recent_volume) > np.asarray(avg_volume) * 1.2, 5, 0)
 
-def format_for_gemini(df, balance, trade_amount, leverage):
+    return np.clip(confidence, 0, 100)
+
+def score_confidence(current_price, rsi, ema20, ema50, macd, macd_signal, recent_volume, avg_volume):
+    """Confidence của một nến (dùng chung cho pandas và IndicatorState)"""
+    return int(confidence_scores(current_price, rsi, ema20, ema50, macd, macd_signal, recent_volume, avg_volume))
+
+def market_snapshot(df):
+    """Các giá trị thị trường mới nhất dùng cho prompt Gemini (và làm key cache)"""
     current_price = df["close"].iloc[-1]
     rsi = df["rsi"].iloc[-1]
     ema20 = df["ema20"].iloc[-1]
@@ -85,11 +105,7 @@ def format_for_gemini(df, balance, trade_amount, leverage):
     macd_signal = df["macd_signal"].iloc[-1]
     
     # Tính ATR và volatility
-    high_low = df["high"] - df["low"]
-    high_close = abs(df["high"] - df["close"].shift())
-    low_close = abs(df["low"] - df["close"].shift())
-    true_range = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-    atr = true_range.rolling(window=14).mean().iloc[-1]
+    atr = calculate_atr(df).iloc[-1]
     
     # Tính volatility percentage
     volatility = (atr / current_price) * 100
@@ -105,51 +121,217 @@ def format_for_gemini(df, balance, trade_amount, leverage):
     confidence = calculate_market_confidence(df)
     
     # Xác định trend ngắn hạn
-    trend = "tăng" if current_price > ema20 and ema20 > ema50 else "giảm" if current_price < ema20 and ema20 < ema50 else "sideway"
+    trend = classify_trend(current_price, ema20, ema50)
     
-    # Prompt cho HIGH PROFIT AGGRESSIVE TRADING 🚀
-    text = (
-        f"BTC: {current_price:.1f} | RSI: {rsi:.0f} | Trend: {trend} | ATR: {atr:.1f}\n"
-        f"EMA20: {ema20:.1f} | EMA50: {ema50:.1f} | MACD: {macd:.2f}\n"
-        f"5min change: {price_change_5m:+.2f}% | Volume: {volume_trend}\n"
-        f"Volatility: {volatility:.2f}% | Confidence: {confidence}/100\n"
-        f"DEMO ACCOUNT | Available: 1000$ | TARGET: 90-200% PROFIT 🚀\n"
-        f"ATR-based SL: ±{sl_distance:.1f} | TP: ±{tp_distance:.1f}\n\n"
-        
-        f"🚀 AGGRESSIVE HIGH-PROFIT STRATEGY:\n"
-        f"- Target 90-200% profit per successful trade\n"
-        f"- Use maximum leverage 100-125x for explosive gains\n"
-        f"- Wider TP targets: 0.8-2.0% (for massive profits)\n"
-        f"- Tight SL: 0.1-0.2% (control risk with extreme leverage)\n"
-        f"- Look for strong breakouts and momentum\n\n"
-        
-        f"💎 LEVERAGE & AMOUNT RULES:\n"
-        f"- Very high confidence (>85): Use 80-100$ with 125x leverage\n"
-        f"- High confidence (75-85): Use 60-80$ with 100-110x leverage\n"
-        f"- Medium confidence (60-75): Use 40-60$ with 80-90x leverage\n"
-        f"- Low confidence (40-60): Use 20-40$ with 50-70x leverage\n"
-        f"- Very low confidence (<40): HOLD - wait for better setup\n\n"
-        
-        f"🎯 HIGH-PROFIT TARGETS:\n"
-        f"- Breakout trades: TP = 1.5-2.0% (150-250% profit với 125x)\n"
-        f"- Momentum trades: TP = 1.0-1.5% (125-190% profit)\n"
-        f"- Reversal trades: TP = 0.8-1.2% (100-150% profit)\n"
-        f"- Scalp trades: TP = 0.5-0.8% (60-100% profit)\n"
-        f"- Always SL = 0.1-0.2% (max 20-25% loss với 125x)\n\n"
-        
-        f"⚡ AGGRESSIVE ENTRY SIGNALS:\n"
-        f"- Strong volume spike + price breakout = MAX LEVERAGE\n"
-        f"- RSI extreme bounce (20→40 or 80→60) = AGGRESSIVE ENTRY\n"
-        f"- MACD explosive cross = FULL POSITION\n"
-        f"- EMA20 break with momentum = HIGH LEVERAGE\n"
-        f"- Multiple confirmations = 125x LEVERAGE\n\n"
-        
-        f"🔥 RESPONSE FORMAT:\n"
-        f"Signal: [buy/sell/hold]\n"
-        f"Amount: [20-100 USD]\n"
-        f"Leverage: [50-125]\n"
-        f"SL: [tight price, 0.1-0.2% away for risk control]\n"
-        f"TP: [aggressive target, 0.5-2.0% away for high profit]\n"
-        f"Reason: [breakout/momentum/reversal + confidence level + profit target]"
-    )
-    return text
+    return {
+        "close": current_price,
+        "rsi": rsi,
+        "ema20": ema20,
+        "ema50": ema50,
+        "macd": macd,
+        "macd_signal": macd_signal,
+        "atr": atr,
+        "volatility": volatility,
+        "price_change_5m": price_change_5m,
+        "volume_trend": volume_trend,
+        "sl_distance": sl_distance,
+        "tp_distance": tp_distance,
+        "confidence": confidence,
+        "trend": trend,
+    }
+
+def classify_trend(current_price, ema20, ema50):
+    """Xác định trend ngắn hạn từ giá và EMA20/EMA50"""
+    return "tăng" if current_price > ema20 and ema20 > ema50 else "giảm" if current_price < ema20 and ema20 < ema50 else "sideway"
+
+def format_for_gemini(df, balance, trade_amount, leverage, symbol="BTC-USDT", snapshot=None, timeframes=None):
+    """Khối thị trường gửi Gemini; luật chiến lược tĩnh nằm trong prompt_builder.system_instruction()
+    và đi qua systemInstruction nên không dựng lại mỗi chu kỳ."""
+    return market_block(snapshot or market_snapshot(df), symbol, timeframes)
+
+class IndicatorState:
+    """Tính RSI/EMA/MACD/ATR tăng dần: mỗi nến mới O(1), cho kết quả như calculate_indicators
+    chạy trên cùng chuỗi nến (volume trung bình lấy trên volume_window nến gần nhất)."""
+
+    def __init__(self, rsi_period=14, atr_period=14, volume_window=20):
+        self.volume_window = volume_window
+        self.count = 0
+        self.time = None
+        self.open = self.high = self.low = self.close = self.volume = None
+        self.prev_close = None
+        self.ema20 = self.ema50 = self.ema12 = self.ema26 = None
+        self.macd = self.macd_signal = self.macd_histogram = None
+        self.gains = deque(maxlen=rsi_period)
+        self.losses = deque(maxlen=rsi_period)
+        self.true_ranges = deque(maxlen=atr_period)
+        self.closes = deque(maxlen=6)
+        self.volumes = deque(maxlen=volume_window)
+        self._undo = None
+
+    @classmethod
+    def from_klines(cls, data, **kwargs):
+        state = cls(**kwargs)
+        state.sync(data)
+        return state
+
+    def sync(self, data):
+        """Nạp list nến (REST hoặc stream): nến mới thì update, nến đang chạy thì replace_last."""
+        for candle in data:
+            candle_time = _candle_time(candle)
+            if self.count and candle_time is not None and candle_time == self.time:
+                self.replace_last(candle)
+            elif not self.count or candle_time is None or candle_time > self.time:
+                self.update(candle)
+        return self
+
+    def update(self, candle):
+        """Thêm một nến đã đóng (hoặc nến mới bắt đầu)."""
+        o, h, l, c, v, t = _candle_values(candle)
+        # Lưu đủ thông tin để hoàn tác đúng một nến (replace_last), không copy deque
+        deques = (self.gains, self.losses, self.true_ranges, self.closes, self.volumes)
+        self._undo = (
+            self.count, self.time, self.open, self.high, self.low, self.close, self.volume,
+            self.prev_close, self.ema20, self.ema50, self.ema12, self.ema26,
+            self.macd, self.macd_signal, self.macd_histogram,
+            tuple(d[0] if len(d) == d.maxlen else None for d in deques),
+        )
+
+        prev_close = self.close
+        if prev_close is None:
+            gain = loss = 0.0
+            true_range = h - l
+        else:
+            delta = c - prev_close
+            gain = delta if delta > 0 else 0.0
+            loss = -delta if delta < 0 else 0.0
+            true_range = max(h - l, abs(h - prev_close), abs(l - prev_close))
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.true_ranges.append(true_range)
+        self.closes.append(c)
+        self.volumes.append(v)
+
+        self.ema20 = _ema(self.ema20, c, 20)
+        self.ema50 = _ema(self.ema50, c, 50)
+        self.ema12 = _ema(self.ema12, c, 12)
+        self.ema26 = _ema(self.ema26, c, 26)
+        self.macd = self.ema12 - self.ema26
+        self.macd_signal = _ema(self.macd_signal, self.macd, 9)
+        self.macd_histogram = self.macd - self.macd_signal
+
+        self.prev_close = prev_close
+        self.open, self.high, self.low, self.close, self.volume, self.time = o, h, l, c, v, t
+        self.count += 1
+        return self
+
+    def replace_last(self, candle):
+        """Cập nhật nến cuối (nến 1m đang chạy) mà không tính lại toàn bộ chuỗi."""
+        if self._undo is None:
+            return self.update(candle)
+        (self.count, self.time, self.open, self.high, self.low, self.close, self.volume,
+         self.prev_close, self.ema20, self.ema50, self.ema12, self.ema26,
+         self.macd, self.macd_signal, self.macd_histogram, dropped) = self._undo
+        for d, value in zip((self.gains, self.losses, self.true_ranges, self.closes, self.volumes), dropped):
+            d.pop()
+            if value is not None:
+                d.appendleft(value)
+        return self.update(candle)
+
+    @property
+    def rsi(self):
+        avg_gain = math.fsum(self.gains) / len(self.gains)
+        avg_loss = math.fsum(self.losses) / len(self.losses)
+        if avg_loss == 0:
+            return 100.0 if avg_gain > 0 else float("nan")
+        return 100 - (100 / (1 + avg_gain / avg_loss))
+
+    @property
+    def atr(self):
+        if len(self.true_ranges) < self.true_ranges.maxlen:
+            return float("nan")
+        return math.fsum(self.true_ranges) / len(self.true_ranges)
+
+    @property
+    def confidence(self):
+        recent = list(self.volumes)[-3:]
+        return score_confidence(
+            self.close, self.rsi, self.ema20, self.ema50, self.macd, self.macd_signal,
+            math.fsum(recent) / len(recent), math.fsum(self.volumes) / len(self.volumes),
+        )
+
+    def snapshot(self):
+        """Giá trị indicator mới nhất (cùng tên cột với DataFrame của calculate_indicators)."""
+        closes = self.closes
+        recent_volumes = list(self.volumes)[-5:]
+        sl_distance, tp_distance = calculate_dynamic_levels(self.close, self.atr)
+        return {
+            "time": self.time,
+            "close": self.close,
+            "rsi": self.rsi,
+            "ema20": self.ema20,
+            "ema50": self.ema50,
+            "macd": self.macd,
+            "macd_signal": self.macd_signal,
+            "macd_histogram": self.macd_histogram,
+            "atr": self.atr,
+            "confidence": self.confidence,
+            "trend": classify_trend(self.close, self.ema20, self.ema50),
+            "volatility": self.atr / self.close * 100,
+            "price_change_5m": (self.close - closes[0]) / closes[0] * 100 if len(closes) == 6 else float("nan"),
+            "volume_trend": "tăng" if self.volume > math.fsum(recent_volumes) / len(recent_volumes) else "giảm",
+            "sl_distance": sl_distance,
+            "tp_distance": tp_distance,
+        }
+
+class StreamIndicators:
+    """IndicatorState của một symbol, cập nhật theo từng push kline của MarketStream (listener).
+
+    Mỗi push chỉ tốn O(1); khi nến bị hổng (reconnect, stream nạp lại buffer) thì dựng lại từ buffer.
+    Indicator chạy trên mọi nến từ lúc nạp chứ không theo cửa sổ KLINE_LIMIT, nên warm-up EMA
+    hơi khác kline_snapshot (và sát chuỗi đầy đủ hơn).
+    """
+
+    def __init__(self, stream, interval_ms=60000, **kwargs):
+        self.stream = stream
+        self.interval_ms = interval_ms
+        self.kwargs = kwargs
+        self.state = None
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        self.state = IndicatorState.from_klines(self.stream.get_candles(), **self.kwargs)
+
+    def on_candle(self, symbol, candle, new_candle):
+        with self._lock:
+            if self.state is None or not self.state.count or candle["time"] - self.state.time > self.interval_ms:
+                self._rebuild()
+            else:
+                self.state.sync([candle])
+
+    def snapshot(self, min_candles=1):
+        """Giá trị indicator mới nhất, None nếu chưa đủ min_candles nến."""
+        with self._lock:
+            if self.state is None:
+                self._rebuild()
+            if self.state.count < min_candles:
+                return None
+            return self.state.snapshot()
+
+def _ema(previous, value, span):
+    if previous is None:
+        return value
+    alpha = 2 / (span + 1)
+    return (1 - alpha) * previous + alpha * value
+
+def _candle_time(candle):
+    if isinstance(candle, dict):
+        return int(candle["time"]) if "time" in candle else None
+    return int(candle[0])
+
+def _candle_values(candle):
+    if isinstance(candle, dict):
+        return (float(candle["open"]), float(candle["high"]), float(candle["low"]),
+                float(candle["close"]), float(candle["volume"]), int(candle.get("time", 0)))
+    # Dạng list: [time, open, high, low, close, volume]
+    return (float(candle[1]), float(candle[2]), float(candle[3]),
+            float(candle[4]), float(candle[5]), int(candle[0]))
@@ -0,0 +1,144 @@
+"""Kho kline trên đĩa: mỗi (symbol, interval) là một thư mục, mỗi cột một file nhị phân append-only.
+
+    kline_store/BTC-USDT/1m/time.bin   (int64, ms)
+    kline_store/BTC-USDT/1m/open.bin   (float64) ... close.bin, volume.bin
+
+Đọc bằng np.memmap nên lấy N nến cuối là slice không copy. sync() chỉ tải các nến có
+time >= nến cuối đã lưu (nến cuối có thể còn đang chạy nên được ghi đè tại chỗ); file không
+bao giờ bị cắt ngắn nên các memmap đang được thread khác đọc luôn hợp lệ.
+"""
+import os
+import time
+import threading
+import numpy as np
+from klines import KlineColumns, FIELDS, INTERVAL_MS
+from logger import log_event
+
+COLUMNS = ("time",) + FIELDS
+DTYPES = {column: np.int64 if column == "time" else np.float64 for column in COLUMNS}
+RECORD_BYTES = 8
+# Số nến tối đa mỗi request khi đồng bộ (BingX cho tối đa 1440)
+SYNC_PAGE = 1000
+
+class KlineSeries:
+    """Chuỗi nến của một (symbol, interval) trên đĩa."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = {column: os.path.join(directory, f"{column}.bin") for column in COLUMNS}
+        for path in self.paths.values():
+            open(path, "ab").close()
+        self._lock = threading.Lock()
+        self._maps = None
+        self._mapped_len = 0
+
+    def __len__(self):
+        return os.path.getsize(self.paths["time"]) // RECORD_BYTES
+
+    def last_time(self):
+        length = len(self)
+        if not length:
+            return None
+        with open(self.paths["time"], "rb") as f:
+            f.seek((length - 1) * RECORD_BYTES)
+            return int(np.frombuffer(f.read(RECORD_BYTES), dtype=np.int64)[0])
+
+    def write(self, klines):
+        """Ghi nến mới: nến trùng time với nến cuối thì ghi đè, nến cũ hơn thì bỏ qua."""
+        if not len(klines):
+            return 0
+        times = np.asarray(klines.time, dtype=np.int64)
+        with self._lock:
+            length = len(self)
+            last = self.last_time()
+            first = 0
+            offset = length
+            if last is not None:
+                first = int(np.searchsorted(times, last))
+                if first < len(times) and times[first] == last:
+                    offset = length - 1
+                elif first == len(times):
+                    return 0
+            for column in COLUMNS:
+                values = np.asarray(getattr(klines, column), dtype=DTYPES[column])[first:]
+                with open(self.paths[column], "r+b") as f:
+                    f.seek(offset * RECORD_BYTES)
+                    f.write(values.tobytes())
+            self._maps = None
+            return len(times) - first
+
+    def read(self, limit=None):
+        """limit nến cuối dạng KlineColumns trỏ thẳng vào memmap (không copy)."""
+        with self._lock:
+            length = len(self)
+            if not length:
+                return KlineColumns()
+            if self._maps is None or self._mapped_len != length:
+                self._maps = {
+                    column: np.memmap(path, dtype=DTYPES[column], mode="r", shape=(length,))
+                    for column, path in self.paths.items()
+                }
+                self._mapped_len = length
+            start = max(0, length - limit) if limit else 0
+            return KlineColumns(*(self._maps[column][start:] for column in COLUMNS))
+
+class KlineStore:
+    """Quản lý các KlineSeries và đồng bộ tăng dần qua fetch(symbol, interval, limit, start_time)."""
+
+    def __init__(self, root, fetch, backfill=1440):
+        self.root = root
+        self.fetch = fetch
+        self.backfill = backfill
+        self._series = {}
+        self._sync_locks = {}
+        self._lock = threading.Lock()
+
+    def series(self, symbol, interval):
+        key = (symbol, interval)
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = KlineSeries(os.path.join(self.root, symbol, interval))
+                self._sync_locks[key] = threading.Lock()
+            return self._series[key]
+
+    def sync(self, symbol, interval):
+        """Tải các nến từ nến cuối đã lưu tới hiện tại (lần đầu: backfill nến gần nhất)."""
+        series = self.series(symbol, interval)
+        step = INTERVAL_MS[interval]
+        with self._sync_locks[(symbol, interval)]:
+            now = int(time.time() * 1000)
+            start = series.last_time()
+            if start is None:
+                start = (now // step - self.backfill + 1) * step
+            written = 0
+            while True:
+                needed = (now - start) // step + 1
+                batch = self.fetch(symbol, interval, min(SYNC_PAGE, needed), start)
+                if not len(batch):
+                    break
+                written += series.write(batch)
+                if needed <= SYNC_PAGE or batch.time[-1] <= start:
+                    break
+                start = int(batch.time[-1])
+            return written
+
+    def read(self, symbol, interval, limit=None):
+        return self.series(symbol, interval).read(limit)
+
+    def sync_and_read(self, symbol, interval, limit, max_age=2):
+        """Đồng bộ rồi đọc limit nến cuối; lỗi mạng thì trả dữ liệu đang có trên đĩa.
+
+        Nến cuối cũ hơn max_age nến (sync lỗi hoặc REST trả non-200) thì trả rỗng để caller
+        fallback REST / bỏ qua chu kỳ thay vì giao dịch trên nến cũ.
+        """
+        try:
+            self.sync(symbol, interval)
+        except Exception as e:
+            log_event(f"Lỗi đồng bộ kline {symbol} {interval}: {e}", level="WARNING")
+        data = self.read(symbol, interval, limit)
+        step = INTERVAL_MS[interval]
+        if len(data) and int(data.time[-1]) <= int(time.time() * 1000) - max_age * step:
+            log_event(f"Kline {symbol} {interval} trên đĩa đã cũ (nến cuối {int(data.time[-1])}), bỏ qua",
+                      level="WARNING")
+            return KlineColumns()
+        return data
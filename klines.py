@@ -0,0 +1,115 @@
+"""Container kline gọn (struct-of-arrays) thay cho list dict / DataFrame trên đường nóng.
+
+Giải mã thẳng từ bytes của response (dùng orjson nếu có cài, không thì json chuẩn),
+chấp nhận cả nến dạng dict {"open", ...} lẫn list [time, open, high, low, close, volume].
+"""
+import json
+from array import array
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+FIELDS = ("open", "high", "low", "close", "volume")
+INTERVAL_MS = {"1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000,
+               "1h": 3600000, "4h": 14400000, "1d": 86400000}
+
+def loads(content):
+    """Parse JSON từ bytes/str bằng parser nhanh nhất đang có."""
+    return _loads(content)
+
+class KlineColumns:
+    """Các cột OHLCV dạng array('d') (time dạng array('q')), theo thứ tự thời gian tăng dần."""
+
+    __slots__ = ("time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, time=None, open=None, high=None, low=None, close=None, volume=None):
+        self.time = time if time is not None else array("q")
+        self.open = open if open is not None else array("d")
+        self.high = high if high is not None else array("d")
+        self.low = low if low is not None else array("d")
+        self.close = close if close is not None else array("d")
+        self.volume = volume if volume is not None else array("d")
+
+    @classmethod
+    def from_candles(cls, candles):
+        """Từ list nến dict (REST v3/stream) hoặc list [time, o, h, l, c, v]."""
+        if not candles:
+            return cls()
+        if isinstance(candles[0], dict):
+            columns = [array("d", [float(candle[field]) for candle in candles]) for field in FIELDS]
+            times = array("q", [int(candle.get("time", 0)) for candle in candles])
+        else:
+            columns = [array("d", [float(candle[index]) for candle in candles]) for index in range(1, 6)]
+            times = array("q", [int(candle[0]) for candle in candles])
+        # BingX v3 trả nến mới nhất trước; chuẩn hóa về thứ tự thời gian tăng dần
+        if len(times) > 1 and times[0] > times[-1]:
+            times.reverse()
+            for column in columns:
+                column.reverse()
+        return cls(times, *columns)
+
+    @classmethod
+    def from_response(cls, content):
+        """Giải mã body response klines ({"code":0,"data":[...]}) thẳng thành cột."""
+        payload = loads(content)
+        return cls.from_candles(payload.get("data") or [])
+
+    def __len__(self):
+        return len(self.close)
+
+    def tail(self, limit):
+        """limit nến gần nhất."""
+        if not limit or limit >= len(self):
+            return self
+        return KlineColumns(*(getattr(self, name)[-limit:] for name in self.__slots__))
+
+    def last_close(self):
+        return float(self.close[-1]) if len(self.close) else None
+
+    def to_ohlcv(self):
+        """Mảng NumPy (N, 5) theo thứ tự open, high, low, close, volume."""
+        import numpy as np
+        return np.column_stack([np.frombuffer(getattr(self, field), dtype=np.float64) for field in FIELDS])
+
+    def to_candles(self):
+        """Về list dict như REST (cho ring buffer của MarketStream)."""
+        return [
+            {"open": o, "high": h, "low": l, "close": c, "volume": v, "time": t}
+            for t, o, h, l, c, v in zip(self.time, self.open, self.high, self.low, self.close, self.volume)
+        ]
+
+def resample(klines, interval):
+    """Gộp nến 1m thành nến `interval` (5m/15m/1h...) ngay trong process, không cần request riêng.
+
+    Nến gộp cuối cùng có thể đang chạy (giống nến cuối sàn trả về); khung đầu tiên bị thiếu nến
+    đầu khung (lịch sử cắt giữa chừng) thì bỏ đi.
+    """
+    step = INTERVAL_MS[interval]
+    if not len(klines) or step == INTERVAL_MS["1m"]:
+        return klines
+    import numpy as np
+    times = np.asarray(klines.time, dtype=np.int64)
+    first = 0
+    if times[0] % step:
+        boundaries = np.flatnonzero(times // step != times[0] // step)
+        if len(boundaries):
+            first = int(boundaries[0])
+    times = times[first:]
+    buckets = times // step
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    ends = np.append(starts[1:], len(times)) - 1
+    high = np.asarray(klines.high, dtype=np.float64)[first:]
+    low = np.asarray(klines.low, dtype=np.float64)[first:]
+    volume = np.asarray(klines.volume, dtype=np.float64)[first:]
+    return KlineColumns(
+        buckets[starts] * step,
+        np.asarray(klines.open, dtype=np.float64)[first:][starts],
+        np.maximum.reduceat(high, starts),
+        np.minimum.reduceat(low, starts),
+        np.asarray(klines.close, dtype=np.float64)[first:][ends],
+        np.add.reduceat(volume, starts),
+    )
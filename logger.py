@@ -1,4 +1,165 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import itertools
+import threading
 from datetime import datetime
+from config import LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_CONSOLE
 
-def log_event(event):
-    print(f"[{datetime.now()}] {event}") 
\ No newline at end of file
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+# Hàng đợi đầy quá mức này thì bỏ log DEBUG để không chặn luồng đặt lệnh
+DEBUG_DROP_RATIO = 0.8
+
+_context = threading.local()
+_cycle_ids = itertools.count(1)
+
+def set_log_context(symbol=None, cycle_id=None):
+    """Gắn symbol/cycle_id cho mọi log_event của thread hiện tại (mỗi worker xử lý một symbol)."""
+    _context.symbol = symbol
+    _context.cycle_id = cycle_id
+
+def get_log_context():
+    """(symbol, cycle_id) đang gắn cho thread hiện tại (để chuyển sang thread phụ)."""
+    return getattr(_context, "symbol", None), getattr(_context, "cycle_id", None)
+
+def next_cycle_id():
+    return next(_cycle_ids)
+
+class AsyncLogWriter:
+    """Ghi log JSON lines ở thread nền; caller chỉ tốn một lần put vào queue.
+
+    File xoay vòng theo kích thước (trade_log.txt -> trade_log.txt.1 ...), console vẫn in dạng
+    "[thời gian] [symbol] nội dung" như trước.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 queue_size=LOG_QUEUE_SIZE, console=LOG_CONSOLE, min_level=LOG_LEVEL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.console = console
+        self.min_level = LEVELS.get(min_level.upper(), 10)
+        # SimpleQueue (C, không khóa Condition) để put trên luồng đặt lệnh rẻ nhất có thể
+        self.queue = queue.SimpleQueue()
+        self.debug_limit = int(queue_size * DEBUG_DROP_RATIO)
+        self.dropped = 0
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        # submit() chạy trên nhiều thread: `+= 1` không nguyên tử, đếm hụt làm flush() trả về sớm
+        self._count_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, level, event, fields):
+        levelno = LEVELS.get(level, 20)
+        if levelno < self.min_level:
+            return
+        if levelno <= 10 and self.queue.qsize() >= self.debug_limit:
+            with self._count_lock:
+                self.dropped += 1
+            return
+        symbol, cycle_id = get_log_context()
+        record = (time.time(), level, symbol, cycle_id, event, fields)
+        if self._thread is None:
+            self._start()
+        # INFO trở lên không bao giờ bị bỏ (queue không giới hạn cứng, queue_size chỉ áp cho DEBUG)
+        with self._count_lock:
+            self.submitted += 1
+        self.queue.put(record)
+
+    def flush(self, timeout=5):
+        """Chờ writer ghi hết queue (dùng lúc thoát và trong script test)."""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self.written + self.failed < self.submitted and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"[{datetime.now()}] Lỗi ghi log: {e}", file=sys.stderr)
+
+    def _write(self, batch):
+        lines = []
+        console = []
+        for ts, level, symbol, cycle_id, event, fields in batch:
+            stamp = datetime.fromtimestamp(ts)
+            record = {"ts": stamp.isoformat(), "level": level, "symbol": symbol, "cycle_id": cycle_id, "msg": event}
+            if fields:
+                record.update(fields)
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            if self.console:
+                prefix = f"[{symbol}] " if symbol else ""
+                tag = "" if level == "INFO" else f"{level} "
+                console.append(f"[{stamp}] {prefix}{tag}{event}")
+        if console:
+            sys.stdout.write("\n".join(console) + "\n")
+            sys.stdout.flush()
+        if self.path:
+            if self._file is None:
+                self._open()
+            chunk = []
+            chunk_size = 0
+            for line in lines:
+                data = (line + "\n").encode("utf-8")
+                if self.max_bytes and self._size + chunk_size + len(data) > self.max_bytes and self._size + chunk_size:
+                    self._file.write(b"".join(chunk))
+                    self._rotate()
+                    chunk, chunk_size = [], 0
+                chunk.append(data)
+                chunk_size += len(data)
+            self._file.write(b"".join(chunk))
+            self._file.flush()
+            self._size += chunk_size
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+_writer = AsyncLogWriter()
+atexit.register(_writer.flush)
+
+def log_event(event, level="INFO", **fields):
+    """Đưa log vào queue; định dạng và ghi file/console diễn ra ở thread nền."""
+    _writer.submit(level, event, fields)
+
+def flush_logs(timeout=5):
+    _writer.flush(timeout)
+
+def log_stats():
+    return {"written": _writer.written, "dropped": _writer.dropped, "queued": _writer.queue.qsize()}
@@ -1,220 +1,364 @@
 import time
-from data_fetcher import get_last_close_price, get_current_price
+from concurrent.futures import ThreadPoolExecutor
+from data_fetcher import get_current_price
 import os
-from data_fetcher import get_market_data, get_balance
-from indicator_processor import calculate_indicators, format_for_gemini
-from gemini_analyzer import analyze
-from signal_evaluator import parse_signal_sl_tp
-from trade_executor import place_order, is_order_open, set_leverage
-from logger import log_event
-from config import TRADE_AMOUNT, LEVERAGE
-import requests
-from config import BINGX_API_KEY, BINGX_API_SECRET, BINGX_API_URL, SYMBOL
-import hmac
-from hashlib import sha256
-
-def get_sign(api_secret, payload):
-    return hmac.new(api_secret.encode("utf-8"), payload.encode("utf-8"), digestmod=sha256).hexdigest()
-
-def parse_param(params_map):
-    sorted_keys = sorted(params_map)
-    params_str = "&".join(["%s=%s" % (x, params_map[x]) for x in sorted_keys])
-    if params_str != "":
-        return params_str + "&timestamp=" + str(int(time.time() * 1000))
-    else:
-        return "timestamp=" + str(int(time.time() * 1000))
+from data_fetcher import get_timeframes, get_balance, get_live_snapshot
+from indicator_processor import format_for_gemini
+from batch_indicators import kline_snapshot, trend_snapshot
+from gemini_analyzer import analyze_cached
+import rule_engine
+from signal_evaluator import parse_signal, validate_sl_tp
+from trade_executor import place_order, is_order_open, set_leverage, get_open_positions, get_account_balance, resolve_trade_params
+from logger import log_event, get_log_context, set_log_context
+from config import TRADE_AMOUNT, LEVERAGE, TIMEFRAME, STRATEGY_MODE
+from config import SYMBOL, SYMBOLS, SCHEDULER_WORKERS, MARKET_DATA_MODE, ORDER_TRACKING_MODE, ORDER_STREAM_SAFETY_POLL
+from config import PRETRADE_WORKERS, PRICE_MAX_AGE, SCHEDULER_ERROR_DELAY, SCHEDULER_MAX_ERROR_DELAY
+from config import SCHEDULE_MODE, CANDLE_CLOSE_GRACE, TRIGGER_ATR_MULT, TRIGGER_VOLUME_MULT, TRIGGER_COOLDOWN
+from config import ORDER_POLL_INTERVAL, LOW_MARGIN_DELAY
+from scheduler import SymbolScheduler
+from triggers import DecisionTriggers, seconds_to_candle_close
+from metrics import STAGE_SECONDS, ORDERS_SKIPPED, timed
+from symbol_rules import refresh_symbol_rules
+from user_stream import start_user_stream, get_account_store, OPEN_STATUSES
+from bingx_client import get_client
+from state_journal import get_journal, journal_event
 
-def has_open_orders():
+def has_open_orders(symbol=SYMBOL):
     path = '/openApi/swap/v2/trade/openOrders'
     method = "GET"
-    params_map = {"symbol": SYMBOL}
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
-    response = requests.request(method, url, headers=headers)
+    params_map = {"symbol": symbol}
+    response = get_client().request(method, path, params_map)
     if response.status_code == 200:
         data = response.json().get("data", {})
         orders = data.get("orders", [])
         return len(orders) > 0
     return False
 
-def validate_sl_tp(signal, current_price, sl, tp):
-    """Kiểm tra và tự động điều chỉnh SL/TP với giá hiện tại"""
-    adjusted_sl = sl
-    adjusted_tp = tp
-    
-    if signal == "buy":
-        # Lệnh mua: SL phải < giá hiện tại, TP phải > giá hiện tại
-        if sl and sl >= current_price:
-            # Auto-adjust SL cho lệnh buy
-            adjusted_sl = current_price * 0.98  # SL = 98% của giá hiện tại
-            log_event(f"Auto-adjust SL buy: {sl} -> {adjusted_sl:.1f}")
-        if tp and tp <= current_price:
-            # Auto-adjust TP cho lệnh buy
-            adjusted_tp = current_price * 1.04  # TP = 104% của giá hiện tại
-            log_event(f"Auto-adjust TP buy: {tp} -> {adjusted_tp:.1f}")
-    elif signal == "sell":
-        # Lệnh bán: SL phải > giá hiện tại, TP phải < giá hiện tại  
-        if sl and sl <= current_price:
-            # Auto-adjust SL cho lệnh sell
-            adjusted_sl = current_price * 1.02  # SL = 102% của giá hiện tại
-            log_event(f"Auto-adjust SL sell: {sl} -> {adjusted_sl:.1f}")
-        if tp and tp >= current_price:
-            # Auto-adjust TP cho lệnh sell
-            adjusted_tp = current_price * 0.96  # TP = 96% của giá hiện tại
-            log_event(f"Auto-adjust TP sell: {tp} -> {adjusted_tp:.1f}")
-    
-    return True, "OK", adjusted_sl, adjusted_tp
+# Pool riêng cho các request kiểm tra đầu chu kỳ (tách khỏi pool của scheduler để không tự khóa nhau)
+_pretrade_pool = ThreadPoolExecutor(max_workers=PRETRADE_WORKERS, thread_name_prefix="pretrade")
+
+class CycleSnapshot:
+    """Kết quả các request độc lập đầu chu kỳ, lấy đồng thời nên nhất quán về thời điểm."""
+
+    __slots__ = ("symbol", "has_position", "has_orders", "balance_info", "market_data", "timeframes", "price", "fetched_at")
+
+    def __init__(self, symbol, has_position, has_orders, balance_info, timeframes, price, fetched_at):
+        self.symbol = symbol
+        self.has_position = has_position
+        self.has_orders = has_orders
+        self.balance_info = balance_info
+        # Nến của mọi khung (TIMEFRAME + HTF_INTERVALS), market_data là khung chính
+        self.timeframes = timeframes or {}
+        self.market_data = self.timeframes.get(TIMEFRAME)
+        self.price = price
+        self.fetched_at = fetched_at
+
+    def price_age(self):
+        return time.monotonic() - self.fetched_at
+
+@timed(STAGE_SECONDS, stage="exchange_snapshot")
+def fetch_cycle_snapshot(symbol, store=None, include_market=True):
+    """Gọi song song vị thế, lệnh mở, số dư, kline và giá; thời gian chu kỳ ~ max latency thay vì tổng.
+
+    Khi user data stream khỏe thì vị thế/lệnh đọc từ store, không tốn request.
+    """
+    context = get_log_context()
+
+    def submit(fn, *args):
+        def call():
+            set_log_context(*context)
+            try:
+                return fn(*args)
+            finally:
+                set_log_context(None)
+        return _pretrade_pool.submit(call)
+
+    fetched_at = time.monotonic()
+    positions = None if store else submit(get_open_positions, symbol)
+    orders = None if store else submit(has_open_orders, symbol)
+    if include_market:
+        balance = submit(get_account_balance)
+        market = submit(get_timeframes, symbol)
+        price = submit(get_current_price, symbol)
+
+    return CycleSnapshot(
+        symbol,
+        store.has_position(symbol) if store else positions.result(),
+        store.has_open_orders(symbol) if store else orders.result(),
+        balance.result() if include_market else None,
+        market.result() if include_market else None,
+        price.result() if include_market else None,
+        fetched_at,
+    )
 
 QUESTION = ""  # Đã tích hợp vào format_for_gemini
 ORDER_ID_FILE = "current_order.txt"
 
-def main_loop():
-    order_id = None
-    if os.path.exists(ORDER_ID_FILE):
-        with open(ORDER_ID_FILE, "r") as f:
-            order_id = f.read().strip() or None
+class SymbolState:
+    """Trạng thái riêng của từng symbol trong watchlist.
+
+    Có journal: lệnh đang theo dõi lấy từ journal.replay() (saved); file current_order*.txt cũ
+    được chuyển vào journal một lần rồi xóa. JOURNAL_PATH trống thì vẫn dùng file như trước.
+    """
+
+    def __init__(self, symbol, saved=None):
+        self.symbol = symbol
+        # Giữ tên file cũ cho symbol mặc định để không mất lệnh đang theo dõi sau khi nâng cấp
+        self.order_file = ORDER_ID_FILE if symbol == SYMBOL else f"current_order_{symbol}.txt"
+        self.journal = get_journal()
+        self.order_id = (saved or {}).get("order_id")
+        if os.path.exists(self.order_file):
+            with open(self.order_file, "r") as f:
+                legacy_order_id = f.read().strip() or None
+            if not self.journal:
+                self.order_id = legacy_order_id
+            elif not legacy_order_id or self.order_id or self.set_order(legacy_order_id, source="legacy_file"):
+                os.remove(self.order_file)
+
+    def set_order(self, order_id, **details):
+        """Ghi lệnh vừa đặt (durable: đã fsync trước khi chu kỳ tiếp tục); False nếu phải ghi ra file."""
+        self.order_id = str(order_id)
+        if self.journal and self.journal.append("order_placed", self.symbol, self.order_id, durable=True, **details):
+            return True
+        if self.journal:
+            # Journal không ghi được: giữ lệnh trong file cũ, lần khởi động sau sẽ chuyển vào journal
+            log_event(f"Journal không ghi được lệnh {self.order_id}, lưu tạm vào {self.order_file}", level="ERROR")
+        with open(self.order_file, "w") as f:
+            f.write(self.order_id)
+        return False
+
+    def clear_order(self, **details):
+        if self.journal and not self.journal.append("order_closed", self.symbol, self.order_id, durable=True, **details):
+            log_event(f"Journal không ghi được order_closed {self.order_id}, sẽ kiểm tra lại lệnh sau restart",
+                      level="ERROR")
+        # Có cả khi journal lỗi lúc set_order (ghi tạm ra file)
+        if os.path.exists(self.order_file):
+            os.remove(self.order_file)
+        self.order_id = None
+
+def decide_signal(snapshot, symbol, build_prompt):
+    """(signal, amount, leverage, sl, tp, reason) theo STRATEGY_MODE; None nếu Gemini không trả lời.
+
+    rules: chỉ rule_engine (micro giây, không gọi mạng). confirm: rule_engine quyết định, Gemini chỉ
+    được hỏi khi luật ra buy/sell và lệnh chỉ giữ lại nếu Gemini cùng hướng.
+    """
+    if STRATEGY_MODE in ("rules", "confirm"):
+        with STAGE_SECONDS.time(stage="rules"):
+            decision = rule_engine.evaluate(snapshot)
+        if STRATEGY_MODE == "rules" or decision[0] == "hold":
+            return decision
+        log_event(f"Gửi data tới Gemini để xác nhận {decision[0]}...")
+        # Quá hạn không được tự xác nhận bằng chính rule_engine
+        signal_text = analyze_cached(build_prompt(), QUESTION, snapshot, symbol, fallback=False)
+        if not signal_text:
+            return None
+        confirmed = parse_signal(signal_text).signal
+        if confirmed != decision[0]:
+            return "hold", None, None, None, None, f"gemini không xác nhận {decision[0]} ({confirmed})"
+        return decision
+
+    log_event("Gửi data tới Gemini...")
+    signal_text = analyze_cached(build_prompt(), QUESTION, snapshot, symbol)
+    if not signal_text:
+        return None
+    return parse_signal(signal_text)
+
+# Trigger giá/volume từ market stream (chỉ có khi MARKET_DATA_MODE=stream)
+_triggers = None
+
+def decision_delay(symbol=None):
+    """Chờ tới lần quyết định kế tiếp: ngay sau khi nến TIMEFRAME đóng, hoặc 60s cố định (interval).
+
+    Có trigger từ stream thì bỏ qua nến mà trigger candle_close đã đánh thức symbol.
+    """
+    if SCHEDULE_MODE == "candle":
+        if _triggers and symbol:
+            return _triggers.seconds_to_candle_close(symbol, CANDLE_CLOSE_GRACE)
+        return seconds_to_candle_close(TIMEFRAME, CANDLE_CLOSE_GRACE)
+    return 60
+
+@timed(STAGE_SECONDS, stage="cycle")
+def run_cycle(state):
+    """Một chu kỳ giao dịch cho một symbol; trả về số giây chờ tới chu kỳ kế tiếp."""
+    symbol = state.symbol
+    # Có user data stream: đọc trạng thái từ bộ nhớ, mọi thay đổi sẽ wake symbol ngay lập tức
+    store = get_account_store()
+    watch_delay = ORDER_STREAM_SAFETY_POLL if store else 60
+    
+    # Vị thế, lệnh mở, số dư, kline và giá lấy song song trong một snapshot
+    # (chỉ cần dữ liệu thị trường khi chưa có lệnh đang theo dõi)
+    snapshot_data = fetch_cycle_snapshot(symbol, store, include_market=not state.order_id)
+    
+    # Kiểm tra vị thế mở trước khi đặt lệnh mới
+    if snapshot_data.has_position:
+        log_event("Đã có vị thế mở, không đặt lệnh mới.")
+        return watch_delay
+        
+    if snapshot_data.has_orders:
+        log_event("Đã có lệnh mở, không đặt lệnh mới.")
+        return watch_delay
+        
+    if not state.order_id:
+        # Lấy số dư thực tế từ exchange thay vì dùng get_balance() không chính xác
+        balance_info = snapshot_data.balance_info
+        if not balance_info:
+            log_event("Không lấy được thông tin tài khoản.")
+            return SCHEDULER_ERROR_DELAY
+        journal_event("balance", symbol, balance=balance_info['total_wallet_balance'],
+                      available_margin=balance_info['available_margin'], used_margin=balance_info['used_margin'])
+        
+        # Kiểm tra margin đủ để trade
+        if balance_info['available_margin'] < 100:
+            log_event(f"⚠️ MARGIN QUÁ THẤP: ${balance_info['available_margin']:.2f} - Tạm dừng trading")
+            return LOW_MARGIN_DELAY
+        
+        # Lấy dữ liệu thị trường
+        data = snapshot_data.market_data
+        if not data:
+            log_event("Không lấy được dữ liệu thị trường.")
+            return SCHEDULER_ERROR_DELAY
             
-    while True:
-        try:
-            # Kiểm tra vị thế mở trước khi đặt lệnh mới
-            from trade_executor import get_open_positions, get_account_balance
-            if get_open_positions():
-                log_event("Đã có vị thế mở, không đặt lệnh mới.")
-                time.sleep(60)
-                continue
-                
-            if has_open_orders():
-                log_event("Đã có lệnh mở, không đặt lệnh mới.")
-                time.sleep(60)
-                continue
-                
-            if not order_id:
-                # Lấy số dư thực tế từ exchange thay vì dùng get_balance() không chính xác
-                balance_info = get_account_balance()
-                if not balance_info:
-                    log_event("Không lấy được thông tin tài khoản.")
-                    time.sleep(60)
-                    continue
-                
-                # Kiểm tra margin đủ để trade
-                if balance_info['available_margin'] < 100:
-                    log_event(f"⚠️ MARGIN QUÁ THẤP: ${balance_info['available_margin']:.2f} - Tạm dừng trading")
-                    time.sleep(300)  # Chờ 5 phút
-                    continue
-                
-                # Lấy dữ liệu thị trường
-                data = get_market_data()
-                if not data:
-                    log_event("Không lấy được dữ liệu thị trường.")
-                    time.sleep(60)
-                    continue
-                    
-                df = calculate_indicators(data)
-                # Sử dụng available_margin thực tế thay vì balance estimate
-                data_text = format_for_gemini(df, balance_info['available_margin']/50, TRADE_AMOUNT, LEVERAGE)
-                
-                log_event("Gửi data tới Gemini...")
-                signal_text = analyze(data_text, QUESTION)
-                
-                if not signal_text:
-                    log_event("Gemini không trả về tín hiệu, bỏ qua chu kỳ này.")
-                    time.sleep(60)
-                    continue
-                    
-                signal, amount, leverage, sl, tp, reason = parse_signal_sl_tp(signal_text)
-                log_event(f"Gemini: {signal} | Amount: {amount} | Leverage: {leverage} | SL: {sl} | TP: {tp} | Lý do: {reason}")
+        with STAGE_SECONDS.time(stage="indicators"):
+            # Stream mode: IndicatorState đã cập nhật theo từng push; không thì tính thẳng trên
+            # các cột NumPy của KlineColumns (không dựng DataFrame)
+            snapshot = get_live_snapshot(symbol) or kline_snapshot(data)
+            # Xu hướng khung lớn, gộp từ cùng lần lấy nến 1m
+            timeframes = {
+                interval: trend_snapshot(klines)
+                for interval, klines in snapshot_data.timeframes.items()
+                if interval != TIMEFRAME and len(klines)
+            }
+            snapshot["htf_trend"] = tuple((interval, features["trend"]) for interval, features in timeframes.items())
+        
+        # Sử dụng available_margin thực tế thay vì balance estimate (prompt chỉ dựng khi cần hỏi Gemini)
+        decision = decide_signal(snapshot, symbol, lambda: format_for_gemini(
+            None, balance_info['available_margin']/50, TRADE_AMOUNT, LEVERAGE, symbol, snapshot, timeframes))
+        
+        if not decision:
+            log_event("Gemini không trả về tín hiệu, bỏ qua chu kỳ này.")
+            return decision_delay(symbol)
+            
+        signal, amount, leverage, sl, tp, reason = decision
+        if _triggers:
+            _triggers.set_reference(symbol, snapshot["close"], snapshot["atr"])
+        journal_event("decision", symbol, source=STRATEGY_MODE, signal=signal, amount=amount,
+                      leverage=leverage, sl=sl, tp=tp, reason=reason, price=snapshot["close"])
+        log_event(f"{STRATEGY_MODE}: {signal} | Amount: {amount} | Leverage: {leverage} | SL: {sl} | TP: {tp} | Lý do: {reason}")
+        
+        if signal in ["buy", "sell"]:
+            # Giá trong snapshot có thể đã cũ sau khi chờ Gemini, lấy lại nếu quá PRICE_MAX_AGE
+            current_price = snapshot_data.price
+            if not current_price or snapshot_data.price_age() > PRICE_MAX_AGE:
+                current_price = get_current_price(symbol)
+            if not current_price:
+                ORDERS_SKIPPED.inc(reason="no_price")
+                log_event("Không lấy được giá real-time, bỏ qua lệnh.")
+                return SCHEDULER_ERROR_DELAY
+            
+            log_event(f"Giá real-time khi đặt lệnh: {current_price:.1f}")
+            
+            # Validate SL/TP với giá real-time
+            is_valid, error_msg, adjusted_sl, adjusted_tp = validate_sl_tp(signal, current_price, sl, tp)
+            if not is_valid:
+                ORDERS_SKIPPED.inc(reason="invalid_sl_tp")
+                log_event(f"SL/TP không hợp lệ: {error_msg}")
+                return decision_delay(symbol)
+            
+            # AGGRESSIVE HIGH-PROFIT TRADING: Target 90-200% profit 🚀
+            available_margin = balance_info['available_margin']
+            
+            leverage_to_use, trade_amount_to_use = resolve_trade_params(leverage, amount)
+            
+            log_event(f"🚀 AGGRESSIVE HIGH-PROFIT: {leverage_to_use}x với ${trade_amount_to_use:.2f}")
+            log_event(f"💎 Target profit: 90-200% | Available margin: ${available_margin:.2f}")
                 
-                if signal in ["buy", "sell"]:
-                    # Lấy giá real-time
-                    current_price = get_current_price()
-                    if not current_price:
-                        log_event("Không lấy được giá real-time, bỏ qua lệnh.")
-                        time.sleep(60)
-                        continue
-                    
-                    log_event(f"Giá real-time khi đặt lệnh: {current_price:.1f}")
-                    
-                    # Validate SL/TP với giá real-time
-                    is_valid, error_msg, adjusted_sl, adjusted_tp = validate_sl_tp(signal, current_price, sl, tp)
-                    if not is_valid:
-                        log_event(f"SL/TP không hợp lệ: {error_msg}")
-                        time.sleep(60)
-                        continue
-                    
-                    # AGGRESSIVE HIGH-PROFIT TRADING: Target 90-200% profit 🚀
-                    available_margin = balance_info['available_margin']
-                    
-                    # Sử dụng leverage từ Gemini hoặc config (ưu tiên high leverage)
-                    leverage_to_use = leverage if leverage else LEVERAGE
-                    
-                    # AGGRESSIVE: Cho phép leverage cao hơn (50-125x)
-                    leverage_to_use = max(50, min(125, leverage_to_use))
-                    
-                    # AGGRESSIVE: Trade amount lớn hơn cho high profit
-                    base_amount = amount if amount else 80  # Default 80$ thay vì 50$
-                    
-                    # Scale amount theo confidence và leverage
-                    if leverage_to_use >= 100:
-                        # Extreme leverage: Use bigger amounts for massive gains
-                        trade_amount_to_use = max(60, min(100, base_amount))
-                    elif leverage_to_use >= 80:
-                        # High leverage: Medium-large amounts
-                        trade_amount_to_use = max(40, min(80, base_amount))
-                    else:
-                        # Moderate leverage: Standard amounts
-                        trade_amount_to_use = max(20, min(60, base_amount))
-                    
-                    log_event(f"🚀 AGGRESSIVE HIGH-PROFIT: {leverage_to_use}x với ${trade_amount_to_use:.2f}")
-                    log_event(f"💎 Target profit: 90-200% | Available margin: ${available_margin:.2f}")
-                        
-                    # Thiết lập đòn bẩy
-                    side_leverage = "LONG" if signal == "buy" else "SHORT"
-                    lev_result = set_leverage(leverage_to_use, side_leverage)
-                    log_event(f"Thiết lập đòn bẩy {leverage_to_use}x cho {side_leverage}: {lev_result}")
-                    
-                    # Đặt lệnh với high leverage
-                    result = place_order(
-                        signal, 
-                        sl=adjusted_sl, 
-                        tp=adjusted_tp, 
-                        leverage=leverage_to_use, 
-                        trade_amount=trade_amount_to_use, 
-                        current_price=current_price, 
-                        account_balance=available_margin
-                    )
-                    
-                    log_event(f"Đặt lệnh {signal} với {trade_amount_to_use}$ và {leverage_to_use}x: {result}")
-                    
-                    if result.get("code") == 0 and result.get("orderId"):
-                        order_id = str(result.get("orderId"))
-                        with open(ORDER_ID_FILE, "w") as f:
-                            f.write(order_id)
-                        log_event(f"✅ ĐẶT LỆNH THÀNH CÔNG: {order_id}")
-                    else:
-                        log_event(f"Đặt lệnh thất bại: {result}")
-                        # Nếu vẫn bị insufficient margin, log chi tiết để debug
-                        if result.get("code") == 80001:
-                            log_event(f"🔍 DEBUG MARGIN FAIL:")
-                            log_event(f"  Available: ${available_margin:.2f}")
-                            log_event(f"  Requested: ${trade_amount_to_use:.2f}")
-                            log_event(f"  Leverage: {leverage_to_use}x")
-                else:
-                    log_event(f"Không có tín hiệu giao dịch. Lý do: {reason}")
-                    
-                time.sleep(60)
+            # Thiết lập đòn bẩy
+            side_leverage = "LONG" if signal == "buy" else "SHORT"
+            lev_result = set_leverage(leverage_to_use, side_leverage, symbol)
+            log_event(f"Thiết lập đòn bẩy {leverage_to_use}x cho {side_leverage}: {lev_result}")
+            
+            # Đặt lệnh với high leverage
+            result = place_order(
+                signal, 
+                sl=adjusted_sl, 
+                tp=adjusted_tp, 
+                leverage=leverage_to_use, 
+                trade_amount=trade_amount_to_use, 
+                current_price=current_price, 
+                account_balance=available_margin,
+                symbol=symbol,
+                balance_info=balance_info
+            )
+            
+            log_event(f"Đặt lệnh {signal} với {trade_amount_to_use}$ và {leverage_to_use}x: {result}")
+            
+            # BingX trả orderId trong data.order
+            new_order_id = result.get("orderId") or result.get("data", {}).get("order", {}).get("orderId")
+            if result.get("code") == 0 and new_order_id:
+                state.set_order(new_order_id, signal=signal, price=current_price, sl=adjusted_sl, tp=adjusted_tp,
+                                leverage=leverage_to_use, amount=trade_amount_to_use)
+                if store:
+                    store.track_order(state.order_id, symbol)
+                log_event(f"✅ ĐẶT LỆNH THÀNH CÔNG: {state.order_id}")
             else:
-                # Kiểm tra trạng thái lệnh
-                if not is_order_open(order_id):
-                    log_event(f"Lệnh {order_id} đã đóng hoặc không còn hiệu lực.")
-                    order_id = None
-                    if os.path.exists(ORDER_ID_FILE):
-                        os.remove(ORDER_ID_FILE)
-                time.sleep(30)  # Giảm từ 60s xuống 30s để theo dõi lệnh sát hơn
-        except Exception as e:
-            log_event(f"Lỗi: {e}")
-            time.sleep(30)  # Giảm delay khi gặp lỗi
+                log_event(f"Đặt lệnh thất bại: {result}")
+                # Nếu vẫn bị insufficient margin, log chi tiết để debug
+                if result.get("code") == 80001:
+                    log_event(f"🔍 DEBUG MARGIN FAIL:")
+                    log_event(f"  Available: ${available_margin:.2f}")
+                    log_event(f"  Requested: ${trade_amount_to_use:.2f}")
+                    log_event(f"  Leverage: {leverage_to_use}x")
+        else:
+            log_event(f"Không có tín hiệu giao dịch. Lý do: {reason}")
+            
+        return decision_delay(symbol)
+    else:
+        # Kiểm tra trạng thái lệnh
+        status = store.order_status(state.order_id) if store else None
+        order_open = status in OPEN_STATUSES if status else is_order_open(state.order_id, symbol)
+        if not order_open:
+            log_event(f"Lệnh {state.order_id} đã đóng hoặc không còn hiệu lực.")
+            state.clear_order(status=status)
+        return ORDER_STREAM_SAFETY_POLL if store else ORDER_POLL_INTERVAL
+
+def start_triggers(scheduler, streams):
+    """Nến đóng / giá lệch > k x ATR / volume đột biến từ stream đánh thức chu kỳ ngay, không chờ timer."""
+    global _triggers
+    _triggers = DecisionTriggers(scheduler.wake, TIMEFRAME, TRIGGER_ATR_MULT, TRIGGER_VOLUME_MULT, TRIGGER_COOLDOWN)
+    for stream in streams:
+        stream.add_listener(_triggers.on_candle)
+    return _triggers
+
+def main_loop():
+    streams = []
+    if MARKET_DATA_MODE == "stream":
+        from data_fetcher import start_market_stream
+        streams = [start_market_stream(symbol) for symbol in SYMBOLS]
+        log_event(f"Market data streaming mode cho {', '.join(SYMBOLS)}")
+
+    # Nạp sẵn luật step/tick/min của sàn để lệnh đầu tiên không phải chờ exchangeInfo
+    refresh_symbol_rules()
+    
+    # Dựng lại lệnh đang theo dõi từ journal (một query, không cần REST)
+    journal = get_journal()
+    started = time.perf_counter()
+    saved = journal.replay() if journal else {}
+    if journal:
+        open_orders = {symbol: entry["order_id"] for symbol, entry in saved.items() if entry["order_id"]}
+        log_event(f"Khôi phục trạng thái từ journal trong {(time.perf_counter() - started) * 1000:.1f} ms: {open_orders}")
+    
+    log_event(f"Bắt đầu giao dịch {len(SYMBOLS)} symbol với {SCHEDULER_WORKERS} worker")
+    scheduler = SymbolScheduler(
+        [SymbolState(symbol, saved.get(symbol)) for symbol in SYMBOLS], run_cycle, SCHEDULER_WORKERS,
+        error_delay=SCHEDULER_ERROR_DELAY, max_error_delay=SCHEDULER_MAX_ERROR_DELAY,
+        cooldown_fn=get_client().rate_limiter.cooldown,
+    )
+    if streams and SCHEDULE_MODE == "candle":
+        start_triggers(scheduler, streams)
+        log_event(f"Lịch quyết định theo nến {TIMEFRAME} + trigger (ATR x{TRIGGER_ATR_MULT}, volume x{TRIGGER_VOLUME_MULT})")
+    if ORDER_TRACKING_MODE == "stream":
+        start_user_stream(SYMBOLS, on_change=scheduler.wake)
+    scheduler.run()
 
 if __name__ == "__main__":
     main_loop()
\ No newline at end of file
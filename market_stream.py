@@ -0,0 +1,188 @@
+import gzip
+import json
+import time
+import uuid
+import threading
+from collections import deque
+from config import SYMBOL, BINGX_WS_URL, STREAM_BUFFER_SIZE, STREAM_STALE_SECONDS
+from logger import log_event
+
+def decode_message(message):
+    """BingX nén mọi push bằng gzip; trả về text đã giải nén."""
+    if isinstance(message, (bytes, bytearray)):
+        try:
+            return gzip.decompress(message).decode("utf-8")
+        except OSError:
+            return message.decode("utf-8")
+    return message
+
+def kline_from_push(item):
+    """Chuyển nến dạng push {o,h,l,c,v,T} về cùng dạng dict với REST v3 klines."""
+    return {
+        "open": item.get("o"),
+        "high": item.get("h"),
+        "low": item.get("l"),
+        "close": item.get("c"),
+        "volume": item.get("v"),
+        "time": int(item.get("T", 0)),
+    }
+
+class BingXStream:
+    """Kết nối WebSocket tự reconnect (backoff) chạy trong thread nền."""
+
+    def __init__(self, url):
+        self.url = url
+        self.connected = False
+        self.last_message_at = 0.0
+        self._ws = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._ws:
+            self._ws.close()
+
+    def is_healthy(self):
+        # Đã stop thì không healthy ngay, không chờ thread WebSocket xử lý xong on_close
+        return (self.connected and not self._stop.is_set()
+                and time.monotonic() - self.last_message_at < STREAM_STALE_SECONDS)
+
+    def _run(self):
+        import websocket
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                url = self.connect_url()
+            except Exception as e:
+                url = None
+                log_event(f"Không lấy được URL WebSocket: {e}")
+            if url is None:
+                backoff = min(backoff * 2, 30)
+                self._stop.wait(backoff)
+                continue
+            self._ws = websocket.WebSocketApp(
+                url,
+                on_open=self._handle_open,
+                on_message=self._handle_message,
+                on_close=self._handle_close,
+                on_error=self._handle_error,
+            )
+            started = time.monotonic()
+            self._ws.run_forever()
+            self.connected = False
+            if self._stop.is_set():
+                break
+            # Kết nối sống lâu thì reset backoff, chết ngay thì tăng dần tới 30s
+            backoff = 1 if time.monotonic() - started > 60 else min(backoff * 2, 30)
+            log_event(f"WebSocket {self.url} mất kết nối, thử lại sau {backoff}s")
+            self._stop.wait(backoff)
+
+    def _handle_open(self, ws):
+        self.last_message_at = time.monotonic()
+        # Chỉ báo healthy sau khi on_open (nạp dữ liệu qua REST) xong
+        self.on_open(ws)
+        self.connected = True
+
+    def _handle_message(self, ws, message):
+        text = decode_message(message)
+        self.last_message_at = time.monotonic()
+        if text == "Ping":
+            ws.send("Pong")
+            return
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return
+        self.on_payload(payload)
+
+    def _handle_close(self, ws, status_code, reason):
+        self.connected = False
+
+    def _handle_error(self, ws, error):
+        log_event(f"Lỗi WebSocket {self.url}: {error}")
+
+    def connect_url(self):
+        return self.url
+
+    def on_open(self, ws):
+        pass
+
+    def on_payload(self, payload):
+        pass
+
+class MarketStream(BingXStream):
+    """Stream kline + giá real-time của một symbol, lưu nến trong ring buffer."""
+
+    def __init__(self, symbol=SYMBOL, interval="1m", url=BINGX_WS_URL, seed=None, maxlen=STREAM_BUFFER_SIZE):
+        super().__init__(url)
+        self.symbol = symbol
+        self.interval = interval
+        self.seed = seed
+        self.candles = deque(maxlen=maxlen)
+        self.last_price = None
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """callback(symbol, candle, new_candle) sau mỗi push kline; new_candle=True khi nến trước vừa đóng."""
+        self.listeners.append(callback)
+
+    def on_open(self, ws):
+        # Nạp lại nến qua REST mỗi lần (re)connect để không hổng dữ liệu lúc mất kết nối
+        if self.seed:
+            try:
+                seeded = self.seed()
+                with self._lock:
+                    self.candles.clear()
+                    self.candles.extend(seeded)
+            except Exception as e:
+                log_event(f"Lỗi nạp nến ban đầu cho stream {self.symbol}: {e}")
+        for data_type in (f"{self.symbol}@kline_{self.interval}", f"{self.symbol}@lastPrice"):
+            ws.send(json.dumps({"id": str(uuid.uuid4()), "reqType": "sub", "dataType": data_type}))
+
+    def on_payload(self, payload):
+        data_type = payload.get("dataType", "")
+        data = payload.get("data")
+        if not data:
+            return
+        if data_type.endswith(f"@kline_{self.interval}"):
+            for item in data:
+                self._merge_candle(kline_from_push(item))
+        elif data_type.endswith("@lastPrice"):
+            price = data.get("c")
+            if price:
+                self.last_price = float(price)
+
+    def _merge_candle(self, candle):
+        merged = new_candle = False
+        with self._lock:
+            if self.candles and int(self.candles[-1].get("time", 0)) == candle["time"]:
+                self.candles[-1] = candle
+                merged = True
+            elif not self.candles or candle["time"] > int(self.candles[-1].get("time", 0)):
+                new_candle = bool(self.candles)
+                self.candles.append(candle)
+                merged = True
+        if candle["close"]:
+            self.last_price = float(candle["close"])
+        if not merged:
+            return
+        for callback in self.listeners:
+            try:
+                callback(self.symbol, candle, new_candle)
+            except Exception as e:
+                log_event(f"Lỗi listener market stream {self.symbol}: {e}")
+
+    def get_candles(self, limit=None):
+        with self._lock:
+            candles = list(self.candles)
+        return candles[-limit:] if limit else candles
+
+    def get_price(self):
+        return self.last_price
@@ -0,0 +1,149 @@
+"""Metrics dạng Prometheus (text exposition) cho /metrics của server.py.
+
+Tự cài đặt tối giản (không cần prometheus_client): mỗi lần observe/inc chỉ là một lock,
+một bisect và vài phép cộng, nên đo từng request/bước trong chu kỳ chỉ tốn vài micro giây.
+"""
+import time
+import bisect
+import functools
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # key nhãn -> [đếm theo bucket (không cộng dồn), tổng, số lần]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager đo thời gian một khối lệnh."""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', bound))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+def counter(name, help_text):
+    metric = Counter(name, help_text)
+    _registry.append(metric)
+    return metric
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help_text, buckets)
+    _registry.append(metric)
+    return metric
+
+def timed(metric, **labels):
+    """Decorator đo thời gian hàm vào histogram với nhãn cố định."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Metrics của bot
+STAGE_SECONDS = histogram("bot_stage_seconds", "Thời gian từng bước của chu kỳ giao dịch")
+BINGX_REQUEST_SECONDS = histogram("bingx_request_seconds", "Latency request REST tới BingX theo endpoint")
+BINGX_HTTP_ERRORS = counter("bingx_http_errors_total", "Response lỗi (>=400) hoặc exception khi gọi BingX")
+GEMINI_CACHE = counter("gemini_cache_total", "Tra cứu cache quyết định Gemini theo kết quả hit/miss")
+GEMINI_REQUEST_SECONDS = histogram("gemini_request_seconds", "Latency từng request Gemini theo URL model")
+GEMINI_TOKENS = counter("gemini_tokens_total", "Token Gemini theo usageMetadata: prompt (chưa cache), cached, output")
+GEMINI_DECISIONS = counter("gemini_decisions_total", "Quyết định theo nguồn: primary/hedge/error/deadline/fallback")
+GEMINI_BATCH_SIZE = histogram("gemini_batch_symbols", "Số symbol trong mỗi request Gemini (GEMINI_BATCH)",
+                              buckets=(1, 2, 4, 8, 16, 32, 64))
+GEMINI_EMPTY_RESPONSES = counter("gemini_empty_responses_total", "Gemini không trả về tín hiệu")
+SIGNAL_PARSE = counter("signal_parse_total", "Phản hồi quyết định đã parse theo định dạng json/text/invalid_json")
+DECISION_TRIGGERS = counter("decision_triggers_total", "Chu kỳ quyết định được đánh thức theo lý do: candle_close/price_move/volume_spike")
+SCHEDULER_LAG = histogram("bot_scheduler_lag_seconds", "Độ trễ từ thời điểm lên lịch tới lúc chu kỳ được giao cho worker",
+                          buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+ORDERS_SKIPPED = counter("orders_skipped_total", "Lệnh bị bỏ qua trước khi gửi lên sàn")
@@ -0,0 +1,349 @@
+"""Sàn BingX giả lập chạy local để test offline, đo overhead của bot và tái hiện bão 429.
+
+Hỗ trợ các endpoint bot đang dùng (klines, price, balance, positions, openOrders, order,
+leverage, exchangeInfo, listenKey), kiểm tra chữ ký HMAC giống BingX và cho phép tiêm latency, lỗi 5xx
+và rate limit (429 + Retry-After).
+
+    python mock_exchange.py --port 8080 --latency 0.05 --error-rate 0.01 --rate-limit 20
+    BINGX_API_URL=http://127.0.0.1:8080 python test_tiny_order.py
+
+Không import config: có thể khởi động trước khi các module của bot đọc biến môi trường.
+"""
+import os
+import hmac
+import json
+import time
+import random
+import tempfile
+import argparse
+import contextlib
+import threading
+from hashlib import sha256
+from collections import Counter
+from urllib.parse import urlparse, parse_qsl, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_API_KEY = "mock-api-key"
+MOCK_API_SECRET = "mock-api-secret"
+
+class MockExchangeState:
+    """Trạng thái sàn giả: giá random walk, số dư, lệnh, vị thế, leverage."""
+
+    def __init__(self, symbols=("BTC-USDT",), start_price=60000.0, balance=1000.0, seed=None):
+        self.random = random.Random(seed)
+        self.prices = {symbol: start_price for symbol in symbols}
+        self.available_margin = balance
+        self.used_margin = 0.0
+        self.orders = {}
+        self.positions = {}
+        self.leverage = {}
+        self.next_order_id = 1000000
+        self.lock = threading.Lock()
+
+    def price(self, symbol):
+        with self.lock:
+            price = self.prices.setdefault(symbol, 100.0)
+            price *= 1 + self.random.gauss(0, 0.0005)
+            self.prices[symbol] = price
+            return price
+
+    def klines(self, symbol, interval, limit, start_time=None, end_time=None):
+        minutes = {"1m": 1, "3m": 3, "5m": 5, "15m": 15, "30m": 30, "1h": 60, "4h": 240, "1d": 1440}.get(interval, 1)
+        step = minutes * 60000
+        now = int(time.time() * 1000) // step * step
+        if end_time is not None:
+            now = min(now, end_time // step * step)
+        if start_time is not None:
+            # startTime/endTime như BingX: `limit` nến đầu tiên tính từ startTime
+            first = -(-start_time // step) * step
+            now = min(now, first + (limit - 1) * step)
+            limit = max(0, (now - first) // step + 1)
+        price = self.price(symbol)
+        candles = []
+        # Sinh ngược từ giá hiện tại để nến cuối khớp với ticker
+        for i in range(limit):
+            open_price = price * (1 + self.random.gauss(0, 0.001))
+            high = max(open_price, price) * (1 + abs(self.random.gauss(0, 0.0005)))
+            low = min(open_price, price) * (1 - abs(self.random.gauss(0, 0.0005)))
+            candles.append({
+                "open": f"{open_price:.2f}", "close": f"{price:.2f}", "high": f"{high:.2f}",
+                "low": f"{low:.2f}", "volume": f"{self.random.uniform(1, 100):.3f}", "time": now - i * step,
+            })
+            price = open_price
+        candles.reverse()
+        return candles
+
+    def place_order(self, params):
+        symbol = params.get("symbol")
+        quantity = float(params.get("quantity", 0))
+        price = self.price(symbol)
+        with self.lock:
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            leverage = self.leverage.get((symbol, params.get("positionSide")), 10)
+            margin = quantity * price / leverage
+            if margin > self.available_margin:
+                return {"code": 101204, "msg": "Insufficient margin", "data": {}}
+            self.available_margin -= margin
+            self.used_margin += margin
+            side = 1 if params.get("side") == "BUY" else -1
+            self.positions[symbol] = {
+                "symbol": symbol, "positionSide": params.get("positionSide"),
+                "positionAmt": str(side * quantity), "avgPrice": f"{price:.2f}", "leverage": leverage,
+            }
+            order = {"orderId": order_id, "symbol": symbol, "side": params.get("side"),
+                     "positionSide": params.get("positionSide"), "type": params.get("type"),
+                     "origQty": str(quantity), "avgPrice": f"{price:.2f}", "status": "FILLED"}
+            self.orders[str(order_id)] = order
+            return {"code": 0, "msg": "", "data": {"order": order}}
+
+    def close_positions(self):
+        """Đóng mọi vị thế (giả lập SL/TP đã khớp) và trả margin."""
+        with self.lock:
+            self.positions.clear()
+            self.available_margin += self.used_margin
+            self.used_margin = 0.0
+
+class MockExchange:
+    """HTTP server giả lập BingX với latency/lỗi/rate limit có thể chỉnh lúc chạy."""
+
+    def __init__(self, host="127.0.0.1", port=0, api_key=MOCK_API_KEY, api_secret=MOCK_API_SECRET,
+                 latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, retry_after=1, state=None):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.configure(latency, jitter, error_rate, rate_limit, retry_after)
+        self.state = state or MockExchangeState()
+        self.stats = Counter()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def configure(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, retry_after=1):
+        """Đặt lại latency/lỗi/rate limit (sàn dùng chung giữa các test trong cùng process)."""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.storm_until = 0.0
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def start_429_storm(self, seconds):
+        """Mọi request trả 429 trong `seconds` giây (tái hiện bão rate limit)."""
+        self.storm_until = time.monotonic() + seconds
+
+    def _rate_limited(self):
+        if time.monotonic() < self.storm_until:
+            return True
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    def _verify(self, query, headers):
+        if headers.get("X-BX-APIKEY") != self.api_key:
+            return False
+        payload, sep, signature = query.rpartition("&signature=")
+        if not sep:
+            return False
+        # requests percent-encode ký tự như {"} trong stopLoss/takeProfit; chữ ký được tính trên chuỗi gốc
+        for candidate in (payload, unquote(payload)):
+            expected = hmac.new(self.api_secret.encode("utf-8"), candidate.encode("utf-8"), digestmod=sha256).hexdigest()
+            if hmac.compare_digest(expected, signature):
+                return True
+        return False
+
+    def handle(self, method, raw_path, headers):
+        """Trả về (status, body dict, extra headers)."""
+        parsed = urlparse(raw_path)
+        path = parsed.path
+        params = dict(parse_qsl(parsed.query, keep_blank_values=True))
+        self.stats[f"{method} {path}"] += 1
+
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if self._rate_limited():
+            self.stats["429"] += 1
+            return 429, {"code": 100410, "msg": "rate limited"}, {"Retry-After": str(self.retry_after)}
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["5xx"] += 1
+            return 500, {"code": 100500, "msg": "internal error"}, {}
+
+        state = self.state
+        symbol = params.get("symbol", "BTC-USDT")
+        if path == "/openApi/swap/v2/quote/price":
+            return 200, {"code": 0, "data": {"symbol": symbol, "price": f"{state.price(symbol):.2f}",
+                                             "time": int(time.time() * 1000)}}, {}
+
+        if path == "/openApi/user/auth/userDataStream":
+            if headers.get("X-BX-APIKEY") != self.api_key:
+                return 200, {"code": 100001, "msg": "invalid api key"}, {}
+            if method == "POST":
+                return 200, {"listenKey": f"mock-listen-key-{int(time.time() * 1000)}"}, {}
+            return 200, {}, {}
+
+        if not self._verify(parsed.query, headers):
+            self.stats["bad_signature"] += 1
+            return 200, {"code": 100001, "msg": "Signature verification failed"}, {}
+
+        if path == "/openApi/swap/v3/quote/klines":
+            start_time = int(params["startTime"]) if "startTime" in params else None
+            end_time = int(params["endTime"]) if "endTime" in params else None
+            data = state.klines(symbol, params.get("interval", "1m"), int(params.get("limit", 500)), start_time, end_time)
+            return 200, {"code": 0, "data": data}, {}
+        if path == "/openApi/swap/v2/user/balance":
+            balance = {
+                "asset": "USDT",
+                "balance": f"{state.available_margin + state.used_margin:.4f}",
+                "availableMargin": f"{state.available_margin:.4f}",
+                "usedMargin": f"{state.used_margin:.4f}",
+                "totalWalletBalance": f"{state.available_margin + state.used_margin:.4f}",
+                "totalMarginBalance": f"{state.available_margin + state.used_margin:.4f}",
+            }
+            return 200, {"code": 0, "data": {"balance": balance}}, {}
+        if path == "/openApi/swap/v2/user/positions":
+            positions = [p for p in state.positions.values() if not params.get("symbol") or p["symbol"] == symbol]
+            return 200, {"code": 0, "data": positions}, {}
+        if path == "/openApi/swap/v2/trade/openOrders":
+            orders = [o for o in state.orders.values() if o["symbol"] == symbol and o["status"] in ("NEW", "PARTIALLY_FILLED")]
+            return 200, {"code": 0, "data": {"orders": orders}}, {}
+        if path == "/openApi/swap/v2/trade/order" and method == "POST":
+            return 200, state.place_order(params), {}
+        if path == "/openApi/swap/v2/trade/order":
+            order = state.orders.get(params.get("orderId", ""))
+            if not order:
+                return 200, {"code": 109414, "msg": "order not exist", "data": {}}, {}
+            return 200, {"code": 0, "data": order}, {}
+        if path == "/openApi/swap/v2/trade/leverage":
+            state.leverage[(symbol, params.get("side"))] = int(params.get("leverage", 10))
+            return 200, {"code": 0, "data": {"symbol": symbol, "leverage": int(params.get("leverage", 10))}}, {}
+        if path == "/openApi/swap/v2/quote/exchangeInfo":
+            symbols = [{"symbol": s, "minQty": "0.0001", "minNotional": "2", "tickSize": "0.1",
+                        "stepSize": "0.0001", "pricePrecision": 1, "quantityPrecision": 4}
+                       for s in state.prices]
+            return 200, {"code": 0, "data": {"symbols": symbols}}, {}
+        return 404, {"code": 100404, "msg": f"unknown endpoint {path}"}, {}
+
+    def _handler_class(self):
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                # Mỗi handler là một kết nối TCP: test keep-alive đếm số kết nối đã nhận
+                super().setup()
+                exchange.stats["connections"] += 1
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                status, body, extra = exchange.handle(self.command, self.path, self.headers)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in extra.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+@contextlib.contextmanager
+def patched(module, **values):
+    """Tạm đổi giá trị config mà module đã import (from config import ...) trong một test.
+
+    config chỉ đọc env một lần cho cả process, nên test cần giá trị riêng (URL Gemini giả...)
+    đặt thẳng vào module rồi trả lại khi xong, không phụ thuộc thứ tự import của pytest.
+    """
+    saved = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+def use_temp_paths():
+    """Trỏ file runtime của bot (kho kline, journal, log) vào thư mục tạm để test không ghi vào cây repo.
+
+    Gọi trước khi import config; test offline không dùng sàn giả cũng nên gọi.
+    """
+    root = tempfile.mkdtemp(prefix="bot_test_")
+    os.environ.setdefault("KLINE_STORE_DIR", os.path.join(root, "kline_store"))
+    os.environ.setdefault("JOURNAL_PATH", os.path.join(root, "state_journal.db"))
+    os.environ.setdefault("LOG_FILE", os.path.join(root, "trade_log.txt"))
+    return root
+
+_exchange = None
+
+def use_mock_exchange(**kwargs):
+    """Khởi động sàn giả trong process và trỏ biến môi trường của bot vào nó.
+
+    Phải gọi trước khi import config/bingx_client (config đọc env lúc import). Gọi lại trong cùng
+    process (pytest chạy mọi file test chung, conftest.py gọi trước) thì dùng lại sàn đang chạy,
+    vì config/bingx_client đã trỏ vào nó; chỉ latency/lỗi/rate limit được đặt lại theo kwargs.
+    """
+    global _exchange
+    if _exchange is not None:
+        _exchange.configure(**kwargs)
+        return _exchange
+    exchange = _exchange = MockExchange(**kwargs).start()
+    os.environ["BINGX_API_URL"] = exchange.url
+    os.environ["BINGX_API_KEY"] = exchange.api_key
+    os.environ["BINGX_API_SECRET"] = exchange.api_secret
+    os.environ.setdefault("SYMBOL", "BTC-USDT")
+    os.environ.setdefault("TRADE_AMOUNT", "100")
+    os.environ.setdefault("LEVERAGE", "10")
+    # Nến giả / journal giả không được lẫn vào dữ liệu thật
+    use_temp_paths()
+    return exchange
+
+def main():
+    parser = argparse.ArgumentParser(description="Sàn BingX giả lập chạy local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ cố định mỗi request (giây)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Độ trễ ngẫu nhiên thêm tối đa (giây)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ trả HTTP 500")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Số request/giây trước khi trả 429")
+    parser.add_argument("--balance", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    exchange = MockExchange(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                            error_rate=args.error_rate, rate_limit=args.rate_limit,
+                            state=MockExchangeState(balance=args.balance))
+    print(f"Mock BingX tại {exchange.url} (API key: {exchange.api_key}, secret: {exchange.api_secret})")
+    try:
+        exchange.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(dict(exchange.stats))
+
+if __name__ == "__main__":
+    main()
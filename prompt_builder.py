@@ -0,0 +1,94 @@
+"""Prompt Gemini = phần luật chiến lược tĩnh + khối thị trường ngắn gọn.
+
+Phần tĩnh được dựng một lần và gửi qua systemInstruction (cùng một prefix mọi request nên Gemini
+cache ngầm được); mỗi chu kỳ chỉ dựng lại khối thị trường vài trăm byte thay vì cả prompt ~2 KB.
+Chế độ batch (GEMINI_BATCH) gộp khối thị trường của nhiều symbol vào một request, luật chỉ gửi một lần.
+"""
+import functools
+
+STRATEGY_RULES = (
+    "You are a crypto futures trader on a DEMO account (1000$ available) targeting 90-200% profit per trade.\n"
+    "\n"
+    "STRATEGY:\n"
+    "- Use leverage 100-125x for explosive gains, trade strong breakouts and momentum\n"
+    "- TP 0.8-2.0% away, SL 0.1-0.2% away (tight SL controls risk at extreme leverage)\n"
+    "\n"
+    "AMOUNT & LEVERAGE BY CONFIDENCE:\n"
+    "- >85: 80-100$ at 125x | 75-85: 60-80$ at 100-110x | 60-75: 40-60$ at 80-90x\n"
+    "- 40-60: 20-40$ at 50-70x | <40: HOLD, wait for a better setup\n"
+    "\n"
+    "TP BY SETUP (SL always 0.1-0.2%):\n"
+    "- Breakout 1.5-2.0% | Momentum 1.0-1.5% | Reversal 0.8-1.2% | Scalp 0.5-0.8%\n"
+    "\n"
+    "ENTRY SIGNALS:\n"
+    "- Volume spike + price breakout = max leverage\n"
+    "- RSI extreme bounce (20->40 or 80->60) = aggressive entry\n"
+    "- Explosive MACD cross = full position | EMA20 break with momentum = high leverage\n"
+    "- Multiple confirmations = 125x | Against higher-timeframe trend = lower leverage or HOLD\n"
+)
+
+RESPONSE_FORMAT_TEXT = (
+    "\n"
+    "RESPONSE FORMAT:\n"
+    "Signal: [buy/sell/hold]\n"
+    "Amount: [20-100 USD]\n"
+    "Leverage: [50-125]\n"
+    "SL: [price, 0.1-0.2% away]\n"
+    "TP: [price, 0.5-2.0% away]\n"
+    "Reason: [setup + confidence + profit target]"
+)
+
+RESPONSE_FORMAT_JSON = (
+    "\n"
+    "Respond with JSON: signal (buy/sell/hold), amount (20-100 USD), leverage (50-125), "
+    "sl and tp as absolute prices (SL 0.1-0.2% away, TP 0.5-2.0% away), reason (setup + confidence)."
+)
+
+RESPONSE_FORMAT_BATCH = (
+    "\n"
+    "You receive several markets, each starting with [SYMBOL]. Decide each one independently and respond "
+    "with a JSON array, one object per market: symbol (exactly as given), signal (buy/sell/hold), "
+    "amount (20-100 USD), leverage (50-125), sl and tp as absolute prices of that symbol "
+    "(SL 0.1-0.2% away, TP 0.5-2.0% away), reason (setup + confidence)."
+)
+
+@functools.lru_cache(maxsize=None)
+def system_instruction(json_output=True, batch=False):
+    """Luật chiến lược + định dạng trả lời, dựng một lần cho mỗi chế độ (batch luôn là JSON)."""
+    if batch:
+        return STRATEGY_RULES + RESPONSE_FORMAT_BATCH
+    return STRATEGY_RULES + (RESPONSE_FORMAT_JSON if json_output else RESPONSE_FORMAT_TEXT)
+
+@functools.lru_cache(maxsize=None)
+def system_part(json_output=True, batch=False):
+    """Trường systemInstruction của generateContent (cùng một object cho mọi request)."""
+    return {"parts": [{"text": system_instruction(json_output, batch)}]}
+
+def format_timeframes(timeframes):
+    """Mỗi khung lớn một dòng: trend, RSI, vị trí EMA20/EMA50, MACD histogram, % nến gần nhất."""
+    return "".join(
+        f"{interval}: {features['trend']} RSI {features['rsi']:.0f} "
+        f"EMA20{'>' if features['ema20'] > features['ema50'] else '<'}EMA50 "
+        f"MACDh {features['macd_histogram']:+.2f} last {features['change']:+.2f}%\n"
+        for interval, features in timeframes.items()
+    )
+
+def market_block(snapshot, symbol, timeframes=None):
+    """Phần động của prompt: giá trị indicator mới nhất và xu hướng khung lớn."""
+    return (
+        f"{symbol.split('-')[0]} {snapshot['close']:.1f} | RSI {snapshot['rsi']:.0f} | trend {snapshot['trend']} | "
+        f"ATR {snapshot['atr']:.1f} | EMA20 {snapshot['ema20']:.1f} | EMA50 {snapshot['ema50']:.1f} | "
+        f"MACD {snapshot['macd']:.2f}\n"
+        f"5m {snapshot['price_change_5m']:+.2f}% | volume {snapshot['volume_trend']} | "
+        f"volatility {snapshot['volatility']:.2f}% | confidence {snapshot['confidence']}/100\n"
+        f"ATR SL ±{snapshot['sl_distance']:.1f} | TP ±{snapshot['tp_distance']:.1f}\n"
+        f"{format_timeframes(timeframes or {})}"
+    )
+
+def batch_block(blocks):
+    """Khối thị trường của nhiều symbol trong một prompt: {symbol: market_block} -> [SYMBOL] + khối."""
+    return "\n".join(f"[{symbol}]\n{block}" for symbol, block in blocks.items())
+
+def estimate_tokens(text):
+    """Ước lượng số token (~4 byte/token) khi chưa có usageMetadata từ Gemini."""
+    return (len(text.encode()) + 3) // 4
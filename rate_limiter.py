@@ -0,0 +1,104 @@
+import time
+import threading
+from logger import log_event
+
+# Nhóm endpoint theo hạn mức của BingX (market data tính theo IP, account/trade tính theo UID)
+ENDPOINT_GROUPS = (
+    ("/openApi/swap/v2/quote", "market"),
+    ("/openApi/swap/v3/quote", "market"),
+    ("/openApi/swap/v2/trade", "trade"),
+    ("/openApi/swap/v2/user", "account"),
+    ("/openApi/user/auth", "account"),
+)
+DEFAULT_GROUP = "account"
+
+def endpoint_group(path):
+    for prefix, group in ENDPOINT_GROUPS:
+        if path.startswith(prefix):
+            return group
+    return DEFAULT_GROUP
+
+def parse_retry_after(value):
+    """Retry-After dạng số giây; dạng HTTP-date hoặc không có thì trả None."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Token bucket thread-safe: ngân sách request dùng chung cho mọi symbol/thread."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveRateLimiter:
+    """Token bucket riêng cho từng nhóm endpoint + backoff theo phản hồi của sàn.
+
+    429/5xx/lỗi mạng: chặn cả nhóm trong Retry-After (nếu có) hoặc base * 2^n giây; riêng 429 còn
+    giảm một nửa tốc độ của nhóm, sau đó tăng dần lại về hạn mức cấu hình khi request thành công.
+    """
+
+    def __init__(self, limits, base_backoff=1.0, max_backoff=60.0):
+        self.buckets = {group: RateLimiter(rate, burst) for group, (rate, burst) in limits.items()}
+        self.base_rates = {group: rate for group, (rate, burst) in limits.items()}
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.blocked_until = {group: 0.0 for group in limits}
+        self.failures = {group: 0 for group in limits}
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        """Chờ tới khi nhóm của path được phép gửi; trả về tên nhóm để record()."""
+        group = endpoint_group(path)
+        wait = self.blocked_until[group] - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.buckets[group].acquire()
+        return group
+
+    def record(self, group, status_code=None, retry_after=None):
+        """Cập nhật theo kết quả request (status_code=None nghĩa là lỗi kết nối)."""
+        bucket = self.buckets[group]
+        if status_code is not None and status_code != 429 and status_code < 500:
+            with self._lock:
+                self.failures[group] = 0
+                base_rate = self.base_rates[group]
+                if bucket.rate < base_rate:
+                    bucket.rate = min(base_rate, bucket.rate + base_rate * 0.02)
+            return
+        with self._lock:
+            self.failures[group] += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (self.failures[group] - 1))
+            self.blocked_until[group] = max(self.blocked_until[group], time.monotonic() + delay)
+            if status_code == 429:
+                bucket.rate = max(self.base_rates[group] * 0.1, bucket.rate / 2)
+        log_event(f"BingX {group} trả {status_code or 'lỗi kết nối'}: tạm dừng nhóm {delay:.1f}s, "
+                  f"tốc độ {bucket.rate:.1f} req/s", level="WARNING")
+
+    def cooldown(self):
+        """Số giây còn lại tới khi mọi nhóm hết bị chặn."""
+        return max(0.0, max(self.blocked_until.values()) - time.monotonic())
+
+    def set_rate(self, rate, burst=None):
+        """Đặt lại hạn mức cho mọi nhóm (dùng trong benchmark/test)."""
+        for group, bucket in self.buckets.items():
+            self.base_rates[group] = bucket.rate = rate
+            bucket.capacity = bucket.tokens = burst or rate
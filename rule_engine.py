@@ -0,0 +1,75 @@
+import math
+
+# Bậc (amount, leverage) theo confidence như trong prompt Gemini: >85, 75-85, 60-75, 40-60
+TIERS = ((90.0, 125), (70.0, 105), (50.0, 85), (30.0, 60))
+MIN_CONFIDENCE = 40
+# Khoảng SL/TP (% giá) trong prompt: SL 0.1-0.2%, TP 0.5-2.0%
+SL_RANGE = (0.001, 0.002)
+TP_RANGE = (0.005, 0.02)
+
+def _clamp(value, low, high):
+    return min(high, max(low, value))
+
+def evaluate(snapshot):
+    """Áp trực tiếp các luật trong prompt Gemini lên snapshot indicator, không cần gọi LLM.
+
+    Trả về cùng tuple (signal, amount, leverage, sl, tp, reason) như signal_evaluator.parse_signal_sl_tp.
+    SL/TP lấy theo ATR rồi kẹp vào khoảng % của prompt; đi ngược xu hướng khung lớn (htf_trend)
+    thì hạ một bậc amount/leverage, đang ở bậc thấp nhất thì hold.
+    """
+    price = snapshot["close"]
+    rsi = snapshot["rsi"]
+    trend = snapshot["trend"]
+    confidence = snapshot["confidence"]
+    sl_distance = snapshot["sl_distance"]
+    tp_distance = snapshot["tp_distance"]
+
+    if confidence < MIN_CONFIDENCE or math.isnan(sl_distance) or math.isnan(rsi):
+        return "hold", None, None, None, None, "low confidence"
+    if trend == "tăng" and rsi < 70:
+        signal, direction = "buy", 1
+    elif trend == "giảm" and rsi > 30:
+        signal, direction = "sell", -1
+    else:
+        return "hold", None, None, None, None, f"trend {trend}, rsi {rsi:.0f}"
+
+    if confidence > 85:
+        tier = 0
+    elif confidence >= 75:
+        tier = 1
+    elif confidence >= 60:
+        tier = 2
+    else:
+        tier = 3
+    against = [interval for interval, htf_trend in snapshot.get("htf_trend", ())
+               if htf_trend == ("giảm" if direction > 0 else "tăng")]
+    if against:
+        if tier == len(TIERS) - 1:
+            return "hold", None, None, None, None, f"trend {trend} against {','.join(against)}"
+        tier += 1
+    amount, leverage = TIERS[tier]
+
+    sl = price - direction * _clamp(sl_distance, price * SL_RANGE[0], price * SL_RANGE[1])
+    tp = price + direction * _clamp(tp_distance, price * TP_RANGE[0], price * TP_RANGE[1])
+    reason = f"trend {trend} + confidence {confidence}"
+    if against:
+        reason += f" (against {','.join(against)})"
+    return signal, amount, leverage, sl, tp, reason
+
+def _format_price(price):
+    """Giá đủ chữ số cho symbol giá nhỏ (~0.15), không dạng mũ vì parser text chỉ đọc số thập phân."""
+    return f"{price:.12f}".rstrip("0").rstrip(".")
+
+def decide(snapshot):
+    """Quyết định theo luật cố định (thay Gemini khi backtest/fallback), trả về text đúng format phản hồi Gemini"""
+    signal, amount, leverage, sl, tp, reason = evaluate(snapshot)
+    if signal == "hold":
+        return f"Signal: hold\nReason: {reason}"
+    return (
+        f"Signal: {signal}\n"
+        f"Amount: {amount}\n"
+        f"Leverage: {leverage}\n"
+        f"SL: {_format_price(sl)}\n"
+        f"TP: {_format_price(tp)}\n"
+        f"Reason: {reason}"
+    )
@@ -0,0 +1,83 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logger import log_event, set_log_context, next_cycle_id
+from metrics import SCHEDULER_LAG
+
+class SymbolScheduler:
+    """Chạy chu kỳ của nhiều symbol song song trên worker pool giới hạn.
+
+    cycle_fn(state) trả về số giây chờ tới chu kỳ kế tiếp của symbol đó, nên một symbol
+    chậm (Gemini, mạng) không làm trễ các symbol khác. Chu kỳ lỗi liên tiếp được chờ theo
+    backoff lũy thừa (error_delay * 2^n, tối đa max_error_delay), và không ngắn hơn
+    cooldown_fn() (thời gian rate limiter còn chặn request tới sàn). Lúc rảnh thread chính chỉ chờ
+    Condition tới hạn gần nhất (không polling); wake() từ stream/trigger chạy chu kỳ ngay.
+    """
+
+    def __init__(self, states, cycle_fn, max_workers=4, error_delay=5, max_error_delay=300, cooldown_fn=None):
+        self.states = {state.symbol: state for state in states}
+        self.cycle_fn = cycle_fn
+        self.error_delay = error_delay
+        self.max_error_delay = max_error_delay
+        self.cooldown_fn = cooldown_fn
+        self.failures = {symbol: 0 for symbol in self.states}
+        self.next_run = {symbol: time.monotonic() for symbol in self.states}
+        self.running = set()
+        self.woken = set()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="symbol")
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def wake(self, symbol):
+        """Chạy chu kỳ của symbol ngay khi có worker rảnh (vd. có sự kiện từ stream)."""
+        with self._cond:
+            if symbol in self.next_run:
+                self.next_run[symbol] = time.monotonic()
+                if symbol in self.running:
+                    # Đang chạy: chạy lại ngay sau khi chu kỳ hiện tại kết thúc
+                    self.woken.add(symbol)
+                self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.pool.shutdown(wait=False)
+
+    def _error_delay(self, symbol):
+        self.failures[symbol] += 1
+        delay = min(self.max_error_delay, self.error_delay * 2 ** (self.failures[symbol] - 1))
+        if self.cooldown_fn:
+            delay = max(delay, self.cooldown_fn())
+        return delay
+
+    def run(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                for symbol, due in self.next_run.items():
+                    if due <= now and symbol not in self.running:
+                        SCHEDULER_LAG.observe(now - due)
+                        self.running.add(symbol)
+                        self.pool.submit(self._execute, self.states[symbol])
+                pending = [due for symbol, due in self.next_run.items() if symbol not in self.running]
+                timeout = max(0, min(pending) - now) if pending else None
+                self._cond.wait(timeout)
+
+    def _execute(self, state):
+        set_log_context(state.symbol, next_cycle_id())
+        try:
+            delay = self.cycle_fn(state)
+            self.failures[state.symbol] = 0
+        except Exception as e:
+            delay = self._error_delay(state.symbol)
+            log_event(f"Lỗi: {e} (thử lại sau {delay:.0f}s)", level="ERROR")
+        finally:
+            set_log_context(None)
+            with self._cond:
+                self.running.discard(state.symbol)
+                if state.symbol in self.woken:
+                    self.woken.discard(state.symbol)
+                    delay = 0
+                self.next_run[state.symbol] = time.monotonic() + delay
+                self._cond.notify()
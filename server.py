@@ -1,6 +1,7 @@
-from flask import Flask
+from flask import Flask, Response
 import threading
 import main
+from metrics import render_metrics
 import os
 
 app = Flask(__name__)
@@ -9,6 +10,10 @@ app = Flask(__name__)
 def home():
     return "Bot is running!"
 
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 def run_bot():
     main.main_loop()  # Giả sử logic bot chính nằm trong hàm main_loop() trong main.py
 
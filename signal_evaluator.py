@@ -1,4 +1,126 @@
 import re
+from logger import log_event
+from metrics import STAGE_SECONDS, SIGNAL_PARSE, timed
+from klines import loads
+
+SIGNALS = ("buy", "sell", "hold")
+
+# responseSchema cho chế độ JSON của Gemini (generationConfig), cùng các trường như format text
+SIGNAL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "signal": {"type": "STRING", "enum": list(SIGNALS)},
+        "amount": {"type": "NUMBER"},
+        "leverage": {"type": "INTEGER"},
+        "sl": {"type": "NUMBER"},
+        "tp": {"type": "NUMBER"},
+        "reason": {"type": "STRING"},
+    },
+    "required": ["signal"],
+    "propertyOrdering": ["signal", "amount", "leverage", "sl", "tp", "reason"],
+}
+
+# Chế độ batch: mảng quyết định, mỗi phần tử gắn với symbol của khối thị trường tương ứng
+BATCH_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"symbol": {"type": "STRING"}, **SIGNAL_SCHEMA["properties"]},
+        "required": ["symbol", "signal"],
+        "propertyOrdering": ["symbol"] + SIGNAL_SCHEMA["propertyOrdering"],
+    },
+}
+
+def _number(value, cast=float):
+    try:
+        return cast(value) if value not in (None, "", 0) else None
+    except (TypeError, ValueError):
+        return None
+
+class Signal:
+    """Quyết định đã parse; unpack được như tuple (signal, amount, leverage, sl, tp, reason)."""
+
+    __slots__ = ("signal", "amount", "leverage", "sl", "tp", "reason")
+
+    def __init__(self, signal="hold", amount=None, leverage=None, sl=None, tp=None, reason=""):
+        self.signal = signal
+        self.amount = amount
+        self.leverage = leverage
+        self.sl = sl
+        self.tp = tp
+        self.reason = reason
+
+    @classmethod
+    def from_dict(cls, data):
+        signal = str(data.get("signal") or "hold").strip().lower()
+        return cls(
+            signal if signal in SIGNALS else "hold",
+            _number(data.get("amount")),
+            _number(data.get("leverage"), lambda value: int(float(value))),
+            _number(data.get("sl")),
+            _number(data.get("tp")),
+            str(data.get("reason") or ""),
+        )
+
+    def __iter__(self):
+        return iter((self.signal, self.amount, self.leverage, self.sl, self.tp, self.reason))
+
+    def __eq__(self, other):
+        if not isinstance(other, (Signal, tuple)):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        # Hash như tuple nó thay thế (bằng nhau với tuple thì cùng hash)
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return f"Signal{tuple(self)!r}"
+
+def _strip_fence(text):
+    body = text.strip()
+    if body.startswith("```"):
+        # Một số model vẫn bọc JSON trong code fence
+        body = body.strip("`").strip()
+        if body.startswith("json"):
+            body = body[4:].lstrip()
+    return body
+
+@timed(STAGE_SECONDS, stage="parse")
+def parse_signal(text):
+    """Phản hồi JSON (responseSchema) parse bằng một lần json.loads; không phải JSON hợp lệ thì
+    dùng parser text cũ làm fallback."""
+    body = _strip_fence(text)
+    if body.startswith("{"):
+        try:
+            data = loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            SIGNAL_PARSE.inc(format="json")
+            return Signal.from_dict(data)
+        SIGNAL_PARSE.inc(format="invalid_json")
+    else:
+        SIGNAL_PARSE.inc(format="text")
+    return Signal(*parse_signal_sl_tp(text))
+
+def split_batch(text):
+    """Phản hồi batch -> {symbol: dict quyết định}; phần tử thiếu symbol hoặc không phải JSON bị bỏ."""
+    try:
+        items = loads(_strip_fence(text))
+    except ValueError:
+        SIGNAL_PARSE.inc(format="invalid_json")
+        return {}
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        SIGNAL_PARSE.inc(format="invalid_json")
+        return {}
+    return {
+        str(item["symbol"]).strip().upper(): item
+        for item in items
+        if isinstance(item, dict) and item.get("symbol")
+    }
 
 def parse_signal_sl_tp(text):
     """
@@ -46,4 +168,32 @@ def parse_signal_sl_tp(text):
         elif line.startswith("reason:"):
             reason = line.replace("reason:", "").strip()
     
-    return signal, amount, leverage, sl, tp, reason
\ No newline at end of file
+    return signal, amount, leverage, sl, tp, reason
+
+def validate_sl_tp(signal, current_price, sl, tp):
+    """Kiểm tra và tự động điều chỉnh SL/TP với giá hiện tại"""
+    adjusted_sl = sl
+    adjusted_tp = tp
+    
+    if signal == "buy":
+        # Lệnh mua: SL phải < giá hiện tại, TP phải > giá hiện tại
+        if sl and sl >= current_price:
+            # Auto-adjust SL cho lệnh buy
+            adjusted_sl = current_price * 0.98  # SL = 98% của giá hiện tại
+            log_event(f"Auto-adjust SL buy: {sl} -> {adjusted_sl:.1f}")
+        if tp and tp <= current_price:
+            # Auto-adjust TP cho lệnh buy
+            adjusted_tp = current_price * 1.04  # TP = 104% của giá hiện tại
+            log_event(f"Auto-adjust TP buy: {tp} -> {adjusted_tp:.1f}")
+    elif signal == "sell":
+        # Lệnh bán: SL phải > giá hiện tại, TP phải < giá hiện tại  
+        if sl and sl <= current_price:
+            # Auto-adjust SL cho lệnh sell
+            adjusted_sl = current_price * 1.02  # SL = 102% của giá hiện tại
+            log_event(f"Auto-adjust SL sell: {sl} -> {adjusted_sl:.1f}")
+        if tp and tp >= current_price:
+            # Auto-adjust TP cho lệnh sell
+            adjusted_tp = current_price * 0.96  # TP = 96% của giá hiện tại
+            log_event(f"Auto-adjust TP sell: {tp} -> {adjusted_tp:.1f}")
+    
+    return True, "OK", adjusted_sl, adjusted_tp
@@ -0,0 +1,218 @@
+"""Journal trạng thái append-only (SQLite WAL) thay cho current_order.txt.
+
+Mỗi sự kiện (decision, order_placed, order_closed, fill, balance) là một dòng trong bảng events.
+Ghi qua queue + thread nền, mỗi batch là một transaction (WAL, synchronous=NORMAL nên fsync được
+gộp theo batch/checkpoint); sự kiện quan trọng như order_placed dùng durable=True để chờ commit
+xong (synchronous=FULL cho batch đó). Khởi động chỉ cần một query để dựng lại lệnh đang mở
+và quyết định/số dư gần nhất, không tốn request REST; cùng file dùng được để phân tích P&L:
+
+    python state_journal.py [--db state_journal.db] [--symbol BTC-USDT] [--since 2026-01-01]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    symbol TEXT,
+    order_id TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_kind_symbol ON events (kind, symbol, id);
+CREATE INDEX IF NOT EXISTS events_order ON events (order_id);
+"""
+
+class StateJournal:
+    def __init__(self, path, flush_interval=0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        # append chạy trên nhiều worker của scheduler: += không atomic
+        self._count_lock = threading.Lock()
+        # Tạo schema ngay (đồng bộ) để replay/query dùng được trước khi writer chạy
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, kind, symbol=None, order_id=None, durable=False, **data):
+        """Ghi một sự kiện; durable=True chờ tới khi batch chứa nó đã commit + fsync.
+
+        Trả False nếu sự kiện durable chưa được ghi (ghi lỗi hoặc quá 10s), True trong các trường hợp còn lại.
+        """
+        done = threading.Event() if durable else None
+        record = (time.time(), kind, symbol, str(order_id) if order_id is not None else None,
+                  json.dumps(data, ensure_ascii=False, default=str) if data else None)
+        with self._count_lock:
+            self.submitted += 1
+        self.queue.put((record, done))
+        if done is None:
+            return True
+        return done.wait(10) and done.ok
+
+    def flush(self, timeout=5):
+        """Chờ writer ghi hết queue (dùng lúc thoát và trong script test)."""
+        deadline = time.monotonic() + timeout
+        while self.written + self.failed < self.submitted and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch = [self.queue.get()]
+            # Gom thêm sự kiện trong flush_interval, trừ khi có sự kiện cần durable ngay
+            until = time.monotonic() + self.flush_interval
+            while len(batch) < 1000 and batch[-1][1] is None:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, until - time.monotonic())))
+                except queue.Empty:
+                    break
+            durable = any(done is not None for _, done in batch)
+            ok = False
+            try:
+                if durable:
+                    conn.execute("PRAGMA synchronous=FULL")
+                with conn:
+                    conn.executemany("INSERT INTO events (ts, kind, symbol, order_id, data) VALUES (?, ?, ?, ?, ?)",
+                                     [record for record, _ in batch])
+                if durable:
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                self.written += len(batch)
+                ok = True
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"[{datetime.now()}] Lỗi ghi journal: {e}", file=sys.stderr)
+            for _, done in batch:
+                if done is not None:
+                    done.ok = ok
+                    done.set()
+
+    def replay(self):
+        """Dựng lại trạng thái trong bộ nhớ: {symbol: {"order_id", "decision", "balance"}}.
+
+        Lệnh đang mở = order_placed mới nhất của symbol chưa có order_closed cùng order_id. Sự kiện
+        không gắn symbol (số dư từ user stream) chỉ dùng cho pnl_summary, không vào trạng thái.
+        """
+        state = {}
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT e.kind, e.symbol, e.order_id, e.data FROM events e
+                JOIN (SELECT kind, symbol, MAX(id) AS id FROM events
+                      WHERE kind IN ('order_placed', 'decision', 'balance') AND symbol IS NOT NULL
+                      GROUP BY kind, symbol) last
+                  ON e.id = last.id
+                WHERE e.kind != 'order_placed'
+                   OR NOT EXISTS (SELECT 1 FROM events c WHERE c.kind = 'order_closed' AND c.order_id = e.order_id)
+            """).fetchall()
+        finally:
+            conn.close()
+        for kind, symbol, order_id, data in rows:
+            entry = state.setdefault(symbol, {"order_id": None, "decision": None, "balance": None})
+            if kind == "order_placed":
+                entry["order_id"] = order_id
+            else:
+                entry[kind] = json.loads(data) if data else {}
+        return state
+
+    def query(self, sql, params=()):
+        """Query chỉ đọc trên journal (kết nối riêng, không chặn writer nhờ WAL)."""
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def pnl_summary(self, symbol=None, since=None):
+        """P&L từ fill (realized_pnl, commission) và biến động số dư, không cần gọi sàn."""
+        where, params = ["kind = 'fill'"], []
+        if symbol:
+            where.append("symbol = ?")
+            params.append(symbol)
+        if since:
+            where.append("ts >= ?")
+            params.append(since)
+        fills = self.query(
+            "SELECT symbol, COUNT(*), "
+            "SUM(json_extract(data, '$.realized_pnl')), SUM(json_extract(data, '$.commission')), "
+            "SUM(CASE WHEN json_extract(data, '$.realized_pnl') > 0 THEN 1 ELSE 0 END), "
+            "SUM(CASE WHEN json_extract(data, '$.realized_pnl') < 0 THEN 1 ELSE 0 END) "
+            f"FROM events WHERE {' AND '.join(where)} GROUP BY symbol", params)
+        balances = self.query(
+            "SELECT json_extract(data, '$.balance') FROM events WHERE kind = 'balance' AND ts >= ? ORDER BY id",
+            (since or 0,))
+        by_symbol = {
+            row[0]: {"fills": row[1], "realized_pnl": row[2] or 0.0, "commission": row[3] or 0.0,
+                     "wins": row[4], "losses": row[5]}
+            for row in fills
+        }
+        values = [row[0] for row in balances if row[0] is not None]
+        return {
+            "symbols": by_symbol,
+            "realized_pnl": sum(item["realized_pnl"] for item in by_symbol.values()),
+            "commission": sum(item["commission"] for item in by_symbol.values()),
+            "balance_start": values[0] if values else None,
+            "balance_end": values[-1] if values else None,
+        }
+
+_journal = None
+_journal_lock = threading.Lock()
+
+def get_journal():
+    """StateJournal dùng chung (None nếu JOURNAL_PATH để trống)."""
+    global _journal
+    if _journal is None:
+        from config import JOURNAL_PATH, JOURNAL_FLUSH_INTERVAL
+        if not JOURNAL_PATH:
+            return None
+        with _journal_lock:
+            if _journal is None:
+                _journal = StateJournal(JOURNAL_PATH, JOURNAL_FLUSH_INTERVAL)
+                atexit.register(_journal.flush)
+    return _journal
+
+def journal_event(kind, symbol=None, order_id=None, durable=False, **data):
+    """Ghi sự kiện nếu journal đang bật (JOURNAL_PATH khác rỗng); False nếu sự kiện durable không ghi được."""
+    journal = get_journal()
+    if journal is not None:
+        return journal.append(kind, symbol, order_id, durable, **data)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Phân tích P&L từ journal trạng thái (không gọi sàn)")
+    parser.add_argument("--db", default=os.getenv("JOURNAL_PATH", "state_journal.db"))
+    parser.add_argument("--symbol")
+    parser.add_argument("--since", help="Ngày bắt đầu YYYY-MM-DD")
+    args = parser.parse_args()
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+    journal = StateJournal(args.db)
+    summary = journal.pnl_summary(args.symbol, since)
+    for symbol, item in sorted(summary["symbols"].items()):
+        print(f"{symbol}: {item['fills']} fill | realized {item['realized_pnl']:+.2f} | "
+              f"phí {item['commission']:.2f} | thắng/thua {item['wins']}/{item['losses']}")
+    print(f"Tổng realized: {summary['realized_pnl']:+.2f} | phí: {summary['commission']:.2f} | "
+          f"số dư {summary['balance_start']} -> {summary['balance_end']}")
+    for symbol, entry in sorted(journal.replay().items()):
+        print(f"{symbol}: lệnh đang theo dõi {entry['order_id']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import time
+import threading
+from decimal import Decimal, ROUND_FLOOR, ROUND_HALF_UP
+from config import SYMBOL_RULES_TTL
+from bingx_client import get_client
+from logger import log_event
+
+# Giá trị cũ từng hard-code trong place_order, dùng khi chưa tải được exchangeInfo
+DEFAULT_RULES = {"min_qty": 0.001, "min_notional": 0.0, "tick_size": 0.1, "step_size": 0.000001}
+
+_rules = {}
+_loaded_at = None
+_lock = threading.Lock()
+
+def _precision_step(precision):
+    return 10 ** -int(precision) if precision is not None else 0
+
+def parse_symbol_rules(sym):
+    """Chuẩn hóa một phần tử exchangeInfo (hỗ trợ cả minQty/tickSize lẫn *Precision của BingX)."""
+    step_size = float(sym.get("stepSize") or 0) or _precision_step(sym.get("quantityPrecision"))
+    tick_size = float(sym.get("tickSize") or 0) or _precision_step(sym.get("pricePrecision"))
+    return {
+        "min_qty": float(sym.get("minQty") or sym.get("tradeMinQuantity") or 0),
+        "min_notional": float(sym.get("minNotional") or sym.get("tradeMinUSDT") or 0),
+        "tick_size": tick_size or DEFAULT_RULES["tick_size"],
+        "step_size": step_size or DEFAULT_RULES["step_size"],
+    }
+
+def refresh_symbol_rules():
+    """Tải exchangeInfo một lần và index theo symbol; lỗi thì giữ bản cũ."""
+    global _rules, _loaded_at
+    try:
+        response = get_client().get('/openApi/swap/v2/quote/exchangeInfo', {})
+        if response.status_code == 200:
+            symbols = response.json().get("data", {}).get("symbols", [])
+            rules = {sym.get("symbol"): parse_symbol_rules(sym) for sym in symbols if sym.get("symbol")}
+            if rules:
+                with _lock:
+                    _rules = rules
+                    _loaded_at = time.monotonic()
+                return True
+        log_event(f"Lỗi tải exchangeInfo: {response.status_code} - {response.text}")
+    except Exception as e:
+        log_event(f"Lỗi tải exchangeInfo: {e}")
+    with _lock:
+        # Thử lại sau 1 phút thay vì mỗi lệnh đều gọi mạng khi sàn đang lỗi
+        _loaded_at = time.monotonic() - SYMBOL_RULES_TTL + 60
+    return False
+
+def get_symbol_rules(symbol):
+    """Luật giao dịch của symbol từ cache (chỉ gọi mạng khi cache hết hạn); None nếu sàn không có symbol."""
+    if _loaded_at is None or time.monotonic() - _loaded_at > SYMBOL_RULES_TTL:
+        refresh_symbol_rules()
+    return _rules.get(symbol)
+
+def floor_to_step(value, step):
+    """Làm tròn xuống theo step size (không bao giờ vượt margin đã tính)."""
+    step = Decimal(str(step))
+    return float((Decimal(str(value)) / step).to_integral_value(ROUND_FLOOR) * step)
+
+def round_to_tick(price, tick):
+    """Làm tròn giá theo tick size để sàn không từ chối vì sai precision."""
+    tick = Decimal(str(tick))
+    return float((Decimal(str(price)) / tick).to_integral_value(ROUND_HALF_UP) * tick)
@@ -0,0 +1,90 @@
+import os
+import json
+import pandas as pd
+from mock_exchange import use_temp_paths
+
+# Chạy offline: config đọc env lúc import
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+from backtester import prepare_features, run_backtest
+from indicator_processor import score_confidence
+from klines import KlineColumns, resample
+from batch_indicators import trend_snapshot
+from config import HTF_INTERVALS
+from test_indicator_state import make_klines
+
+def test_confidence_parity():
+    """Confidence vector hóa của backtest khớp score_confidence của live ở từng nến"""
+    print("=== TESTING BACKTEST CONFIDENCE ===")
+    window = 20
+    df = prepare_features(make_klines(600), window)
+    volume = df["volume"]
+    for i in range(window - 1, len(df)):
+        row = df.iloc[i]
+        expected = score_confidence(row["close"], row["rsi"], row["ema20"], row["ema50"], row["macd"],
+                                    row["macd_signal"], volume.iloc[i - 2:i + 1].mean(),
+                                    volume.iloc[i - window + 1:i + 1].mean())
+        assert row["confidence"] == expected, f"nến {i}: {row['confidence']} != {expected}"
+    assert df["confidence"].nunique() > 1
+    print(f"✅ {len(df) - window + 1} nến: confidence khớp score_confidence "
+          f"({df['confidence'].nunique()} mức khác nhau)")
+
+def candle(minute, low=99.8, high=100.2):
+    return {"time": 60000 * minute, "open": 100.0, "high": high, "low": low, "close": 100.0, "volume": 10.0}
+
+def test_exits():
+    """Chuỗi nhỏ có kết quả biết trước: chạm SL, chạm TP, thanh lý theo leverage"""
+    print("=== TESTING BACKTEST EXITS ===")
+    candles = [candle(i) for i in range(40)]
+    candles[22] = candle(22, low=98.8)    # Lệnh 1 (vào nến 19): chạm SL 99
+    candles[26] = candle(26, high=104.5)  # Lệnh 2 (vào nến 23): chạm TP 104
+    candles[30] = candle(30, low=97.5)    # Lệnh 3 (vào nến 27, không SL): thủng giá thanh lý 98 ở 50x
+    decisions = {
+        19: {"signal": "buy", "amount": 80, "leverage": 50, "sl": 99, "tp": 104},
+        23: {"signal": "buy", "amount": 80, "leverage": 50, "sl": 99, "tp": 104},
+        27: {"signal": "buy", "amount": 80, "leverage": 50},
+    }
+
+    def decider(snapshot, window):
+        minute = int(window()["time"].iloc[-1]) // 60000
+        return json.dumps(decisions.get(minute, {"signal": "hold"}))
+
+    result = run_backtest(pd.DataFrame(candles), decider, initial_balance=1000.0, window=20, fee_rate=0.0)
+    trades = result["trades"]
+    assert [trade["outcome"] for trade in trades] == ["sl", "tp", "liquidation"], trades
+    assert [trade["exit_time"] // 60000 for trade in trades] == [22, 26, 30]
+    sl, tp, liquidation = trades
+    assert sl["exit"] == 99 and sl["pnl"] == -1 * sl["quantity"]
+    assert tp["exit"] == 104 and abs(tp["pnl"] - 4 * tp["quantity"]) < 1e-9
+    assert liquidation["exit"] == 98 and liquidation["pnl"] == -liquidation["margin"]
+    assert abs(result["final_balance"] - (1000 + sum(trade["pnl"] for trade in trades))) < 1e-9
+    print(f"✅ SL @99, TP @104, thanh lý @98 (mất {liquidation['margin']:.2f}$ margin); "
+          f"balance ${result['final_balance']:.2f}")
+
+    # Luật của symbol như place_order: notional dưới min_notional thì không vào lệnh
+    strict = {"min_qty": 0.001, "min_notional": 10000.0, "tick_size": 0.01, "step_size": 0.001}
+    result = run_backtest(pd.DataFrame(candles), decider, initial_balance=1000.0, window=20, fee_rate=0.0, rules=strict)
+    assert not result["trades"]
+    print("✅ min_notional của symbol lọc lệnh như place_order")
+
+def test_htf_trend():
+    """htf_trend của backtest khớp trend_snapshot trên nến gộp (nến cuối đang chạy) như run_cycle"""
+    print("=== TESTING BACKTEST HTF TREND ===")
+    candles = make_klines(1500, seed=3)
+    df = prepare_features(candles)
+    counts = {}
+    for i in range(0, len(candles), 37):
+        klines = KlineColumns.from_candles(candles[:i + 1])
+        expected = tuple((interval, trend_snapshot(resample(klines, interval))["trend"]) for interval in HTF_INTERVALS)
+        assert df["htf_trend"].iat[i] == expected, (i, df["htf_trend"].iat[i], expected)
+        for interval, trend in expected:
+            counts[trend] = counts.get(trend, 0) + 1
+    assert len(counts) == 3, counts
+    print(f"✅ htf_trend ({', '.join(HTF_INTERVALS)}) khớp trend_snapshot ở {len(range(0, len(candles), 37))} nến: {counts}")
+
+if __name__ == "__main__":
+    test_confidence_parity()
+    test_exits()
+    test_htf_trend()
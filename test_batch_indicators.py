@@ -0,0 +1,44 @@
+import math
+import time
+from indicator_processor import calculate_indicators, market_snapshot
+from batch_indicators import stack_klines, snapshots_by_symbol
+from test_indicator_state import make_klines
+
+def close_enough(a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return abs(a - b) <= 1e-9 * max(1.0, abs(a))
+
+def test_batch_indicators():
+    """So sánh batch NumPy với pipeline pandas từng symbol và đo thời gian quét 200 symbol"""
+    print("=== TESTING BATCH INDICATORS ===")
+    universe = {f"SYM{i}-USDT": make_klines(100, seed=i) for i in range(200)}
+
+    for limit in (20, 100):
+        symbols, ohlcv = stack_klines(universe, limit)
+        batch = snapshots_by_symbol(symbols, ohlcv)
+        for symbol in symbols[:20]:
+            expected = market_snapshot(calculate_indicators(universe[symbol][-limit:]))
+            for key, value in expected.items():
+                assert close_enough(value, batch[symbol][key]), f"{symbol} {limit} nến: {key} {value} != {batch[symbol][key]}"
+        print(f"✅ {limit} nến: batch khớp market_snapshot pandas")
+
+    for limit in (20, 100):
+        start = time.perf_counter()
+        for symbol in universe:
+            market_snapshot(calculate_indicators(universe[symbol][-limit:]))
+        pandas_elapsed = time.perf_counter() - start
+
+        symbols, ohlcv = stack_klines(universe, limit)
+        start = time.perf_counter()
+        runs = 20
+        for _ in range(runs):
+            snapshots_by_symbol(symbols, ohlcv)
+        batch_elapsed = (time.perf_counter() - start) / runs
+        print(f"{len(universe)} symbol x {limit} nến: pandas {pandas_elapsed * 1000:.0f} ms | "
+              f"batch {batch_elapsed * 1000:.2f} ms ({pandas_elapsed / batch_elapsed:.0f}x)")
+
+if __name__ == "__main__":
+    test_batch_indicators()
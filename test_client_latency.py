@@ -0,0 +1,67 @@
+import os
+import time
+from mock_exchange import MockExchange, use_temp_paths
+
+# Chạy offline: không cần .env thật
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+import requests
+from bingx_client import BingXClient, get_sign, parse_param
+
+API_KEY, API_SECRET = "bench-key", "bench-secret"
+BALANCE_PATH = "/openApi/swap/v2/user/balance"
+
+def bench(label, fn, n):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / n * 1000:8.3f} ms/request ({n} requests)")
+    return elapsed / n
+
+def check(response):
+    """Sàn giả trả code 100001 khi chữ ký sai, nên code 0 nghĩa là chữ ký đã được xác minh."""
+    assert response.status_code == 200, response.status_code
+    assert response.json()["code"] == 0, response.json()
+
+def test_client_latency(n=300):
+    """So sánh latency: requests.request mới mỗi lần vs BingXClient keep-alive"""
+    # Sàn giả riêng (không dùng sàn chung của conftest) để đếm request/kết nối của riêng test này
+    exchange = MockExchange(api_key=API_KEY, api_secret=API_SECRET).start()
+    base_url = exchange.url
+    print(f"=== BENCHMARK BINGX CLIENT ({base_url}) ===")
+
+    def fresh_request():
+        params_str = parse_param({})
+        signature = get_sign(API_SECRET, params_str)
+        url = f"{base_url}{BALANCE_PATH}?{params_str}&signature={signature}"
+        with requests.request("GET", url, headers={"X-BX-APIKEY": API_KEY}) as response:
+            check(response)
+
+    client = BingXClient(base_url=base_url, api_key=API_KEY, api_secret=API_SECRET)
+
+    def pooled_request():
+        check(client.get(BALANCE_PATH, {}))
+
+    try:
+        fresh = bench("requests.request (cũ)", fresh_request, n)
+        fresh_connections = exchange.stats["connections"]
+        pooled = bench("BingXClient (keep-alive)", pooled_request, n)
+        pooled_connections = exchange.stats["connections"] - fresh_connections
+    finally:
+        client.close()
+        exchange.stop()
+    print(f"Speedup: {fresh / pooled:.2f}x (chưa tính TLS handshake khi gọi BingX thật)")
+
+    assert exchange.stats[f"GET {BALANCE_PATH}"] == 2 * (n + 1)
+    assert exchange.stats["bad_signature"] == 0
+    # Mỗi requests.request mở kết nối mới; BingXClient dùng lại một kết nối keep-alive cho mọi request
+    assert fresh_connections == n + 1, fresh_connections
+    assert pooled_connections == 1, pooled_connections
+    print(f"✅ {2 * (n + 1)} request 200, chữ ký hợp lệ; kết nối TCP: {fresh_connections} (cũ) vs {pooled_connections} (keep-alive)")
+
+if __name__ == "__main__":
+    test_client_latency()
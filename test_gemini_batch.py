@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mock_exchange import use_temp_paths, patched
+
+# Gemini giả: prompt batch ([SYMBOL] + khối thị trường) -> mảng JSON, mỗi symbol một quyết định
+received = []
+SIGNALS = {"BTC-USDT": "buy", "ETH-USDT": "sell"}
+DROP = set()  # Symbol mà "model" quên trả lời
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(raw)
+        received.append((payload, len(raw)))
+        prompt = payload["contents"][0]["parts"][0]["text"]
+        time.sleep(0.2)
+        if payload["generationConfig"]["responseSchema"]["type"] == "ARRAY":
+            reply = [{"symbol": symbol, "signal": SIGNALS.get(symbol, "hold"), "amount": 50, "leverage": 100,
+                      "reason": f"batch {symbol}"}
+                     for symbol in re.findall(r"^\[(.+)\]$", prompt, re.M) if symbol not in DROP]
+        else:
+            reply = {"signal": "hold", "reason": "single"}
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": json.dumps(reply)}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+URL = f"http://127.0.0.1:{server.server_address[1]}/model"
+
+SYMBOLS = ["BTC-USDT", "ETH-USDT", "SOL-USDT", "BNB-USDT", "XRP-USDT", "DOGE-USDT", "ADA-USDT", "AVAX-USDT"]
+
+# Chạy offline: config đọc env lúc import
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+from klines import KlineColumns, resample
+from batch_indicators import kline_snapshot, trend_snapshot
+from indicator_processor import format_for_gemini
+import gemini_analyzer
+from gemini_analyzer import analyze_cached, request_decision, BatchAnalyzer
+from signal_evaluator import parse_signal
+from metrics import GEMINI_BATCH_SIZE
+from test_indicator_state import make_klines
+
+def run_watchlist(ask):
+    """Mọi symbol hỏi cùng lúc (như lúc nến đóng); trả {symbol: Signal} và thời gian cả đợt."""
+    results = {}
+
+    def worker(symbol):
+        results[symbol] = parse_signal(ask(symbol))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(symbol,)) for symbol in SYMBOLS]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+def test_gemini_batch():
+    """Một request cho cả watchlist: luật gửi một lần, phản hồi mảng JSON chia lại đúng symbol"""
+    with patched(gemini_analyzer, GEMINI_API_URLS=[URL], GEMINI_BATCH=True, GEMINI_CACHE_TTL=0, GEMINI_HEDGE=False,
+                 _batcher=BatchAnalyzer(max_size=len(SYMBOLS))):
+        print("=== TESTING GEMINI BATCH ===")
+        base = KlineColumns.from_candles(make_klines(1440))
+        snapshot = kline_snapshot(base.tail(100))
+        timeframes = {interval: trend_snapshot(resample(base, interval).tail(100)) for interval in ("5m", "15m", "1h")}
+        prompts = {symbol: format_for_gemini(None, 1000, 100, 10, symbol, snapshot, timeframes) for symbol in SYMBOLS}
+
+        batches = GEMINI_BATCH_SIZE.count()
+
+        # Không batch: mỗi symbol một request, luật chiến lược gửi lại mỗi lần
+        single, single_time = run_watchlist(lambda symbol: request_decision(prompts[symbol], "")[0])
+        single_requests, single_bytes = len(received), sum(size for _, size in received)
+        received.clear()
+
+        batched, batch_time = run_watchlist(
+            lambda symbol: analyze_cached(prompts[symbol], "", snapshot, symbol, fallback=False))
+        assert len(received) == 1, len(received)
+        payload, batch_bytes = received[0]
+        prompt = payload["contents"][0]["parts"][0]["text"]
+        assert all(f"[{symbol}]\n{prompts[symbol]}" in prompt for symbol in SYMBOLS)
+        assert payload["systemInstruction"]["parts"][0]["text"].count("STRATEGY:") == 1
+        assert batched["BTC-USDT"].signal == "buy" and batched["ETH-USDT"].signal == "sell"
+        assert all(batched[symbol].reason == f"batch {symbol}" for symbol in SYMBOLS)
+        print(f"✅ Không batch: {single_requests} request, {single_bytes} byte, {single_time * 1000:.0f} ms")
+        print(f"✅ Batch: 1 request, {batch_bytes} byte ({single_bytes / batch_bytes:.1f}x ít hơn), "
+              f"{batch_time * 1000:.0f} ms, mỗi symbol nhận đúng quyết định của mình")
+
+        # Model bỏ sót một symbol: symbol đó không nhận quyết định của symbol khác
+        received.clear()
+        DROP.add("SOL-USDT")
+        texts = {}
+
+        def ask(symbol):
+            texts[symbol] = analyze_cached(prompts[symbol], "", snapshot, symbol, fallback=False)
+            return texts[symbol] or "Signal: hold"
+
+        run_watchlist(ask)
+        assert len(received) == 1 and texts["SOL-USDT"] == "" and texts["ETH-USDT"]
+        print("✅ Symbol bị model bỏ sót trả rỗng (bỏ qua chu kỳ), các symbol khác vẫn có quyết định")
+
+        # Một symbol hỏi riêng lẻ: hết window thì gửi prompt thường, không dùng mảng
+        received.clear()
+        start = time.perf_counter()
+        text = analyze_cached(prompts["BTC-USDT"], "", snapshot, "BTC-USDT", fallback=False)
+        assert parse_signal(text).reason == "single"
+        assert received[0][0]["generationConfig"]["responseSchema"]["type"] == "OBJECT"
+        print(f"✅ Symbol lẻ: gửi sau window {(time.perf_counter() - start) * 1000:.0f} ms với prompt thường; "
+              f"{GEMINI_BATCH_SIZE.count() - batches} request cho {2 * len(SYMBOLS) + 1} lần hỏi")
+        assert GEMINI_BATCH_SIZE.count() == batches + 3
+
+def test_batch_send_error():
+    """Leader lỗi giữa chừng (split_batch ném exception): follower nhận ("", "error") ngay, không treo"""
+    print("=== TESTING GEMINI BATCH ERROR ===")
+
+    def broken(text):
+        raise ValueError("phản hồi hỏng")
+
+    batcher = BatchAnalyzer(window=1.0, max_size=3)
+    with patched(gemini_analyzer, GEMINI_API_URLS=[URL], GEMINI_HEDGE=False, split_batch=broken):
+        results = {}
+
+        def ask(symbol):
+            # deadline=0: trước đây follower chờ future.result(timeout=None) mãi mãi
+            results[symbol] = batcher.request(symbol, f"block {symbol}", deadline=0)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=ask, args=(symbol,), daemon=True) for symbol in SYMBOLS[:3]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    assert results == {symbol: ("", "error") for symbol in SYMBOLS[:3]}, results
+    print(f"✅ Cả 3 symbol nhận lỗi sau {(time.perf_counter() - start) * 1000:.0f} ms thay vì treo")
+
+if __name__ == "__main__":
+    test_gemini_batch()
+    test_batch_send_error()
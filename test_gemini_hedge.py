@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mock_exchange import use_temp_paths, patched
+
+# Gemini giả: /fast trả ngay, /slow chờ 3s, /error trả 500
+DELAYS = {"/fast": 0.05, "/slow": 3.0}
+REPLY = "Signal: buy\nAmount: 50\nLeverage: 85\nSL: 59900\nTP: 60300\nReason: test"
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+        if path == "/error":
+            self.send_response(500)
+            self.end_headers()
+            return
+        time.sleep(DELAYS.get(path, 0))
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": f"{REPLY} via {path}"}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+BASE = f"http://127.0.0.1:{server.server_address[1]}"
+
+# Chạy offline: config đọc env lúc import
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+import gemini_analyzer
+from gemini_analyzer import request_decision, analyze_cached, hedge_delay
+from metrics import GEMINI_REQUEST_SECONDS, GEMINI_DECISIONS
+
+SNAPSHOT = {"close": 60000.0, "rsi": 55.0, "trend": "tăng", "confidence": 70, "volatility": 0.1,
+            "sl_distance": 100.0, "tp_distance": 200.0}
+
+class RecordingSession:
+    """Session thật, ghi lại timeout HTTP của từng request."""
+
+    def __init__(self, session):
+        self.session = session
+        self.timeouts = []
+
+    def post(self, url, **kwargs):
+        self.timeouts.append((url.split("?")[0], kwargs["timeout"]))
+        return self.session.post(url, **kwargs)
+
+def timed_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def test_gemini_hedge():
+    """Hedge sau p95, hạn chót cứng và fallback rule_engine trên Gemini giả"""
+    with patched(gemini_analyzer, GEMINI_API_URLS=[f"{BASE}/fast"], GEMINI_HEDGE=True, GEMINI_HEDGE_MIN_DELAY=0.3,
+                 GEMINI_BATCH=False, GEMINI_CACHE_TTL=180):
+        print("=== TESTING GEMINI HEDGE/DEADLINE ===")
+
+        # Làm ấm thống kê latency của /fast
+        for _ in range(20):
+            request_decision("warmup", "", urls=[f"{BASE}/fast"])
+        print(f"p95 /fast -> hedge sau {hedge_delay(f'{BASE}/fast'):.2f}s")
+
+        # URL chính chậm: request hedge tới URL thứ hai thắng, không phải chờ 3s
+        session = RecordingSession(gemini_analyzer._session)
+        with patched(gemini_analyzer, _session=session):
+            (text, source), elapsed = timed_call(request_decision, "data", "", deadline=2,
+                                                 urls=[f"{BASE}/slow", f"{BASE}/fast"])
+        assert source == "hedge" and "/fast" in text, (source, text)
+        assert elapsed < 1.0, elapsed
+        print(f"✅ URL chính chậm 3s: hedge trả lời sau {elapsed * 1000:.0f} ms")
+
+        # Timeout HTTP là phần deadline còn lại: hedge gửi sau ~0.3s chỉ còn ~1.7s
+        (primary_url, primary_timeout), (hedge_url, hedge_timeout) = session.timeouts
+        assert primary_url.endswith("/slow") and 1.9 < primary_timeout <= 2, primary_timeout
+        assert hedge_url.endswith("/fast") and hedge_timeout <= 2 - 0.3 + 0.05, hedge_timeout
+        print(f"✅ Timeout HTTP: primary {primary_timeout:.2f}s, hedge {hedge_timeout:.2f}s (deadline 2s)")
+
+        # URL chính lỗi: hedge gửi ngay, không chờ p95
+        (text, source), elapsed = timed_call(request_decision, "data", "", deadline=2, urls=[f"{BASE}/error", f"{BASE}/fast"])
+        assert source == "hedge" and text, (source, text)
+        print(f"✅ URL chính lỗi 500: hedge trả lời sau {elapsed * 1000:.0f} ms")
+
+        # Lỗi nhanh vẫn vào histogram nhưng không vào cửa sổ p95 (không làm hedge bắn sớm)
+        assert GEMINI_REQUEST_SECONDS.count(url=f"{BASE}/error") >= 1
+        assert gemini_analyzer._latency_window(f"{BASE}/error").quantile(0.95) is None
+        print("✅ Phản hồi 500 chỉ ghi histogram, không vào cửa sổ latency của hedge")
+
+        # Cả hai đều chậm: đúng hạn chót thì trả "deadline", không treo 3s
+        (text, source), elapsed = timed_call(request_decision, "data", "", deadline=1, urls=[f"{BASE}/slow"])
+        assert source == "deadline" and not text and elapsed < 1.2, (source, elapsed)
+        print(f"✅ Hạn chót 1s được giữ: trả sau {elapsed * 1000:.0f} ms")
+
+        # analyze_cached quá hạn -> quyết định theo luật, không cache
+        with patched(gemini_analyzer, GEMINI_API_URLS=[f"{BASE}/slow"]):
+            text, elapsed = timed_call(analyze_cached, "data", "", SNAPSHOT, "HEDGE-TEST", deadline=1)
+        assert text.startswith("Signal: buy") and "via" not in text, text
+        assert gemini_analyzer.analysis_cache.get(gemini_analyzer.quantize_market_state(SNAPSHOT, "HEDGE-TEST")) is None
+        print(f"✅ Quá hạn: rule_engine quyết định sau {elapsed * 1000:.0f} ms (không cache)")
+
+        # Chỉ có URL lỗi 500 (lỗi nhanh, không phải quá hạn) -> cũng fallback rule_engine, không cache
+        fallbacks = GEMINI_DECISIONS.value(source="fallback")
+        with patched(gemini_analyzer, GEMINI_API_URLS=[f"{BASE}/error"]):
+            text, elapsed = timed_call(analyze_cached, "data", "", SNAPSHOT, "ERROR-TEST", deadline=2)
+        assert text.startswith("Signal: buy") and elapsed < 1.0, (text, elapsed)
+        assert GEMINI_DECISIONS.value(source="fallback") == fallbacks + 1
+        assert gemini_analyzer.analysis_cache.get(gemini_analyzer.quantize_market_state(SNAPSHOT, "ERROR-TEST")) is None
+        print(f"✅ Mọi URL lỗi 500: rule_engine quyết định sau {elapsed * 1000:.0f} ms (không chờ deadline, không cache)")
+
+        for path in ("/fast", "/slow", "/error"):
+            print(f"Latency {path}: {GEMINI_REQUEST_SECONDS.count(url=BASE + path)} request")
+        print("Quyết định:", {source: GEMINI_DECISIONS.value(source=source)
+                              for source in ("primary", "hedge", "error", "deadline", "fallback")})
+
+if __name__ == "__main__":
+    test_gemini_hedge()
@@ -0,0 +1,63 @@
+import math
+import random
+import time
+from indicator_processor import calculate_indicators, calculate_atr, calculate_market_confidence, IndicatorState
+
+COLUMNS = ["rsi", "ema20", "ema50", "macd", "macd_signal", "macd_histogram"]
+
+def make_klines(n, seed=1):
+    random.seed(seed)
+    price = 60000.0
+    data = []
+    for i in range(n):
+        open_price = price
+        price *= 1 + random.gauss(0, 0.002)
+        high = max(open_price, price) * (1 + abs(random.gauss(0, 0.001)))
+        low = min(open_price, price) * (1 - abs(random.gauss(0, 0.001)))
+        data.append({"open": str(open_price), "high": str(high), "low": str(low), "close": str(price),
+                     "volume": str(random.uniform(1, 100)), "time": 60000 * i})
+    return data
+
+def same(a, b):
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+def test_indicator_state():
+    """So sánh IndicatorState với calculate_indicators (pandas) trên cùng chuỗi nến"""
+    print("=== TESTING INCREMENTAL INDICATORS ===")
+    data = make_klines(300)
+
+    for n in (1, 2, 14, 20, 60, 300):
+        df = calculate_indicators(data[:n])
+        snap = IndicatorState.from_klines(data[:n], volume_window=n).snapshot()
+        last = df.iloc[-1]
+        for column in COLUMNS:
+            assert same(last[column], snap[column]), f"{n} nến: {column} {last[column]} != {snap[column]}"
+        atr = calculate_atr(df).iloc[-1]
+        assert same(atr, snap["atr"]) or abs(atr - snap["atr"]) < 1e-9, f"{n} nến: ATR {atr} != {snap['atr']}"
+        assert calculate_market_confidence(df) == snap["confidence"]
+        print(f"✅ {n} nến: khớp pandas")
+
+    # Nến đang chạy được cập nhật nhiều lần -> replace_last phải như tính lại từ đầu
+    state = IndicatorState.from_klines(data[:50])
+    forming = dict(data[49])
+    for factor in (1.001, 0.998, 1.004):
+        forming["close"] = str(float(data[49]["close"]) * factor)
+        state.sync([forming])
+    assert state.snapshot() == IndicatorState.from_klines(data[:49] + [forming]).snapshot()
+    print("✅ replace_last khớp tính lại từ đầu")
+
+    # Chi phí mỗi nến: O(1) so với dựng lại DataFrame 20 nến
+    window = data[:20]
+    start = time.perf_counter()
+    for _ in range(200):
+        calculate_indicators(window)
+    pandas_cost = (time.perf_counter() - start) / 200
+    start = time.perf_counter()
+    for candle in data:
+        state.update(candle)
+        state.snapshot()
+    state_cost = (time.perf_counter() - start) / len(data)
+    print(f"pandas: {pandas_cost * 1e6:.0f} µs/chu kỳ | IndicatorState: {state_cost * 1e6:.1f} µs/nến")
+
+if __name__ == "__main__":
+    test_indicator_state()
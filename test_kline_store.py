@@ -0,0 +1,95 @@
+import time
+import types
+import tempfile
+import numpy as np
+from mock_exchange import use_mock_exchange, patched
+
+# Sàn giả phải chạy trước khi import module của bot (config đọc env lúc import)
+exchange = use_mock_exchange()
+
+import kline_store
+import data_fetcher
+from kline_store import KlineStore
+from klines import KlineColumns
+from data_fetcher import fetch_klines, fetch_market_data_rest, fetch_base_klines
+
+def test_kline_store():
+    """Đồng bộ tăng dần kho kline trên sàn giả, đọc zero-copy và khởi động lại tức thì"""
+    print("=== TESTING KLINE STORE ===")
+    root = tempfile.mkdtemp()
+    fetched = []
+
+    def counting_fetch(symbol, interval, limit, start_time=None):
+        klines = fetch_klines(symbol, interval, limit, start_time)
+        fetched.append(len(klines))
+        return klines
+
+    # 1. Lần đầu: backfill 1440 nến (2 trang)
+    store = KlineStore(root, counting_fetch, backfill=1440)
+    start = time.perf_counter()
+    store.sync("BTC-USDT", "1m")
+    klines = store.read("BTC-USDT", "1m")
+    times = np.asarray(klines.time)
+    assert len(klines) == 1440 and (np.diff(times) == 60000).all(), (len(klines), fetched)
+    print(f"✅ Backfill {len(klines)} nến qua {len(fetched)} request trong {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # 2. Đồng bộ lại: chỉ tải nến đang chạy (ghi đè tại chỗ), không tải lại cả cửa sổ
+    fetched.clear()
+    store.sync("BTC-USDT", "1m")
+    assert sum(fetched) <= 2 and len(store.read("BTC-USDT", "1m")) in (1440, 1441), fetched
+    print(f"✅ Đồng bộ tăng dần: tải {sum(fetched)} nến thay vì cả cửa sổ")
+
+    # 3. Đọc N nến cuối là slice của memmap (không copy)
+    window = store.read("BTC-USDT", "1m", 20)
+    assert len(window) == 20 and isinstance(window.close.base, np.memmap)
+    runs = 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        store.read("BTC-USDT", "1m", 20).last_close()
+    read_cost = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(20):
+        fetch_market_data_rest("BTC-USDT")
+    rest_cost = (time.perf_counter() - start) / 20
+    print(f"Đọc 20 nến: kho {read_cost * 1e6:.0f} µs | REST (sàn giả local) {rest_cost * 1e6:.0f} µs")
+
+    # 4. Khởi động lại: dữ liệu có ngay từ đĩa, không cần request nào
+    fetched.clear()
+    start = time.perf_counter()
+    restarted = KlineStore(root, counting_fetch).read("BTC-USDT", "1m", 500)
+    assert len(restarted) == 500 and not fetched
+    print(f"✅ Warm-up sau restart: 500 nến trong {(time.perf_counter() - start) * 1e6:.0f} µs, 0 request")
+
+def test_stale_store():
+    """Sync lỗi sau khi kho đã đầy: nến cũ trên đĩa không được đưa vào vòng lặp live"""
+    print("=== TESTING STALE KLINE STORE ===")
+    root = tempfile.mkdtemp()
+    store = KlineStore(root, fetch_klines, backfill=200)
+    assert len(store.sync_and_read("BTC-USDT", "1m", 100)) == 100
+
+    def failing_fetch(symbol, interval, limit, start_time=None):
+        raise ConnectionError("sàn không trả lời")
+
+    # 5 phút sau, sync ném lỗi hoặc REST trả non-200 (KlineColumns rỗng): kho không còn mới
+    later = types.SimpleNamespace(time=lambda: time.time() + 300)
+    with patched(kline_store, time=later):
+        store.fetch = failing_fetch
+        assert len(store.sync_and_read("BTC-USDT", "1m", 100)) == 0
+        store.fetch = lambda *args: KlineColumns()
+        assert len(store.sync_and_read("BTC-USDT", "1m", 100)) == 0
+    # Lỗi sync khi kho vẫn còn mới: dùng dữ liệu trên đĩa như trước
+    store.fetch = failing_fetch
+    assert len(store.sync_and_read("BTC-USDT", "1m", 100)) == 100
+    print("✅ Sync lỗi: kho mới vẫn dùng được, kho cũ hơn 2 nến trả rỗng")
+
+    # Cả kho lẫn REST hỏng: fetch_base_klines rỗng -> run_cycle bỏ qua chu kỳ
+    assert len(fetch_base_klines("BTC-USDT", 100)) == 100
+    non_200 = lambda *args, **kwargs: KlineColumns()
+    with patched(kline_store, time=later), patched(data_fetcher, fetch_klines=non_200), \
+            patched(data_fetcher.get_kline_store(), fetch=non_200):
+        assert len(fetch_base_klines("BTC-USDT", 100)) == 0
+    print("✅ Kho cũ + REST lỗi: không trả nến cũ, chu kỳ bị bỏ qua như trước")
+
+if __name__ == "__main__":
+    test_kline_store()
+    test_stale_store()
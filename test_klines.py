@@ -0,0 +1,79 @@
+import json
+import time
+import pandas as pd
+from klines import KlineColumns, orjson, resample
+from indicator_processor import calculate_indicators, market_snapshot
+from batch_indicators import kline_snapshot, trend_snapshot
+from test_indicator_state import make_klines
+from test_batch_indicators import close_enough
+
+def old_path(content):
+    """Đường cũ: response.json() -> list dict -> DataFrame + astype -> market_snapshot."""
+    return market_snapshot(calculate_indicators(json.loads(content)["data"]))
+
+def new_path(content):
+    return kline_snapshot(KlineColumns.from_response(content))
+
+def test_klines():
+    """So sánh giải mã KlineColumns với đường DataFrame cũ và đo chi phí mỗi chu kỳ"""
+    print(f"=== TESTING KLINE COLUMNS (parser: {'orjson' if orjson else 'json'}) ===")
+
+    # Nến dạng list và thứ tự mới-nhất-trước được chuẩn hóa như nến dict
+    candles = make_klines(30)
+    as_lists = [[c["time"], c["open"], c["high"], c["low"], c["close"], c["volume"]] for c in reversed(candles)]
+    assert KlineColumns.from_candles(as_lists).to_candles() == KlineColumns.from_candles(candles).to_candles()
+    assert KlineColumns.from_candles(candles).last_close() == float(candles[-1]["close"])
+    print("✅ Nến dict/list và thứ tự ngược cho cùng kết quả")
+
+    for n in (20, 100, 500):
+        content = json.dumps({"code": 0, "data": make_klines(n)}).encode()
+        expected, actual = old_path(content), new_path(content)
+        for key, value in expected.items():
+            assert close_enough(value, actual[key]), f"{n} nến: {key} {value} != {actual[key]}"
+
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            old_path(content)
+        old_cost = (time.perf_counter() - start) / runs
+        start = time.perf_counter()
+        for _ in range(runs):
+            new_path(content)
+        new_cost = (time.perf_counter() - start) / runs
+        print(f"✅ {n} nến: DataFrame {old_cost * 1e6:.0f} µs | KlineColumns {new_cost * 1e6:.0f} µs "
+              f"({old_cost / new_cost:.1f}x)")
+
+def pandas_resample(candles, rule):
+    """Tham chiếu: gộp nến bằng DataFrame.resample."""
+    df = pd.DataFrame(candles).astype(float)
+    df.index = pd.to_datetime(df["time"].astype("int64"), unit="ms")
+    return df.resample(rule).agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+
+def test_resample():
+    """Gộp 1m -> 5m/15m/1h trong process phải khớp pandas, khung đầu thiếu nến bị bỏ"""
+    print("=== TESTING RESAMPLE ===")
+    # Bắt đầu lệch 7 phút so với đầu giờ để có khung đầu bị cắt
+    candles = make_klines(1447)[7:]
+    base = KlineColumns.from_candles(candles)
+    for interval, rule in (("5m", "5min"), ("15m", "15min"), ("1h", "1h")):
+        step = {"5m": 5, "15m": 15, "1h": 60}[interval]
+        expected = pandas_resample(candles[(-7) % step:], rule)
+        actual = resample(base, interval)
+        assert len(actual) == len(expected), f"{interval}: {len(actual)} != {len(expected)}"
+        assert int(actual.time[0]) % (step * 60000) == 0
+        for field in ("open", "high", "low", "close", "volume"):
+            assert all(close_enough(a, b) for a, b in zip(getattr(actual, field), expected[field])), f"{interval} {field}"
+        features = trend_snapshot(actual.tail(100))
+        print(f"✅ {interval}: {len(actual)} nến khớp pandas | trend {features['trend']} RSI {features['rsi']:.0f}")
+
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        for interval in ("5m", "15m", "1h"):
+            trend_snapshot(resample(base, interval).tail(100))
+    cost = (time.perf_counter() - start) / runs
+    print(f"✅ 3 khung từ 1440 nến 1m: {cost * 1e6:.0f} µs mỗi chu kỳ (không tốn request)")
+
+if __name__ == "__main__":
+    test_klines()
+    test_resample()
@@ -0,0 +1,100 @@
+import os
+import time
+import json
+import tempfile
+import threading
+import contextlib
+from datetime import datetime
+from mock_exchange import use_temp_paths
+
+# Chạy offline: không cần .env thật
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+from logger import AsyncLogWriter, set_log_context
+
+# Số dòng log của một lần đặt lệnh (balance, sizing, SL/TP, kết quả...)
+ORDER_PATH_LINES = 30
+
+def sync_log(event):
+    """log_event cũ: format datetime + print đồng bộ ngay trên luồng đặt lệnh."""
+    print(f"[{datetime.now()}] {event}")
+
+def order_path(log, i):
+    for n in range(ORDER_PATH_LINES):
+        log(f"Order {i} step {n}: quantity 0.016656 BTC, margin $100.00")
+
+def test_logger():
+    """Đo overhead mỗi lần gọi log trên luồng đặt lệnh: print đồng bộ vs queue + thread nền"""
+    print("=== TESTING ASYNC LOGGER ===")
+    tmp = tempfile.mkdtemp()
+    orders = 2000
+    calls = orders * ORDER_PATH_LINES
+
+    # stdout thật (terminal/pipe của Render) được mô phỏng bằng file line-buffered
+    with open(os.path.join(tmp, "stdout.txt"), "w", buffering=1) as stdout, contextlib.redirect_stdout(stdout):
+        start = time.perf_counter()
+        for i in range(orders):
+            order_path(sync_log, i)
+        sync_elapsed = time.perf_counter() - start
+
+        writer = AsyncLogWriter(path=os.path.join(tmp, "bench.log"))
+        set_log_context("BTC-USDT", 1)
+        start = time.perf_counter()
+        for i in range(orders):
+            order_path(lambda event: writer.submit("INFO", event, None), i)
+        async_elapsed = time.perf_counter() - start
+        writer.flush(30)
+        drain_elapsed = time.perf_counter() - start
+        set_log_context(None)
+
+    print(f"print đồng bộ: {sync_elapsed / calls * 1e6:.2f} µs/dòng, "
+          f"{sync_elapsed / orders * 1e3:.3f} ms/lệnh")
+    print(f"queue bất đồng bộ: {async_elapsed / calls * 1e6:.2f} µs/dòng, "
+          f"{async_elapsed / orders * 1e3:.3f} ms/lệnh (ghi xong sau {drain_elapsed:.2f}s ở thread nền)")
+    with open(os.path.join(tmp, "bench.log"), encoding="utf-8") as f:
+        record = json.loads(f.readline())
+    assert record["symbol"] == "BTC-USDT" and record["cycle_id"] == 1 and record["level"] == "INFO", record
+    assert writer.written == calls
+
+    # Backpressure: queue nhỏ, DEBUG bị bỏ nhưng INFO thì không
+    writer = AsyncLogWriter(path=os.path.join(tmp, "pressure.log"), queue_size=100, console=False)
+    for i in range(20000):
+        writer.submit("DEBUG", f"debug {i}", None)
+        if i % 100 == 0:
+            writer.submit("INFO", f"info {i}", None)
+    writer.flush(10)
+    with open(os.path.join(tmp, "pressure.log"), encoding="utf-8") as f:
+        levels = [json.loads(line)["level"] for line in f]
+    assert levels.count("INFO") == 200, levels.count("INFO")
+    print(f"✅ Backpressure: bỏ {writer.dropped} dòng DEBUG, giữ đủ 200 dòng INFO")
+
+    # Nhiều worker cùng log: bộ đếm submitted không hụt, flush() chỉ trả về khi đã ghi hết
+    writer = AsyncLogWriter(path=os.path.join(tmp, "threads.log"), console=False)
+    threads = [threading.Thread(target=lambda: [writer.submit("INFO", "worker", None) for _ in range(5000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush(10)
+    with open(os.path.join(tmp, "threads.log"), encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    assert writer.submitted == writer.written == lines == 40000, (writer.submitted, writer.written, lines)
+    print(f"✅ 8 thread x 5000 dòng: submitted = written = {lines}")
+
+    # Xoay vòng file theo kích thước
+    path = os.path.join(tmp, "trade_log.txt")
+    writer = AsyncLogWriter(path=path, max_bytes=20000, backup_count=2, console=False)
+    for i in range(2000):
+        writer.submit("INFO", f"rotate {i}", {"price": 60000.0})
+        if i % 200 == 0:
+            writer.flush()
+    writer.flush()
+    sizes = [os.path.getsize(p) for p in (path, path + ".1", path + ".2") if os.path.exists(p)]
+    assert len(sizes) == 3 and not os.path.exists(path + ".3") and max(sizes) <= 20000, sizes
+    print(f"✅ Xoay vòng file: {sizes} bytes")
+
+if __name__ == "__main__":
+    test_logger()
@@ -0,0 +1,212 @@
+import os
+import gzip
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import threading
+
+from mock_exchange import use_mock_exchange, patched
+
+# Chạy offline: sàn giả cho phần nạp nến qua REST, config đọc env lúc import
+exchange = use_mock_exchange()
+
+import market_stream
+from market_stream import MarketStream
+from data_fetcher import start_market_stream, get_timeframes, base_window, get_live_snapshot
+from config import TIMEFRAME, HTF_INTERVALS, KLINE_LIMIT
+from klines import KlineColumns
+from indicator_processor import IndicatorState
+from batch_indicators import kline_snapshot
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class FakeBingXWebSocket:
+    """WebSocket server giả lập BingX (stdlib): handshake, push gzip, đọc frame subscribe."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.url = f"ws://127.0.0.1:{self.sock.getsockname()[1]}"
+        self.conn = None
+        self.subscriptions = []
+        self.connected = threading.Event()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            request = b""
+            while b"\r\n\r\n" not in request:
+                request += conn.recv(1024)
+            key = [line.split(":", 1)[1].strip() for line in request.decode().split("\r\n")
+                   if line.lower().startswith("sec-websocket-key")][0]
+            accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+            conn.sendall((
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode())
+            self.conn = conn
+            self.connected.set()
+            threading.Thread(target=self._read_loop, args=(conn,), daemon=True).start()
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                header = conn.recv(2)
+                if len(header) < 2:
+                    return
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack(">H", conn.recv(2))[0]
+                elif length == 127:
+                    length = struct.unpack(">Q", conn.recv(8))[0]
+                mask = conn.recv(4)
+                data = bytearray(conn.recv(length))
+                for i in range(len(data)):
+                    data[i] ^= mask[i % 4]
+                if header[0] & 0x0F == 0x1:
+                    self.subscriptions.append(json.loads(data.decode())["dataType"])
+        except OSError:
+            return
+
+    def push(self, payload, raw_text=None):
+        body = gzip.compress((raw_text or json.dumps(payload)).encode())
+        length = len(body)
+        if length < 126:
+            header = struct.pack(">BB", 0x82, length)
+        else:
+            header = struct.pack(">BBH", 0x82, 126, length)
+        self.conn.sendall(header + body)
+
+    def drop(self):
+        self.connected.clear()
+        self.conn.shutdown(socket.SHUT_RDWR)
+        self.conn.close()
+
+def wait_until(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_market_stream():
+    """Kiểm tra stream kline/giá với server WebSocket giả lập chạy local"""
+    print("=== TESTING MARKET STREAM ===")
+    with patched(market_stream, STREAM_STALE_SECONDS=2):
+        server = FakeBingXWebSocket()
+        seed = [{"open": "100", "high": "101", "low": "99", "close": "100.5", "volume": "10", "time": 60000 * i}
+                for i in range(1, 21)]
+        stream = MarketStream("BTC-USDT", url=server.url, seed=lambda: list(seed)).start()
+
+        assert server.connected.wait(3), "Stream không kết nối được"
+        assert wait_until(lambda: len(server.subscriptions) == 2)
+        print(f"✅ Subscribed: {server.subscriptions}")
+        assert len(stream.get_candles()) == 20
+
+        # Cập nhật nến đang chạy + thêm nến mới
+        server.push({"dataType": "BTC-USDT@kline_1m",
+                     "data": [{"o": "100", "h": "102", "l": "99", "c": "101.5", "v": "12", "T": 60000 * 20}]})
+        server.push({"dataType": "BTC-USDT@kline_1m",
+                     "data": [{"o": "101.5", "h": "103", "l": "101", "c": "102.7", "v": "3", "T": 60000 * 21}]})
+        server.push({"dataType": "BTC-USDT@lastPrice", "data": {"s": "BTC-USDT", "c": "102.9"}})
+        assert wait_until(lambda: stream.get_price() == 102.9)
+        candles = stream.get_candles(20)
+        assert candles[-2]["close"] == "101.5" and candles[-1]["close"] == "102.7"
+        print(f"✅ Ring buffer: {len(stream.get_candles())} nến, giá cuối {stream.get_price()}")
+
+        # Ping/Pong + healthy
+        server.push(None, raw_text="Ping")
+        assert stream.is_healthy()
+
+        # Mất kết nối -> không còn healthy (data_fetcher fallback REST), sau đó tự reconnect
+        server.drop()
+        assert wait_until(lambda: not stream.is_healthy())
+        print("✅ Mất kết nối được phát hiện, data_fetcher sẽ fallback REST")
+        assert server.connected.wait(5), "Stream không tự reconnect"
+        assert wait_until(stream.is_healthy)
+        print("✅ Reconnect thành công, nến được nạp lại từ seed")
+
+        stream.stop()
+
+def test_stream_timeframes():
+    """Stream mode: buffer được nạp đủ cửa sổ MTF, get_timeframes không tốn request kline nào"""
+    print("=== TESTING STREAM TIMEFRAMES ===")
+    server = FakeBingXWebSocket()
+    stream = start_market_stream("BTC-USDT", url=server.url)
+    assert server.connected.wait(3) and wait_until(stream.is_healthy)
+    assert len(stream.get_candles()) >= base_window()
+    print(f"✅ Buffer stream: {len(stream.get_candles())} nến 1m (cần {base_window()} cho {TIMEFRAME} + {HTF_INTERVALS})")
+
+    kline_calls = exchange.stats["GET /openApi/swap/v3/quote/klines"]
+    timeframes = get_timeframes("BTC-USDT")
+    assert len(timeframes[TIMEFRAME]) == KLINE_LIMIT
+    assert all(len(timeframes[interval]) for interval in HTF_INTERVALS)
+
+    # Nến mới từ stream có ngay trong khung chính ở chu kỳ kế tiếp
+    last = int(stream.get_candles(1)[0]["time"])
+    server.push({"dataType": "BTC-USDT@kline_1m",
+                 "data": [{"o": "1", "h": "2", "l": "1", "c": "1.5", "v": "5", "T": last + 60000}]})
+    assert wait_until(lambda: int(stream.get_candles(1)[0]["time"]) == last + 60000)
+    timeframes = get_timeframes("BTC-USDT")
+    assert timeframes[TIMEFRAME].last_close() == 1.5
+    assert exchange.stats["GET /openApi/swap/v3/quote/klines"] == kline_calls
+    print(f"✅ 2 chu kỳ get_timeframes: 0 request kline, {', '.join(f'{k}={len(v)}' for k, v in timeframes.items())}")
+    stream.stop()
+    # Stream đã stop: không còn phục vụ nến cũ, data_fetcher quay về kho/REST ngay
+    assert not stream.is_healthy()
+
+def test_stream_indicators():
+    """TIMEFRAME 1m: IndicatorState cập nhật theo từng push, khớp tính lại từ đầu trên buffer stream"""
+    print("=== TESTING STREAM INDICATORS ===")
+    server = FakeBingXWebSocket()
+    stream = start_market_stream("ETH-USDT", url=server.url)
+    assert server.connected.wait(3) and wait_until(stream.is_healthy)
+    if TIMEFRAME != stream.interval:
+        assert get_live_snapshot("ETH-USDT") is None
+        print(f"✅ TIMEFRAME {TIMEFRAME}: run_cycle tính indicator từ klines")
+        stream.stop()
+        return
+
+    def rebuilt():
+        return IndicatorState.from_klines(stream.get_candles(), volume_window=KLINE_LIMIT).snapshot()
+
+    def push(minute_time, close):
+        server.push({"dataType": "ETH-USDT@kline_1m", "data": [
+            {"o": str(close), "h": str(close * 1.001), "l": str(close * 0.999), "c": str(close), "v": "7", "T": minute_time}]})
+        assert wait_until(lambda: get_live_snapshot("ETH-USDT")["close"] == close)
+
+    snapshot = get_live_snapshot("ETH-USDT")
+    assert snapshot == rebuilt()
+    # RSI/ATR chỉ phụ thuộc 14 nến cuối: khớp kline_snapshot trên cùng buffer
+    batch = kline_snapshot(KlineColumns.from_candles(stream.get_candles()))
+    assert all(abs(snapshot[key] - batch[key]) <= 1e-9 * max(1.0, abs(batch[key])) for key in ("close", "rsi", "atr"))
+
+    last = int(stream.get_candles(1)[0]["time"])
+    push(last, snapshot["close"] * 1.002)   # Nến đang chạy: replace_last
+    push(last + 60000, snapshot["close"] * 0.997)  # Nến mới: update
+    assert get_live_snapshot("ETH-USDT") == rebuilt()
+    print(f"✅ Push nến đang chạy + nến mới: IndicatorState khớp tính lại trên {len(stream.get_candles())} nến")
+
+    push(last + 5 * 60000, snapshot["close"])  # Hổng 3 nến (như sau reconnect): dựng lại từ buffer
+    assert get_live_snapshot("ETH-USDT") == rebuilt()
+    print("✅ Nến bị hổng: dựng lại từ buffer stream")
+
+    server.drop()
+    assert wait_until(lambda: get_live_snapshot("ETH-USDT") is None)
+    print("✅ Stream mất kết nối: get_live_snapshot trả None, run_cycle tính từ klines REST")
+    stream.stop()
+
+if __name__ == "__main__":
+    test_market_stream()
+    test_stream_timeframes()
+    test_stream_indicators()
@@ -0,0 +1,57 @@
+import time
+from mock_exchange import use_mock_exchange
+
+# Sàn giả phải chạy trước khi import module của bot (config đọc env lúc import)
+exchange = use_mock_exchange()
+
+from server import app
+from metrics import Histogram, STAGE_SECONDS, BINGX_REQUEST_SECONDS, timed
+from main import fetch_cycle_snapshot
+
+def test_metrics():
+    """Đo overhead của decorator/histogram và kiểm tra /metrics trên sàn giả"""
+    print("=== TESTING METRICS ===")
+
+    histogram = Histogram("bench_seconds", "bench")
+
+    def noop():
+        return None
+
+    timed_noop = timed(histogram, stage="bench")(noop)
+    calls = 200000
+    start = time.perf_counter()
+    for _ in range(calls):
+        noop()
+    baseline = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        timed_noop()
+    elapsed = time.perf_counter() - start
+    print(f"Overhead @timed: {(elapsed - baseline) / calls * 1e6:.2f} µs/lần gọi")
+    assert histogram.count(stage="bench") == calls
+
+    # pytest chạy mọi test chung process: so sánh phần tăng thêm của chu kỳ này
+    klines_path = "/openApi/swap/v3/quote/klines"
+    snapshots = STAGE_SECONDS.count(stage="exchange_snapshot")
+    balances = BINGX_REQUEST_SECONDS.count(endpoint="/openApi/swap/v2/user/balance", method="GET")
+    kline_requests = exchange.stats[f"GET {klines_path}"]
+    kline_observed = BINGX_REQUEST_SECONDS.count(endpoint=klines_path, method="GET")
+    fetch_cycle_snapshot("BTC-USDT")
+    assert STAGE_SECONDS.count(stage="exchange_snapshot") == snapshots + 1
+    assert BINGX_REQUEST_SECONDS.count(endpoint="/openApi/swap/v2/user/balance", method="GET") == balances + 1
+    # Lần đầu kho kline backfill KLINE_STORE_BACKFILL nến theo trang SYNC_PAGE: có thể hơn một request
+    kline_requests = exchange.stats[f"GET {klines_path}"] - kline_requests
+    assert kline_requests >= 1
+    assert BINGX_REQUEST_SECONDS.count(endpoint=klines_path, method="GET") - kline_observed == kline_requests
+
+    body = app.test_client().get("/metrics").get_data(as_text=True)
+    for line in body.splitlines():
+        if "_count" in line:
+            print(line)
+    assert f'bot_stage_seconds_count{{stage="exchange_snapshot"}} {snapshots + 1}' in body
+    total = BINGX_REQUEST_SECONDS.count(endpoint=klines_path, method="GET")
+    assert f'bingx_request_seconds_bucket{{endpoint="{klines_path}",method="GET",le="+Inf"}} {total}' in body
+    print("✅ /metrics trả về định dạng Prometheus")
+
+if __name__ == "__main__":
+    test_metrics()
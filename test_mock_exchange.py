@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mock_exchange import use_mock_exchange
+
+# Sàn giả phải chạy trước khi import module của bot (config đọc env lúc import)
+exchange = use_mock_exchange(latency=0.005)
+
+from main import has_open_orders, fetch_cycle_snapshot
+from data_fetcher import get_market_data, get_current_price
+from trade_executor import get_account_balance, get_open_positions, place_order, set_leverage, is_order_open
+from bingx_client import get_client
+from logger import log_event
+
+def exchange_cycle(symbol="BTC-USDT"):
+    """Phần gọi sàn của một chu kỳ main_loop (không gồm Gemini)."""
+    get_open_positions(symbol)
+    has_open_orders(symbol)
+    get_account_balance()
+    get_market_data(symbol)
+    get_current_price(symbol)
+
+def test_mock_exchange():
+    """Đo throughput vòng lặp bot trên sàn giả và tái hiện bão 429"""
+    print(f"=== TESTING WITH MOCK EXCHANGE ({exchange.url}) ===")
+
+    # 1. Chữ ký hợp lệ + đặt lệnh end-to-end
+    balance = get_account_balance()
+    assert balance and balance["available_margin"] > 0, "Chữ ký bị sàn giả từ chối"
+    price = get_current_price()
+    print(set_leverage(10, "LONG"))
+    balance_calls = exchange.stats["GET /openApi/swap/v2/user/balance"]
+    result = place_order("buy", sl=price * 0.99, tp=price * 1.02, leverage=10, trade_amount=100,
+                         current_price=price, account_balance=balance["available_margin"], balance_info=balance)
+    assert result.get("code") == 0, result
+    assert exchange.stats["GET /openApi/swap/v2/user/balance"] == balance_calls, "Snapshot số dư còn mới nhưng vẫn gọi lại"
+    order_id = result["data"]["order"]["orderId"]
+    assert get_open_positions() and not is_order_open(order_id)
+    exchange.state.close_positions()
+    print(f"✅ Đặt lệnh {order_id} trên sàn giả, chữ ký hợp lệ")
+
+    # 2. Throughput: chu kỳ tuần tự vs song song nhiều symbol (rate limiter dùng chung vẫn áp dụng)
+    get_client().rate_limiter.set_rate(1000)
+    cycles = 20
+    start = time.perf_counter()
+    for _ in range(cycles):
+        exchange_cycle()
+    elapsed = time.perf_counter() - start
+    print(f"Tuần tự: {cycles / elapsed:.1f} chu kỳ/s ({elapsed / cycles * 1000:.1f} ms/chu kỳ, 5 request)")
+
+    start = time.perf_counter()
+    for _ in range(cycles):
+        snapshot = fetch_cycle_snapshot("BTC-USDT")
+    elapsed = time.perf_counter() - start
+    assert snapshot.balance_info and snapshot.market_data and snapshot.price
+    print(f"Snapshot song song: {cycles / elapsed:.1f} chu kỳ/s ({elapsed / cycles * 1000:.1f} ms/chu kỳ)")
+
+    symbols = [f"SYM{i}-USDT" for i in range(8)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(symbols)) as pool:
+        list(pool.map(lambda s: [exchange_cycle(s) for _ in range(cycles)], symbols))
+    elapsed = time.perf_counter() - start
+    print(f"{len(symbols)} symbol song song: {len(symbols) * cycles / elapsed:.1f} chu kỳ/s")
+
+    # 3. Bão 429: xem bot phản ứng thế nào
+    exchange.start_429_storm(1.0)
+    before = exchange.stats["429"]
+    start = time.perf_counter()
+    balance = get_account_balance()
+    data = get_market_data()
+    log_event(f"Trong bão 429: balance={balance}, klines={len(data)} nến, "
+              f"{exchange.stats['429'] - before} response 429 trong {time.perf_counter() - start:.2f}s")
+    time.sleep(1.0)
+    assert get_account_balance(), "Sàn giả không hồi phục sau bão 429"
+    print("✅ Hồi phục sau bão 429")
+
+    # 4. Sàn giới hạn 50 req/s: limiter giảm tốc độ nhóm market theo 429 + Retry-After thay vì dội liên tục
+    limiter = get_client().rate_limiter
+    limiter.set_rate(200)
+    exchange.rate_limit = 50
+    before = exchange.stats["429"]
+    ok = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < 3:
+        ok += get_client().get("/openApi/swap/v2/quote/price", {"symbol": "BTC-USDT"}, signed=False).status_code == 200
+    rejected = exchange.stats["429"] - before
+    exchange.rate_limit = None
+    print(f"Giới hạn 50 req/s: {ok} request thành công, {rejected} response 429 trong 3s, "
+          f"tốc độ nhóm market còn {limiter.buckets['market'].rate:.1f} req/s")
+    assert ok and limiter.buckets["market"].rate < 200
+    print(f"Thống kê sàn giả: {dict(exchange.stats)}")
+
+if __name__ == "__main__":
+    test_mock_exchange()
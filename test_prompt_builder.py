@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mock_exchange import use_temp_paths, patched
+
+# Gemini giả: ghi lại payload nhận được, trả usageMetadata như API thật
+received = []
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        received.append(payload)
+        system = payload["systemInstruction"]["parts"][0]["text"]
+        prompt = payload["contents"][0]["parts"][0]["text"]
+        body = json.dumps({
+            "candidates": [{"content": {"parts": [{"text": '{"signal": "hold", "reason": "test"}'}]}}],
+            # Lần thứ hai trở đi prefix tĩnh được cache
+            "usageMetadata": {"promptTokenCount": (len(system) + len(prompt)) // 4,
+                              "cachedContentTokenCount": len(system) // 4 if len(received) > 1 else 0,
+                              "candidatesTokenCount": 12},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+URL = f"http://127.0.0.1:{server.server_address[1]}/model"
+
+# Chạy offline: config đọc env lúc import
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+from klines import KlineColumns, resample
+from batch_indicators import kline_snapshot, trend_snapshot
+from indicator_processor import format_for_gemini
+from prompt_builder import system_instruction, estimate_tokens
+import gemini_analyzer
+from gemini_analyzer import analyze
+from metrics import GEMINI_TOKENS
+from test_indicator_state import make_klines
+
+def test_prompt_builder():
+    """Luật tĩnh đi qua systemInstruction, mỗi chu kỳ chỉ gửi khối thị trường ngắn và đếm token"""
+    print("=== TESTING PROMPT BUILDER ===")
+    base = KlineColumns.from_candles(make_klines(1440))
+    snapshot = kline_snapshot(base.tail(100))
+    timeframes = {interval: trend_snapshot(resample(base, interval).tail(100)) for interval in ("5m", "15m", "1h")}
+
+    market = format_for_gemini(None, 1000, 100, 10, "BTC-USDT", snapshot, timeframes)
+    static = system_instruction(True)
+    assert "BTC" in market and "1h:" in market and "AMOUNT & LEVERAGE" not in market
+    print(f"Phần tĩnh (systemInstruction): {len(static.encode())} byte ~{estimate_tokens(static)} token, dựng một lần")
+    print(f"Khối thị trường mỗi chu kỳ: {len(market.encode())} byte ~{estimate_tokens(market)} token")
+    assert system_instruction(True) is static
+
+    runs = 20000
+    start = time.perf_counter()
+    for _ in range(runs):
+        format_for_gemini(None, 1000, 100, 10, "BTC-USDT", snapshot, timeframes)
+    print(f"✅ Dựng prompt: {(time.perf_counter() - start) / runs * 1e6:.1f} µs")
+
+    before = {kind: GEMINI_TOKENS.value(kind=kind) for kind in ("prompt", "cached", "output")}
+    with patched(gemini_analyzer, GEMINI_API_URLS=[URL], GEMINI_JSON_OUTPUT=True, GEMINI_HEDGE=False):
+        for _ in range(3):
+            assert analyze(market, "")
+    assert all(payload["systemInstruction"]["parts"][0]["text"] == static for payload in received)
+    assert received[0]["contents"][0]["parts"][0]["text"] == market
+    assert received[0]["generationConfig"]["responseMimeType"] == "application/json"
+    counts = {kind: GEMINI_TOKENS.value(kind=kind) - before[kind] for kind in before}
+    assert counts["cached"] > 0 and counts["output"] == 36
+    print(f"✅ 3 request: systemInstruction giống hệt nhau, token theo usageMetadata {counts}")
+
+if __name__ == "__main__":
+    test_prompt_builder()
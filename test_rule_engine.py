@@ -0,0 +1,75 @@
+import os
+import time
+from mock_exchange import use_temp_paths
+
+# Chạy offline: không cần .env thật
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+import rule_engine
+from klines import KlineColumns
+from batch_indicators import kline_snapshot
+from signal_evaluator import parse_signal_sl_tp, validate_sl_tp
+from test_indicator_state import make_klines
+
+def test_rule_engine():
+    """rule_engine.evaluate cho cùng tuple với parse_signal_sl_tp và chạy trong micro giây"""
+    print("=== TESTING RULE ENGINE ===")
+
+    candles = make_klines(600, seed=7)
+    snapshots = [kline_snapshot(KlineColumns.from_candles(candles[i - 100:i])) for i in range(100, 600, 5)]
+    signals = {"buy": 0, "sell": 0, "hold": 0}
+    for snapshot in snapshots:
+        decision = rule_engine.evaluate(snapshot)
+        parsed = parse_signal_sl_tp(rule_engine.decide(snapshot))
+        assert decision[:3] == parsed[:3], (decision, parsed)
+        if decision[0] != "hold":
+            price = snapshot["close"]
+            assert abs(decision[3] - parsed[3]) <= 1e-9 * price and abs(decision[4] - parsed[4]) <= 1e-9 * price
+            # SL 0.1-0.2%, TP 0.5-2.0% như trong prompt
+            assert 0.001 - 1e-9 <= abs(price - decision[3]) / price <= 0.002 + 1e-9
+            assert 0.005 - 1e-9 <= abs(decision[4] - price) / price <= 0.02 + 1e-9
+        signals[decision[0]] += 1
+    print(f"✅ {len(snapshots)} snapshot: evaluate khớp parse_signal_sl_tp(decide()) | {signals}")
+
+    # Ngược xu hướng khung lớn: hạ một bậc leverage
+    trade = next(s for s in snapshots if rule_engine.evaluate(s)[0] != "hold")
+    signal, amount, leverage = rule_engine.evaluate(trade)[:3]
+    opposite = "giảm" if signal == "buy" else "tăng"
+    lowered = rule_engine.evaluate(dict(trade, htf_trend=(("1h", opposite),)))
+    assert lowered[0] == "hold" or lowered[2] < leverage, lowered
+    print(f"✅ Ngược trend 1h: {signal} {leverage}x -> {lowered[0]} {lowered[2]}")
+
+    runs = 100000
+    start = time.perf_counter()
+    for _ in range(runs):
+        rule_engine.evaluate(trade)
+    cost = (time.perf_counter() - start) / runs
+    print(f"✅ Một quyết định: {cost * 1e6:.1f} µs (Gemini: vài giây)")
+
+def test_low_price_symbol():
+    """Symbol giá ~0.15: SL/TP trong text giữ đủ chữ số, không bị làm tròn về giá vào lệnh"""
+    print("=== TESTING RULE ENGINE SUB-$1 ===")
+    scale = 0.15 / 60000
+    candles = [dict(candle, **{field: str(float(candle[field]) * scale) for field in ("open", "high", "low", "close")})
+               for candle in make_klines(600, seed=7)]
+    trades = 0
+    for i in range(100, 600, 5):
+        snapshot = kline_snapshot(KlineColumns.from_candles(candles[i - 100:i]))
+        decision = rule_engine.evaluate(snapshot)
+        if decision[0] == "hold":
+            continue
+        signal, _, _, sl, tp, _ = parse_signal_sl_tp(rule_engine.decide(snapshot))
+        price = snapshot["close"]
+        assert abs(sl - decision[3]) <= 1e-9 * price and abs(tp - decision[4]) <= 1e-9 * price, (decision, sl, tp)
+        assert 0.001 - 1e-6 <= abs(price - sl) / price <= 0.002 + 1e-6
+        # validate_sl_tp giữ nguyên SL/TP (không bị đẩy qua giá vào lệnh rồi auto-adjust)
+        assert validate_sl_tp(signal, price, sl, tp)[2:] == (sl, tp)
+        trades += 1
+    assert trades
+    print(f"✅ {trades} lệnh giá ~0.15: SL/TP qua text khớp evaluate, SL cách giá 0.1-0.2%")
+
+if __name__ == "__main__":
+    test_rule_engine()
+    test_low_price_symbol()
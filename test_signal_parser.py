@@ -0,0 +1,81 @@
+import os
+import json
+import time
+from mock_exchange import use_temp_paths
+
+# Chạy offline: không cần .env thật
+use_temp_paths()
+os.environ.setdefault("TRADE_AMOUNT", "100")
+os.environ.setdefault("LEVERAGE", "10")
+
+import rule_engine
+from klines import KlineColumns, orjson
+from batch_indicators import kline_snapshot
+from signal_evaluator import parse_signal, parse_signal_sl_tp, Signal
+from test_indicator_state import make_klines
+
+def build_corpus():
+    """Corpus phản hồi dạng Gemini: text chuẩn, text lệch format (markdown) và JSON theo schema."""
+    candles = make_klines(2100, seed=11)
+    decisions = [rule_engine.evaluate(kline_snapshot(KlineColumns.from_candles(candles[i - 100:i])))
+                 for i in range(100, 2100, 2)]
+    text, drifted, as_json = [], [], []
+    for signal, amount, leverage, sl, tp, reason in decisions:
+        if signal == "hold":
+            text.append(f"Signal: hold\nReason: {reason}")
+            drifted.append(f"**Signal:** HOLD\n**Reason:** {reason}")
+        else:
+            text.append(f"Signal: {signal}\nAmount: {amount}\nLeverage: {leverage}\nSL: {sl:.2f}\nTP: {tp:.2f}\nReason: {reason}")
+            # Lệch format hay gặp: markdown đậm -> dòng không còn bắt đầu bằng "signal:"
+            drifted.append(f"**Signal:** {signal.upper()}\n**Amount:** {amount}\n**Leverage:** {leverage}x\n"
+                           f"**SL:** {sl:.2f}\n**TP:** {tp:.2f}\n**Reason:** {reason}")
+        as_json.append(json.dumps({"signal": signal, "amount": amount, "leverage": leverage,
+                                   "sl": round(sl, 2) if sl else None, "tp": round(tp, 2) if tp else None,
+                                   "reason": reason}, ensure_ascii=False))
+    return decisions, text, drifted, as_json
+
+def throughput(parser, corpus, rounds=20):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for response in corpus:
+            parser(response)
+    return rounds * len(corpus) / (time.perf_counter() - start)
+
+def test_signal_parser():
+    """JSON theo schema parse bằng một lần loads, khớp parser text và không mất lệnh khi lệch format"""
+    print(f"=== TESTING SIGNAL PARSER (parser: {'orjson' if orjson else 'json'}) ===")
+    decisions, text, drifted, as_json = build_corpus()
+
+    for decision, response in zip(decisions, as_json):
+        parsed = parse_signal(response)
+        assert isinstance(parsed, Signal) and parsed.signal == decision[0] and parsed.amount == decision[1]
+        assert parsed.leverage == decision[2]
+        if decision[3]:
+            assert abs(parsed.sl - decision[3]) < 0.01 and abs(parsed.tp - decision[4]) < 0.01
+    for response in text:
+        assert tuple(parse_signal(response)) == parse_signal_sl_tp(response)
+    fenced = parse_signal(f"```json\n{as_json[0]}\n```")
+    assert fenced.signal == decisions[0][0]
+    print(f"✅ {len(as_json)} phản hồi JSON khớp quyết định gốc, text vẫn qua parser cũ")
+
+    # Signal thay tuple: so sánh với None/str không lỗi, hash được và cùng hash với tuple bằng nó
+    hold = parse_signal("Signal: hold")
+    assert hold != None and hold != "hold" and not (hold == None)
+    assert hold == ("hold", None, None, None, None, "") and hash(hold) == hash(tuple(hold))
+    assert len({hold, parse_signal("Signal: hold"), tuple(hold)}) == 1
+    print("✅ Signal so sánh được với None, dùng được làm key dict/set như tuple")
+
+    trades = sum(1 for decision in decisions if decision[0] != "hold")
+    lost = sum(1 for decision, response in zip(decisions, drifted)
+               if decision[0] != "hold" and parse_signal_sl_tp(response)[0] == "hold")
+    print(f"Text lệch format: {lost}/{trades} lệnh bị parser text đọc thành hold (JSON: 0)")
+
+    # Cùng đường parse_signal (có @timed + counter) để so sánh công bằng; thêm parser text trần để tham khảo
+    raw = throughput(parse_signal_sl_tp, text)
+    old = throughput(parse_signal, text)
+    new = throughput(parse_signal, as_json)
+    print(f"✅ parse_signal text: {old:,.0f} phản hồi/s | JSON: {new:,.0f} phản hồi/s ({new / old:.1f}x) "
+          f"| parse_signal_sl_tp trần: {raw:,.0f} phản hồi/s")
+
+if __name__ == "__main__":
+    test_signal_parser()
@@ -0,0 +1,118 @@
+import os
+import time
+import tempfile
+import threading
+from mock_exchange import use_mock_exchange
+
+# config đọc env lúc import; journal mặc định của sàn giả nằm trong thư mục tạm
+exchange = use_mock_exchange()
+
+from state_journal import StateJournal
+
+def fill_journal(journal, cycles, symbols):
+    """Mô phỏng `cycles` chu kỳ: quyết định + số dư mỗi chu kỳ, cứ 10 chu kỳ một lệnh đặt/đóng/fill."""
+    for cycle in range(cycles):
+        for index, symbol in enumerate(symbols):
+            journal.append("balance", symbol, balance=1000 + cycle * 0.1)
+            journal.append("decision", symbol, signal="buy" if cycle % 10 == 0 else "hold", price=60000 + cycle)
+            if cycle % 10 == 0:
+                order_id = f"{symbol}-{cycle}"
+                journal.append("order_placed", symbol, order_id, price=60000 + cycle)
+                journal.append("fill", symbol, order_id, realized_pnl=(1.5 if index % 2 else -1.0), commission=0.04)
+                if cycle < cycles - 10:
+                    journal.append("order_closed", symbol, order_id, status="FILLED")
+
+def test_state_journal():
+    """Journal SQLite WAL: ghi gộp batch, khôi phục sau restart trong vài ms, P&L không cần sàn"""
+    print("=== TESTING STATE JOURNAL ===")
+    path = os.path.join(tempfile.mkdtemp(), "journal.db")
+    symbols = [f"SYM{i}-USDT" for i in range(8)]
+    journal = StateJournal(path)
+
+    cycles = 2000
+    start = time.perf_counter()
+    fill_journal(journal, cycles, symbols)
+    enqueue = time.perf_counter() - start
+    journal.flush()
+    elapsed = time.perf_counter() - start
+    events = journal.query("SELECT COUNT(*) FROM events")[0][0]
+    print(f"✅ {events} sự kiện: {enqueue / events * 1e6:.1f} µs/sự kiện trên luồng giao dịch, "
+          f"ghi xong sau {elapsed * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    for i in range(20):
+        journal.append("order_placed", "DURABLE-USDT", f"d{i}", durable=True)
+        journal.append("order_closed", "DURABLE-USDT", f"d{i}", durable=True)
+    print(f"Ghi durable (fsync): {(time.perf_counter() - start) / 40 * 1000:.2f} ms/sự kiện")
+
+    # Restart: instance mới trên cùng file, không gọi REST
+    start = time.perf_counter()
+    state = StateJournal(path).replay()
+    replay_ms = (time.perf_counter() - start) * 1000
+    open_orders = {symbol: entry["order_id"] for symbol, entry in state.items() if entry["order_id"]}
+    last_cycle = (cycles - 1) // 10 * 10
+    assert open_orders == {symbol: f"{symbol}-{last_cycle}" for symbol in symbols}, open_orders
+    assert state["SYM0-USDT"]["decision"]["price"] == 60000 + cycles - 1
+    assert abs(state["SYM0-USDT"]["balance"]["balance"] - (1000 + (cycles - 1) * 0.1)) < 1e-6
+    # Số dư toàn tài khoản (user stream, không symbol) không tạo key None trong trạng thái
+    journal.append("balance", balance=999.0, source="stream")
+    journal.flush()
+    assert None not in journal.replay()
+    print(f"✅ Khôi phục {len(open_orders)} lệnh mở từ {events} sự kiện trong {replay_ms:.1f} ms")
+
+    summary = journal.pnl_summary()
+    trades = cycles // 10
+    expected = trades * sum(1.5 if index % 2 else -1.0 for index in range(len(symbols)))
+    assert abs(summary["realized_pnl"] - expected) < 1e-6
+    assert summary["symbols"]["SYM1-USDT"]["wins"] == trades
+    print(f"✅ P&L từ journal: realized {summary['realized_pnl']:+.2f}, phí {summary['commission']:.2f}, "
+          f"số dư {summary['balance_start']:.1f} -> {summary['balance_end']:.1f}")
+
+    # Chuyển current_order_*.txt cũ vào journal của bot
+    from main import SymbolState
+    from state_journal import get_journal
+    legacy = "current_order_JOURNAL-USDT.txt"
+    with open(legacy, "w") as f:
+        f.write("777")
+    assert SymbolState("JOURNAL-USDT").order_id == "777" and not os.path.exists(legacy)
+    assert get_journal().replay()["JOURNAL-USDT"]["order_id"] == "777"
+    state = SymbolState("JOURNAL-USDT", get_journal().replay()["JOURNAL-USDT"])
+    state.clear_order(status="FILLED")
+    assert "JOURNAL-USDT" not in get_journal().replay() or not get_journal().replay()["JOURNAL-USDT"]["order_id"]
+    print("✅ File current_order cũ được chuyển vào journal rồi xóa")
+
+def test_journal_failures():
+    """append từ nhiều worker không mất đếm; ghi durable lỗi thì caller biết và lệnh không mất"""
+    print("=== TESTING STATE JOURNAL FAILURES ===")
+    journal = StateJournal(os.path.join(tempfile.mkdtemp(), "journal.db"))
+
+    def worker(index):
+        for i in range(2000):
+            journal.append("decision", f"SYM{index}-USDT", signal="hold")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.flush()
+    assert journal.submitted == journal.written == 16000, (journal.submitted, journal.written)
+    assert journal.append("order_placed", "OK-USDT", "1", durable=True) is True
+    print(f"✅ 8 worker x 2000 append: submitted = written = {journal.written}")
+
+    # Bảng bị xóa: batch durable ghi lỗi -> append trả False thay vì im lặng
+    journal.query("DROP TABLE events")
+    assert journal.append("order_placed", "FAIL-USDT", "2", durable=True) is False
+    from main import SymbolState
+    state = SymbolState("FAILED-JOURNAL-USDT")
+    state.journal = journal
+    assert state.set_order("3") is False
+    with open(state.order_file) as f:
+        assert f.read() == "3"
+    state.clear_order(status="FILLED")
+    assert not os.path.exists(state.order_file)
+    print("✅ Ghi durable lỗi: append trả False, SymbolState giữ lệnh trong file cũ tới lần khởi động sau")
+
+if __name__ == "__main__":
+    test_state_journal()
+    test_journal_failures()
@@ -1,3 +1,9 @@
+import sys
+if "--mock" in sys.argv:
+    # Chạy offline với sàn giả lập thay vì BingX thật
+    from mock_exchange import use_mock_exchange
+    use_mock_exchange()
+
 from trade_executor import get_account_balance, calculate_position_size, place_order, set_leverage, get_trading_info
 from data_fetcher import get_current_price
 from logger import log_event
@@ -0,0 +1,162 @@
+import time
+import threading
+
+from test_market_stream import FakeBingXWebSocket, wait_until
+from mock_exchange import patched
+from market_stream import MarketStream
+from data_fetcher import start_market_stream
+import main
+from scheduler import SymbolScheduler
+from triggers import DecisionTriggers, seconds_to_candle_close
+from metrics import DECISION_TRIGGERS
+
+class State:
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+def kline(minute, close, volume="10"):
+    return {"dataType": "BTC-USDT@kline_1m",
+            "data": [{"o": "100", "h": "101", "l": "99", "c": str(close), "v": volume, "T": 60000 * minute}]}
+
+def test_seconds_to_candle_close():
+    """Canh theo biên nến tuyệt đối: thời gian chạy chu kỳ không làm lịch trôi dần"""
+    print("=== TESTING CANDLE CLOSE ALIGNMENT ===")
+    assert abs(seconds_to_candle_close("1m", now=120.0) - 60.0) < 1e-9
+    assert abs(seconds_to_candle_close("1m", 0.5, now=170.0) - 10.5) < 1e-9
+    assert abs(seconds_to_candle_close("15m", now=900.0 * 7 + 899.0) - 1.0) < 1e-9
+    # 1000 chu kỳ, mỗi chu kỳ tốn 0.1-3s: lần chạy kế tiếp vẫn rơi đúng biên nến + grace
+    now = 1_700_000_000.0
+    for i in range(1000):
+        now += seconds_to_candle_close("1m", 0.5, now=now)
+        assert abs((now - 0.5) % 60) < 1e-6 or abs((now - 0.5) % 60 - 60) < 1e-6
+        now += 0.1 + (i % 30) * 0.1
+    print("✅ 1000 chu kỳ liên tiếp đều chạy đúng lúc nến đóng + grace, không trôi lịch")
+
+def test_no_double_wake():
+    """Trigger candle_close đã wake cho nến nào thì timer của chu kỳ không chạy lại cho nến đó"""
+    print("=== TESTING CANDLE CLOSE DOUBLE WAKE ===")
+    woken = []
+    triggers = DecisionTriggers(woken.append, "1m", atr_mult=0, volume_mult=0)
+    # Đồng hồ máy chậm hơn sàn 0.2s: stream đã đẩy nến mở lúc 180s khi máy mới ở 179.8s
+    assert abs(triggers.seconds_to_candle_close("BTC-USDT", 0.5, now=179.8) - 0.7) < 1e-9
+    triggers.on_candle("BTC-USDT", {"time": 180000, "close": "100", "volume": "1"}, True)
+    assert woken == ["BTC-USDT"]
+    assert abs(triggers.seconds_to_candle_close("BTC-USDT", 0.5, now=179.8) - 60.7) < 1e-9
+    # Symbol khác và nến kế tiếp vẫn canh đúng biên nến
+    assert abs(triggers.seconds_to_candle_close("ETH-USDT", 0.5, now=179.8) - 0.7) < 1e-9
+    assert abs(triggers.seconds_to_candle_close("BTC-USDT", 0.5, now=181.0) - 59.5) < 1e-9
+    # run_cycle: nến sắp đóng đã được stream đẩy trước -> chờ tới nến sau
+    triggers.closed["BTC-USDT"] = (int(time.time() * 1000) // 60000 + 1) * 60000
+    with patched(main, SCHEDULE_MODE="candle", _triggers=triggers):
+        assert main.decision_delay("BTC-USDT") > 60
+    print("✅ Nến đã được trigger wake: timer chờ tới nến kế tiếp thay vì chạy lại sau 0.7s")
+
+    # Lỗi lấy dữ liệu: chờ SCHEDULER_ERROR_DELAY thay vì cố định 60s
+    snapshot = main.CycleSnapshot("DELAY-USDT", False, False, None, {}, None, 0.0)
+    with patched(main, fetch_cycle_snapshot=lambda *args, **kwargs: snapshot):
+        assert main.run_cycle(main.SymbolState("DELAY-USDT")) == main.SCHEDULER_ERROR_DELAY
+    print(f"✅ Không lấy được số dư: thử lại sau {main.SCHEDULER_ERROR_DELAY:.0f}s")
+
+def test_triggers():
+    """Stream đẩy nến mới / giá lệch > k x ATR / volume đột biến -> chu kỳ chạy ngay, lúc rảnh không polling"""
+    print("=== TESTING DECISION TRIGGERS ===")
+    server = FakeBingXWebSocket()
+    seed = [{"open": "100", "high": "101", "low": "99", "close": "100", "volume": "10", "time": 60000 * i}
+            for i in range(1, 21)]
+    stream = MarketStream("BTC-USDT", url=server.url, seed=lambda: list(seed)).start()
+    assert server.connected.wait(3) and wait_until(lambda: len(server.subscriptions) == 2)
+
+    runs = []
+    first_run = threading.Event()
+
+    def cycle(state):
+        runs.append(time.perf_counter())
+        first_run.set()
+        return 3600  # Timer rất xa: mọi lần chạy sau đều do trigger
+
+    scheduler = SymbolScheduler([State("BTC-USDT")], cycle, max_workers=2)
+    triggers = DecisionTriggers(scheduler.wake, "1m", atr_mult=1.0, volume_mult=3.0, cooldown=0.2, volume_window=2)
+    triggers.set_reference("BTC-USDT", 100.0, 2.0)
+    stream.add_listener(triggers.on_candle)
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    assert first_run.wait(2)
+
+    # Rảnh: thread scheduler chỉ ngủ trên Condition, không tốn CPU
+    cpu = time.process_time()
+    time.sleep(1.0)
+    idle_cpu = time.process_time() - cpu
+    assert len(runs) == 1 and idle_cpu < 0.05, idle_cpu
+    print(f"✅ Rảnh 1s: {len(runs) - 1} chu kỳ thêm, CPU {idle_cpu * 1000:.1f} ms")
+
+    def reaction(payload, reason):
+        before, fired = len(runs), DECISION_TRIGGERS.value(reason=reason)
+        sent = time.perf_counter()
+        server.push(payload)
+        assert wait_until(lambda: len(runs) > before, timeout=2), reason
+        assert DECISION_TRIGGERS.value(reason=reason) == fired + 1
+        return runs[-1] - sent
+
+    # Giá đi trong biên ATR: không wake
+    server.push(kline(20, 101.5))
+    time.sleep(0.2)
+    assert len(runs) == 1
+
+    latency = reaction(kline(21, 100.5), "candle_close")
+    print(f"✅ Nến đóng -> chu kỳ chạy sau {latency * 1000:.1f} ms (trước đây chờ tới 60s)")
+    time.sleep(0.25)
+    latency = reaction(kline(21, 103.0), "price_move")
+    print(f"✅ Giá lệch > 1 x ATR -> chu kỳ chạy sau {latency * 1000:.1f} ms")
+
+    # Mốc giá đã dời tới 103: cùng mức giá không wake lại
+    before = len(runs)
+    server.push(kline(21, 103.5))
+    time.sleep(0.3)
+    assert len(runs) == before
+    latency = reaction(kline(21, 103.5, volume="80"), "volume_spike")
+    print(f"✅ Volume nến đang chạy > 3 x trung bình -> chu kỳ chạy sau {latency * 1000:.1f} ms")
+    time.sleep(0.3)
+    server.push(kline(21, 103.5, volume="90"))
+    time.sleep(0.2)
+    assert len(runs) == before + 1, "volume_spike chỉ wake một lần mỗi nến"
+
+    scheduler.stop()
+    stream.stop()
+
+def test_stream_wakes_run_cycle():
+    """Wiring như main_loop (start_triggers): nến mới từ stream đánh thức run_cycle thật trên sàn giả"""
+    print("=== TESTING STREAM -> RUN_CYCLE ===")
+    with patched(main, STRATEGY_MODE="rules", _triggers=None):
+        server = FakeBingXWebSocket()
+        stream = start_market_stream("SOL-USDT", url=server.url)
+        assert server.connected.wait(3) and wait_until(stream.is_healthy)
+
+        delays = []
+
+        def cycle(state):
+            delays.append(main.run_cycle(state))
+            return 3600  # Bỏ timer của run_cycle: lần chạy thứ hai chỉ có thể do trigger
+
+        scheduler = SymbolScheduler([main.SymbolState("SOL-USDT")], cycle, max_workers=1)
+        main.start_triggers(scheduler, [stream])
+        threading.Thread(target=scheduler.run, daemon=True).start()
+        assert wait_until(lambda: len(delays) == 1, timeout=5)
+
+        fired = DECISION_TRIGGERS.value(reason="candle_close")
+        last = stream.get_candles(1)[0]
+        sent = time.perf_counter()
+        server.push({"dataType": "SOL-USDT@kline_1m", "data": [
+            {"o": last["close"], "h": last["close"], "l": last["close"], "c": last["close"], "v": "1",
+             "T": int(last["time"]) + 60000}]})
+        assert wait_until(lambda: len(delays) == 2, timeout=5)
+        assert DECISION_TRIGGERS.value(reason="candle_close") == fired + 1
+        print(f"✅ Push nến mới -> run_cycle chạy lại sau {(time.perf_counter() - sent) * 1000:.0f} ms "
+              f"(run_cycle muốn chờ {delays[0]:.1f}s)")
+
+        scheduler.stop()
+        stream.stop()
+
+if __name__ == "__main__":
+    test_seconds_to_candle_close()
+    test_no_double_wake()
+    test_triggers()
+    test_stream_wakes_run_cycle()
@@ -0,0 +1,46 @@
+import time
+from mock_exchange import use_mock_exchange
+
+# Sàn giả (REST listenKey + seed) và WebSocket giả phải có trước khi import module của bot
+exchange = use_mock_exchange()
+
+from test_market_stream import FakeBingXWebSocket, wait_until
+from user_stream import start_user_stream, get_account_store
+
+def test_user_stream():
+    """Kiểm tra cập nhật lệnh/vị thế được đẩy vào store và wake symbol trong vài ms"""
+    print("=== TESTING USER DATA STREAM ===")
+    ws_server = FakeBingXWebSocket()
+    woken = []
+    stream = start_user_stream(["BTC-USDT"], on_change=lambda symbol: woken.append((symbol, time.perf_counter())),
+                               url=ws_server.url)
+    assert wait_until(lambda: get_account_store() is not None), "User stream không kết nối được"
+    store = get_account_store()
+    print(f"✅ Kết nối với listenKey {stream.listen_key}")
+    assert not store.has_position("BTC-USDT")
+
+    store.track_order("42", "BTC-USDT")
+    assert store.has_open_orders("BTC-USDT")
+
+    sent = time.perf_counter()
+    ws_server.push({"e": "ORDER_TRADE_UPDATE", "E": 1, "o": {
+        "s": "BTC-USDT", "i": 42, "S": "BUY", "X": "FILLED", "ps": "LONG", "ap": "60000", "z": "0.01", "rp": "0"}})
+    assert wait_until(lambda: store.order_status(42) == "FILLED")
+    print(f"✅ Lệnh FILLED sau {(woken[-1][1] - sent) * 1000:.2f} ms (thay vì tối đa 30s polling)")
+
+    ws_server.push({"e": "ACCOUNT_UPDATE", "E": 2, "a": {
+        "m": "ORDER", "B": [{"a": "USDT", "wb": "950", "cw": "950"}],
+        "P": [{"s": "BTC-USDT", "pa": "0.01", "ep": "60000", "ps": "LONG"}]}})
+    assert wait_until(lambda: store.has_position("BTC-USDT"))
+    ws_server.push({"e": "ACCOUNT_UPDATE", "E": 3, "a": {
+        "m": "ORDER", "B": [], "P": [{"s": "BTC-USDT", "pa": "0", "ep": "0", "ps": "LONG"}]}})
+    assert wait_until(lambda: not store.has_position("BTC-USDT"))
+    print(f"✅ Vị thế mở/đóng được phản ánh ngay, {len(woken)} lần wake scheduler")
+
+    ws_server.drop()
+    assert wait_until(lambda: get_account_store() is None)
+    print("✅ Mất kết nối: main_loop quay lại REST polling")
+    stream.stop()
+
+if __name__ == "__main__":
+    test_user_stream()
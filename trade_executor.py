@@ -1,34 +1,20 @@
-import time
-import requests
-import hmac
-from hashlib import sha256
 import json
-from config import BINGX_API_KEY, BINGX_API_SECRET, BINGX_API_URL, SYMBOL, TRADE_AMOUNT, LEVERAGE
+import time
+from config import SYMBOL, TRADE_AMOUNT, LEVERAGE, BALANCE_MAX_AGE
 from data_fetcher import get_last_close_price
+from bingx_client import get_client
+from symbol_rules import get_symbol_rules, floor_to_step, round_to_tick, DEFAULT_RULES
 from logger import log_event
-
-def get_sign(api_secret, payload):
-    return hmac.new(api_secret.encode("utf-8"), payload.encode("utf-8"), digestmod=sha256).hexdigest()
-
-def parse_param(params_map):
-    sorted_keys = sorted(params_map)
-    params_str = "&".join(["%s=%s" % (x, params_map[x]) for x in sorted_keys])
-    if params_str != "":
-        return params_str + "&timestamp=" + str(int(time.time() * 1000))
-    else:
-        return "timestamp=" + str(int(time.time() * 1000))
+from metrics import STAGE_SECONDS, ORDERS_SKIPPED, timed
 
 def get_account_balance():
-    """Lấy thông tin số dư tài khoản thực tế từ BingX"""
+    """Lấy thông tin số dư tài khoản thực tế từ BingX (kèm fetched_at theo time.monotonic())"""
     path = '/openApi/swap/v2/user/balance'
     method = "GET"
-    params_str = parse_param({})
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {'X-BX-APIKEY': BINGX_API_KEY}
+    params_map = {}
     
     try:
-        response = requests.request(method, url, headers=headers)
+        response = get_client().request(method, path, params_map)
         if response.status_code == 200:
             data = response.json().get("data", {})
             balance = data.get("balance", {})
@@ -39,31 +25,33 @@ def get_account_balance():
             total_wallet_balance = float(balance.get("totalWalletBalance", 0))
             total_margin_balance = float(balance.get("totalMarginBalance", 0))
             
-            log_event(f"=== ACCOUNT BALANCE DEBUG ===")
-            log_event(f"Total Wallet Balance: ${total_wallet_balance:.2f}")
-            log_event(f"Total Margin Balance: ${total_margin_balance:.2f}")
-            log_event(f"Available Margin: ${available_margin:.2f}")
-            log_event(f"Used Margin: ${used_margin:.2f}")
-            log_event(f"============================")
+            log_event(f"Balance: wallet ${total_wallet_balance:.2f} | margin ${total_margin_balance:.2f} | "
+                      f"available ${available_margin:.2f} | used ${used_margin:.2f}", level="DEBUG")
             
             return {
                 'available_margin': available_margin,
                 'used_margin': used_margin,
                 'total_wallet_balance': total_wallet_balance,
-                'total_margin_balance': total_margin_balance
+                'total_margin_balance': total_margin_balance,
+                'fetched_at': time.monotonic()
             }
     except Exception as e:
-        log_event(f"Lỗi khi lấy account balance: {e}")
+        log_event(f"Lỗi khi lấy account balance: {e}", level="ERROR")
         return None
 
-def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=None, account_balance=50000):
+def is_balance_fresh(balance_info, max_age=BALANCE_MAX_AGE):
+    """Snapshot số dư còn dùng được nếu chưa quá max_age giây."""
+    return bool(balance_info) and time.monotonic() - balance_info.get('fetched_at', 0) <= max_age
+
+def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=None, account_balance=50000, rules=None, balance_info=None):
     """Tính toán size position cho demo trading với high leverage"""
     
-    # Lấy số dư thực tế từ exchange
-    balance_info = get_account_balance()
+    # Dùng snapshot số dư của chu kỳ nếu còn mới, tránh thêm một request ký ngay trước khi đặt lệnh
+    if not is_balance_fresh(balance_info):
+        balance_info = get_account_balance()
     if balance_info:
         available_margin = balance_info['available_margin']
-        log_event(f"Available margin from exchange: ${available_margin:.2f}")
+        log_event(f"Available margin from exchange: ${available_margin:.2f}", level="DEBUG")
         
         if available_margin < 20:
             log_event(f"❌ MARGIN TOO LOW: ${available_margin:.2f} - Stopping trades")
@@ -73,6 +61,12 @@ def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=
         available_margin = account_balance
         log_event(f"Using fallback balance: ${available_margin:.2f}")
     
+    return size_position(trade_amount_usd, current_price, leverage, sl_price, available_margin, rules)
+
+def size_position(trade_amount_usd, current_price, leverage, sl_price, available_margin, rules=None):
+    """Phần tính toán thuần (không gọi mạng) của calculate_position_size, dùng chung với backtester"""
+    step_size = (rules or DEFAULT_RULES)["step_size"]
+    
     # DEMO TRADING: Bỏ ultra-conservative, cho phép position sizes lớn hơn
     log_event(f"🔥 DEMO HIGH LEVERAGE TRADING: {leverage}x")
     
@@ -80,10 +74,10 @@ def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=
     safety_buffer = 50  # Chỉ reserve 50$ cho fees
     usable_margin = max(0, (available_margin - safety_buffer) * 0.8)  # 80% thay vì 5%
     
-    log_event(f"Demo margin calculation:")
-    log_event(f"  Available: ${available_margin:.2f}")
-    log_event(f"  Buffer: ${safety_buffer:.2f}")
-    log_event(f"  Usable (80%): ${usable_margin:.2f}")
+    log_event(f"Demo margin calculation:", level="DEBUG")
+    log_event(f"  Available: ${available_margin:.2f}", level="DEBUG")
+    log_event(f"  Buffer: ${safety_buffer:.2f}", level="DEBUG")
+    log_event(f"  Usable (80%): ${usable_margin:.2f}", level="DEBUG")
     
     if usable_margin < 10:
         log_event(f"❌ USABLE MARGIN TOO LOW: ${usable_margin:.2f}")
@@ -93,7 +87,7 @@ def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=
     if not sl_price:
         # Không có SL: sử dụng trade amount trực tiếp
         safe_trade_amount = min(trade_amount_usd, usable_margin)
-        quantity_btc = round(safe_trade_amount / current_price, 6)
+        quantity_btc = floor_to_step(safe_trade_amount / current_price, step_size)
         
         log_event(f"Demo position without SL: ${safe_trade_amount:.2f} margin, {quantity_btc:.6f} BTC")
         log_event(f"Position value: ${safe_trade_amount * leverage:.2f} ({leverage}x)")
@@ -116,21 +110,45 @@ def calculate_position_size(trade_amount_usd, current_price, leverage, sl_price=
         max_position_by_margin
     )
     
-    quantity_btc = round(safe_position_value / current_price, 6)
+    quantity_btc = floor_to_step(safe_position_value / current_price, step_size)
     actual_trade_amount = safe_position_value / leverage
     
     # Final check - đảm bảo không vượt usable margin
     if actual_trade_amount > usable_margin:
         actual_trade_amount = usable_margin
-        quantity_btc = round(actual_trade_amount / current_price, 6)
+        quantity_btc = floor_to_step(actual_trade_amount / current_price, step_size)
         log_event(f"⚠️ MARGIN SAFETY: Reduced to ${actual_trade_amount:.2f}")
     
     log_event(f"Demo position with SL: ${actual_trade_amount:.2f} margin, {quantity_btc:.6f} BTC")
-    log_event(f"Position value: ${safe_position_value:.2f} ({leverage}x)")
-    log_event(f"Margin usage: {(actual_trade_amount/available_margin)*100:.1f}% of available")
+    log_event(f"Position value: ${safe_position_value:.2f} ({leverage}x)", level="DEBUG")
+    log_event(f"Margin usage: {(actual_trade_amount/available_margin)*100:.1f}% of available", level="DEBUG")
     
     return quantity_btc, actual_trade_amount
 
+def resolve_trade_params(leverage, amount):
+    """Áp chính sách AGGRESSIVE lên leverage/amount Gemini đề xuất; trả về (leverage, trade_amount)"""
+    # Sử dụng leverage từ Gemini hoặc config (ưu tiên high leverage)
+    leverage_to_use = leverage if leverage else LEVERAGE
+    
+    # AGGRESSIVE: Cho phép leverage cao hơn (50-125x)
+    leverage_to_use = max(50, min(125, leverage_to_use))
+    
+    # AGGRESSIVE: Trade amount lớn hơn cho high profit
+    base_amount = amount if amount else 80  # Default 80$ thay vì 50$
+    
+    # Scale amount theo confidence và leverage
+    if leverage_to_use >= 100:
+        # Extreme leverage: Use bigger amounts for massive gains
+        trade_amount_to_use = max(60, min(100, base_amount))
+    elif leverage_to_use >= 80:
+        # High leverage: Medium-large amounts
+        trade_amount_to_use = max(40, min(80, base_amount))
+    else:
+        # Moderate leverage: Standard amounts
+        trade_amount_to_use = max(20, min(60, base_amount))
+    
+    return leverage_to_use, trade_amount_to_use
+
 def set_leverage(leverage, side, symbol=SYMBOL):
     path = '/openApi/swap/v2/trade/leverage'
     method = "POST"
@@ -139,16 +157,11 @@ def set_leverage(leverage, side, symbol=SYMBOL):
         "side": side,  # "LONG" hoặc "SHORT"
         "symbol": symbol,
     }
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {
-        'X-BX-APIKEY': BINGX_API_KEY,
-    }
-    response = requests.request(method, url, headers=headers)
+    response = get_client().request(method, path, params_map)
     return response.json()
 
-def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, current_price=None, account_balance=50000):
+@timed(STAGE_SECONDS, stage="place_order")
+def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, current_price=None, account_balance=50000, symbol=SYMBOL, balance_info=None):
     path = '/openApi/swap/v2/trade/order'
     method = "POST"
     side = "BUY" if signal == "buy" else "SELL"
@@ -162,33 +175,42 @@ def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, curr
     # Sử dụng current_price được truyền vào, hoặc lấy mới nếu không có
     if current_price is None:
         from data_fetcher import get_current_price
-        price = get_current_price()
+        price = get_current_price(symbol)
     else:
         price = current_price
         
     if not price or price <= 0:
-        raise Exception("Không lấy được giá BTC-USDT để tính số lượng BTC.")
+        raise Exception(f"Không lấy được giá {symbol} để tính số lượng.")
     
     # Log giá được sử dụng để debug
-    log_event(f"Sử dụng giá {price:.1f} để tính position size")
+    log_event(f"Sử dụng giá {price:.1f} để tính position size", level="DEBUG")
+    
+    # Luật step/tick/min của symbol lấy từ cache exchangeInfo (không tốn round-trip mỗi lệnh)
+    rules = get_symbol_rules(symbol) or DEFAULT_RULES
     
     # Tính position size an toàn với account_balance được truyền vào
-    quantity_btc, safe_amount = calculate_position_size(trade_amount, price, leverage, sl, account_balance)
+    quantity_btc, safe_amount = calculate_position_size(trade_amount, price, leverage, sl, account_balance, rules, balance_info)
     
     # Kiểm tra nếu quantity = 0 hoặc quá nhỏ
     if quantity_btc <= 0:
         log_event(f"❌ SKIP ORDER: Quantity = {quantity_btc} (insufficient margin)")
+        ORDERS_SKIPPED.inc(reason="insufficient_margin")
         return {"code": 80001, "msg": "Insufficient margin - position size too small", "data": {}}
     
-    # Kiểm tra minimum quantity (BingX thường yêu cầu min 0.001 BTC)
-    if quantity_btc < 0.001:
-        log_event(f"❌ SKIP ORDER: Quantity {quantity_btc:.6f} < minimum 0.001 BTC")
+    # Kiểm tra minimum quantity / notional theo luật của sàn
+    if quantity_btc < rules["min_qty"]:
+        log_event(f"❌ SKIP ORDER: Quantity {quantity_btc:.6f} < minimum {rules['min_qty']}")
+        ORDERS_SKIPPED.inc(reason="min_qty")
         return {"code": 80001, "msg": "Position size below minimum", "data": {}}
+    if quantity_btc * price < rules["min_notional"]:
+        log_event(f"❌ SKIP ORDER: Notional ${quantity_btc * price:.2f} < minimum ${rules['min_notional']}")
+        ORDERS_SKIPPED.inc(reason="min_notional")
+        return {"code": 80001, "msg": "Position notional below minimum", "data": {}}
     
     log_event(f"✅ ORDER SIZE OK: {quantity_btc:.6f} BTC, ${safe_amount:.2f} margin")
     
     params_map = {
-        "symbol": SYMBOL,
+        "symbol": symbol,
         "side": side,
         "positionSide": position_side,
         "type": "MARKET",
@@ -196,6 +218,27 @@ def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, curr
     }
     
     # Validate và adjust SL/TP với giá real-time
+    sl, tp = finalize_sl_tp(signal, price, sl, tp)
+    if sl:
+        params_map["stopLoss"] = json.dumps({
+            "type": "STOP_MARKET",
+            "stopPrice": round_to_tick(sl, rules["tick_size"]),
+            "workingType": "MARK_PRICE"
+        })
+    
+    if tp:
+        params_map["takeProfit"] = json.dumps({
+            "type": "TAKE_PROFIT_MARKET",
+            "stopPrice": round_to_tick(tp, rules["tick_size"]),
+            "price": round_to_tick(tp, rules["tick_size"]),
+            "workingType": "MARK_PRICE"
+        })
+    
+    response = get_client().request(method, path, params_map)
+    return response.json()
+
+def finalize_sl_tp(signal, price, sl, tp):
+    """Điều chỉnh SL/TP lần cuối theo giá khớp: đúng phía, SL cách tối thiểu 0.5%, R:R >= 1.2"""
     if sl:
         # Double-check SL với giá hiện tại
         if signal == "buy" and sl >= price:
@@ -211,12 +254,6 @@ def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, curr
             sl = price - min_sl_distance
         elif signal == "sell" and sl - price < min_sl_distance:
             sl = price + min_sl_distance
-            
-        params_map["stopLoss"] = json.dumps({
-            "type": "STOP_MARKET",
-            "stopPrice": round(sl, 1),
-            "workingType": "MARK_PRICE"
-        })
     
     if tp:
         # Double-check TP với giá hiện tại
@@ -235,32 +272,14 @@ def place_order(signal, sl=None, tp=None, leverage=None, trade_amount=None, curr
                 tp = price + min_tp_distance
             elif signal == "sell" and price - tp < min_tp_distance:
                 tp = price - min_tp_distance
-                
-        params_map["takeProfit"] = json.dumps({
-            "type": "TAKE_PROFIT_MARKET",
-            "stopPrice": round(tp, 1),
-            "price": round(tp, 1),
-            "workingType": "MARK_PRICE"
-        })
     
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {
-        'X-BX-APIKEY': BINGX_API_KEY,
-    }
-    response = requests.request(method, url, headers=headers)
-    return response.json()
+    return sl, tp
 
-def is_order_open(order_id):
+def is_order_open(order_id, symbol=SYMBOL):
     path = '/openApi/swap/v2/trade/order'
     method = "GET"
-    params_map = {"symbol": SYMBOL, "orderId": order_id}
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
-    response = requests.request(method, url, headers=headers)
+    params_map = {"symbol": symbol, "orderId": order_id}
+    response = get_client().request(method, path, params_map)
     if response.status_code == 200:
         data = response.json().get("data", {})
         status = data.get("status", "")
@@ -272,11 +291,7 @@ def get_open_orders(symbol=SYMBOL):
     path = '/openApi/swap/v2/trade/openOrders'
     method = "GET"
     params_map = {"symbol": symbol}
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
-    response = requests.request(method, url, headers=headers)
+    response = get_client().request(method, path, params_map)
     if response.status_code == 200:
         data = response.json().get("data", {})
         orders = data.get("orders", [])
@@ -289,11 +304,7 @@ def get_open_positions(symbol=SYMBOL):
     path = '/openApi/swap/v2/user/positions'
     method = "GET"
     params_map = {"symbol": symbol}
-    params_str = parse_param(params_map)
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {"X-BX-APIKEY": BINGX_API_KEY}
-    response = requests.request(method, url, headers=headers)
+    response = get_client().request(method, path, params_map)
     if response.status_code == 200:
         data = response.json().get("data", [])
         # Nếu có vị thế với khối lượng > 0 thì coi là đang mở
@@ -303,40 +314,17 @@ def get_open_positions(symbol=SYMBOL):
     return False
 
 def get_trading_info(symbol=SYMBOL):
-    """Lấy thông tin trading requirements từ BingX"""
-    path = '/openApi/swap/v2/quote/exchangeInfo'
-    method = "GET"
-    params_str = parse_param({})
-    signature = get_sign(BINGX_API_SECRET, params_str)
-    url = f"{BINGX_API_URL}{path}?{params_str}&signature={signature}"
-    headers = {'X-BX-APIKEY': BINGX_API_KEY}
+    """Lấy thông tin trading requirements từ BingX (qua cache exchangeInfo)"""
+    rules = get_symbol_rules(symbol)
+    if not rules:
+        log_event(f"Không có trading info cho {symbol}")
+        return None
     
-    try:
-        response = requests.request(method, url, headers=headers)
-        if response.status_code == 200:
-            data = response.json().get("data", {})
-            symbols = data.get("symbols", [])
-            
-            for sym in symbols:
-                if sym.get("symbol") == symbol:
-                    min_qty = float(sym.get("minQty", 0))
-                    min_notional = float(sym.get("minNotional", 0))
-                    tick_size = float(sym.get("tickSize", 0))
-                    step_size = float(sym.get("stepSize", 0))
-                    
-                    log_event(f"=== TRADING INFO FOR {symbol} ===")
-                    log_event(f"Min Quantity: {min_qty}")
-                    log_event(f"Min Notional: ${min_notional}")
-                    log_event(f"Tick Size: {tick_size}")
-                    log_event(f"Step Size: {step_size}")
-                    log_event(f"================================")
-                    
-                    return {
-                        'min_qty': min_qty,
-                        'min_notional': min_notional,
-                        'tick_size': tick_size,
-                        'step_size': step_size
-                    }
-    except Exception as e:
-        log_event(f"Lỗi khi lấy trading info: {e}")
-        return None
\ No newline at end of file
+    log_event(f"=== TRADING INFO FOR {symbol} ===")
+    log_event(f"Min Quantity: {rules['min_qty']}")
+    log_event(f"Min Notional: ${rules['min_notional']}")
+    log_event(f"Tick Size: {rules['tick_size']}")
+    log_event(f"Step Size: {rules['step_size']}")
+    log_event(f"================================")
+    
+    return dict(rules)
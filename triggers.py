@@ -0,0 +1,93 @@
+"""Đánh thức chu kỳ quyết định theo sự kiện thị trường thay vì ngủ cố định 60s.
+
+- Nến TIMEFRAME đóng: timer canh đúng biên nến (tính theo giờ sàn, đổi sang đồng hồ monotonic mỗi lần
+  lên lịch nên thời gian chạy chu kỳ không cộng dồn thành trôi lịch), hoặc ngay khi stream đẩy nến mới.
+- Giá đi quá k x ATR so với lúc quyết định gần nhất, hoặc volume nến 1m đang chạy vượt m x trung bình.
+"""
+import time
+import threading
+from collections import deque
+from klines import INTERVAL_MS
+from logger import log_event
+from metrics import DECISION_TRIGGERS
+
+def seconds_to_candle_close(interval, grace=0.0, now=None):
+    """Số giây tới lúc nến `interval` hiện tại đóng (+grace để sàn kịp chốt nến)."""
+    step = INTERVAL_MS[interval] / 1000
+    now = time.time() if now is None else now
+    return step - now % step + grace
+
+class DecisionTriggers:
+    """Listener cho MarketStream: gọi wake(symbol) khi nến đóng hoặc có biến động đáng kể.
+
+    atr_mult/volume_mult = 0 để tắt trigger tương ứng; cooldown chặn bão wake khi thị trường giật liên tục
+    (nến đóng luôn được wake, không tính cooldown).
+    """
+
+    def __init__(self, wake, interval="1m", atr_mult=1.0, volume_mult=3.0, cooldown=10.0, volume_window=20):
+        self.wake = wake
+        self.step = INTERVAL_MS[interval]
+        self.atr_mult = atr_mult
+        self.volume_mult = volume_mult
+        self.cooldown = cooldown
+        self.references = {}
+        self.volumes = {}
+        self.forming = {}
+        self.spiked = {}
+        self.last_fired = {}
+        self.closed = {}
+        self.volume_window = volume_window
+        self._lock = threading.Lock()
+
+    def set_reference(self, symbol, price, atr):
+        """Giá/ATR tại lần quyết định gần nhất của symbol (mốc cho trigger giá)."""
+        with self._lock:
+            self.references[symbol] = (price, atr)
+
+    def seconds_to_candle_close(self, symbol, grace=0.0, now=None):
+        """Như seconds_to_candle_close(), nhưng bỏ qua biên nến mà stream đã đẩy nến mới (đã wake):
+        đồng hồ máy lệch sau giờ sàn thì timer không chạy lại chu kỳ lần hai cho cùng một nến."""
+        step = self.step / 1000
+        now = time.time() if now is None else now
+        delay = step - now % step
+        with self._lock:
+            if self.closed.get(symbol, -1) >= round((now + delay) * 1000):
+                delay += step
+        return delay + grace
+
+    def on_candle(self, symbol, candle, new_candle):
+        close = float(candle["close"] or 0)
+        volume = float(candle["volume"] or 0)
+        reason = None
+        with self._lock:
+            volumes = self.volumes.setdefault(symbol, deque(maxlen=self.volume_window))
+            if new_candle:
+                # Nến 1m trước vừa đóng: volume cuối cùng của nó vào cửa sổ trung bình
+                if symbol in self.forming:
+                    volumes.append(self.forming[symbol])
+                self.spiked[symbol] = False
+                if candle["time"] % self.step == 0:
+                    reason = "candle_close"
+                    self.closed[symbol] = int(candle["time"])
+            self.forming[symbol] = volume
+            reference = self.references.get(symbol)
+            if reason is None and self.atr_mult and reference and reference[1] > 0:
+                if abs(close - reference[0]) > self.atr_mult * reference[1]:
+                    reason = "price_move"
+            if (reason is None and self.volume_mult and not self.spiked.get(symbol)
+                    and len(volumes) >= self.volume_window // 2
+                    and volume > self.volume_mult * sum(volumes) / len(volumes)):
+                self.spiked[symbol] = True
+                reason = "volume_spike"
+            if reason is None:
+                return
+            now = time.monotonic()
+            if reason != "candle_close" and now - self.last_fired.get(symbol, float("-inf")) < self.cooldown:
+                return
+            self.last_fired[symbol] = now
+            if reason == "price_move":
+                # Mốc mới để không wake lại cho cùng một cú giật giá
+                self.references[symbol] = (close, reference[1])
+        DECISION_TRIGGERS.inc(reason=reason)
+        log_event(f"Trigger {reason}: đánh thức chu kỳ {symbol}", level="DEBUG")
+        self.wake(symbol)
@@ -0,0 +1,180 @@
+import time
+import threading
+from config import BINGX_WS_URL
+from bingx_client import get_client
+from market_stream import BingXStream
+from logger import log_event
+from state_journal import journal_event
+
+LISTEN_KEY_PATH = "/openApi/user/auth/userDataStream"
+LISTEN_KEY_KEEPALIVE = 30 * 60  # listenKey hết hạn sau 60 phút nếu không gia hạn
+OPEN_STATUSES = ("NEW", "PARTIALLY_FILLED")
+
+class AccountStateStore:
+    """Trạng thái lệnh/vị thế trong bộ nhớ, cập nhật bằng push từ user data stream.
+
+    Listener (vd. scheduler.wake) được gọi với symbol ngay khi lệnh/vị thế của symbol đó đổi.
+    """
+
+    def __init__(self):
+        self.orders = {}
+        self.positions = {}
+        self.wallet_balance = None
+        self.updated_at = 0.0
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, symbol):
+        for callback in self.listeners:
+            try:
+                callback(symbol)
+            except Exception as e:
+                log_event(f"Lỗi listener account store: {e}")
+
+    def seed(self, symbol, has_position, open_order_ids):
+        """Đồng bộ lại qua REST (lúc kết nối/reconnect) để không lỡ sự kiện khi mất kết nối."""
+        open_ids = {str(order_id) for order_id in open_order_ids}
+        with self._lock:
+            self.positions = {key: amount for key, amount in self.positions.items() if key[0] != symbol}
+            if has_position:
+                self.positions[(symbol, "BOTH")] = 1.0
+            for order_id, order in list(self.orders.items()):
+                if order["symbol"] == symbol and order["status"] in OPEN_STATUSES and order_id not in open_ids:
+                    order["status"] = "UNKNOWN"
+            for order_id in open_ids:
+                self.orders[order_id] = {"symbol": symbol, "status": "NEW"}
+            self.updated_at = time.monotonic()
+
+    def track_order(self, order_id, symbol, status="NEW"):
+        """Ghi nhận lệnh vừa đặt trước khi push về (tránh race giữa REST response và WebSocket)."""
+        with self._lock:
+            self.orders.setdefault(str(order_id), {"symbol": symbol, "status": status})
+
+    def apply_order_update(self, order):
+        symbol = order.get("s")
+        with self._lock:
+            self.orders[str(order.get("i"))] = {
+                "symbol": symbol,
+                "status": order.get("X"),
+                "side": order.get("S"),
+                "position_side": order.get("ps"),
+                "avg_price": float(order.get("ap") or 0),
+                "filled": float(order.get("z") or 0),
+                "realized_pnl": float(order.get("rp") or 0),
+            }
+            self.updated_at = time.monotonic()
+        if order.get("X") in ("FILLED", "PARTIALLY_FILLED"):
+            journal_event("fill", symbol, order.get("i"), status=order.get("X"), side=order.get("S"),
+                          position_side=order.get("ps"), avg_price=float(order.get("ap") or 0),
+                          filled=float(order.get("z") or 0), realized_pnl=float(order.get("rp") or 0),
+                          commission=abs(float(order.get("n") or 0)))
+        self._notify(symbol)
+
+    def apply_account_update(self, account):
+        changed = set()
+        with self._lock:
+            for balance in account.get("B", []):
+                if balance.get("a") == "USDT":
+                    self.wallet_balance = float(balance.get("wb") or 0)
+                    journal_event("balance", balance=self.wallet_balance, source="stream")
+            for position in account.get("P", []):
+                key = (position.get("s"), position.get("ps") or "BOTH")
+                amount = float(position.get("pa") or 0)
+                # Push có positionSide thật thì bỏ bản ghi seed "BOTH" của symbol đó
+                self.positions.pop((key[0], "BOTH"), None)
+                if amount:
+                    self.positions[key] = amount
+                else:
+                    self.positions.pop(key, None)
+                changed.add(key[0])
+            self.updated_at = time.monotonic()
+        for symbol in changed:
+            self._notify(symbol)
+
+    def has_position(self, symbol):
+        with self._lock:
+            return any(key[0] == symbol for key in self.positions)
+
+    def has_open_orders(self, symbol):
+        with self._lock:
+            return any(o["symbol"] == symbol and o["status"] in OPEN_STATUSES for o in self.orders.values())
+
+    def order_status(self, order_id):
+        with self._lock:
+            order = self.orders.get(str(order_id))
+            return order["status"] if order else None
+
+class UserDataStream(BingXStream):
+    """Subscriber listen-key WebSocket: đẩy cập nhật lệnh/vị thế vào AccountStateStore."""
+
+    def __init__(self, symbols, store=None, url=BINGX_WS_URL, seed=None):
+        super().__init__(url)
+        self.symbols = list(symbols)
+        self.store = store or AccountStateStore()
+        self.seed = seed
+        self.listen_key = None
+
+    def start(self):
+        threading.Thread(target=self._keepalive_loop, daemon=True).start()
+        return super().start()
+
+    def is_healthy(self):
+        # User stream chỉ push khi có sự kiện, nên không dùng ngưỡng "im lặng quá lâu"
+        return self.connected and self.listen_key is not None
+
+    def connect_url(self):
+        response = get_client().post(LISTEN_KEY_PATH, signed=False)
+        self.listen_key = response.json().get("listenKey")
+        if not self.listen_key:
+            raise Exception(f"Không tạo được listenKey: {response.text}")
+        return f"{self.url}?listenKey={self.listen_key}"
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(LISTEN_KEY_KEEPALIVE):
+            if self.listen_key:
+                try:
+                    get_client().request("PUT", LISTEN_KEY_PATH, {"listenKey": self.listen_key}, signed=False)
+                except Exception as e:
+                    log_event(f"Lỗi gia hạn listenKey: {e}")
+
+    def on_open(self, ws):
+        if self.seed:
+            for symbol in self.symbols:
+                try:
+                    has_position, open_order_ids = self.seed(symbol)
+                    self.store.seed(symbol, has_position, open_order_ids)
+                except Exception as e:
+                    log_event(f"Lỗi đồng bộ trạng thái {symbol} qua REST: {e}")
+        log_event(f"User data stream đã kết nối ({len(self.symbols)} symbol)")
+
+    def on_payload(self, payload):
+        event = payload.get("e")
+        if event == "ORDER_TRADE_UPDATE":
+            self.store.apply_order_update(payload.get("o", {}))
+        elif event == "ACCOUNT_UPDATE":
+            self.store.apply_account_update(payload.get("a", {}))
+        elif event == "listenKeyExpired":
+            log_event("listenKey hết hạn, kết nối lại")
+            self.listen_key = None
+            if self._ws:
+                self._ws.close()
+
+_stream = None
+
+def start_user_stream(symbols, on_change=None, url=BINGX_WS_URL):
+    """Bật user data stream cho watchlist; on_change(symbol) được gọi khi lệnh/vị thế đổi."""
+    global _stream
+    from trade_executor import get_open_positions, get_open_orders
+    _stream = UserDataStream(symbols, url=url, seed=lambda symbol: (get_open_positions(symbol), get_open_orders(symbol)))
+    if on_change:
+        _stream.store.add_listener(on_change)
+    return _stream.start()
+
+def get_account_store():
+    """Store nếu stream đang khỏe, ngược lại None (caller fallback REST polling)."""
+    if _stream and _stream.is_healthy():
+        return _stream.store
+    return None